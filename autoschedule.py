@@ -0,0 +1,180 @@
+"""Fair-rotation auto-scheduler for filling many weeks at once
+
+`plan_schedule()` fills the empty days of a range of weeks from the People
+list. It respects each person's constraints, given as optional People
+columns:
+
+    available_days   days they can do, e.g. "0,2,4" or "ראשון,שלישי" (empty = any day)
+    blackout_dates   dates they can't, e.g. "2026-12-24, 2026-12-28..2027-01-02"
+    max_per_week     most days per week (empty = no limit)
+
+Among the eligible people it picks whoever has done the fewest pickups so
+far, counting both the history and what this plan has already given them,
+and breaks ties by whoever went longest ago. The history comes from a
+`History` read from the persistent pickup statistics (stats.py), which
+every write keeps current, so planning never rescans the sheet.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+# Sunday to Friday, like the schedule grid
+DAY_NAMES = ["ראשון", "שני", "שלישי", "רביעי", "חמישי", "שישי"]
+
+
+# ===========================
+# Constraints
+# ===========================
+
+def slot_date(week_start, day_index):
+    """The YYYY-MM-DD date of a week/day slot"""
+    return (datetime.strptime(week_start, "%Y-%m-%d") + timedelta(days=int(day_index))).strftime("%Y-%m-%d")
+
+
+def parse_days(text):
+    """"0,2,4" or "ראשון,שלישי" -> {0, 2, 4}; None (any day) when empty"""
+    days = set()
+    for part in str(text or '').replace(';', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if part in DAY_NAMES:
+            days.add(DAY_NAMES.index(part))
+        elif part.isdigit() and int(part) < len(DAY_NAMES):
+            days.add(int(part))
+        else:
+            raise ValueError(f"יום לא מוכר: {part}")
+    return days or None
+
+
+def parse_dates(text):
+    """"2026-12-24, 2026-12-28..2027-01-02" -> [(first, last), ...] as YYYY-MM-DD strings"""
+    ranges = []
+    for part in str(text or '').replace(';', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('..')
+        first, last = first.strip(), (last.strip() or first.strip())
+        for value in (first, last):
+            datetime.strptime(value, "%Y-%m-%d")  # raises ValueError on a typo
+        ranges.append((first, last))
+    return ranges
+
+
+class Constraints:
+    """One person's availability, parsed from their People row"""
+
+    def __init__(self, person):
+        self.days = parse_days(person.get('available_days'))
+        self.blackouts = parse_dates(person.get('blackout_dates'))
+        max_per_week = str(person.get('max_per_week') or '').strip()
+        self.max_per_week = int(max_per_week) if max_per_week else None
+
+    def allows(self, day_index, date):
+        if self.days is not None and day_index not in self.days:
+            return False
+        return not any(first <= date <= last for first, last in self.blackouts)
+
+
+# ===========================
+# History
+# ===========================
+
+class History:
+    """How many pickups each person has had and when the last one was - all planning looks at"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._last = {}
+
+    @classmethod
+    def from_assignments(cls, assignments):
+        """Build from (week_start, day_index, person_name) tuples"""
+        history = cls()
+        for week_start, day_index, person_name in assignments:
+            date = slot_date(week_start, day_index)
+            history._counts[person_name] += 1
+            history._last[person_name] = max(history._last.get(person_name, ''), date)
+        return history
+
+    @classmethod
+    def from_summary(cls, people):
+        """Build from `stats.StatsStore.people()` rows, which already hold each person's total and last date"""
+        history = cls()
+        for person in people:
+            history._counts[person['person_name']] = person['total']
+            history._last[person['person_name']] = person['last_date']
+        return history
+
+    def count(self, person_name):
+        return self._counts.get(person_name, 0)
+
+    def last(self, person_name):
+        """Most recent date they were assigned, or '' if never"""
+        return self._last.get(person_name, '')
+
+
+# ===========================
+# Planning
+# ===========================
+
+class Plan:
+    """Proposed assignments for the empty slots of a range, plus the slots nobody could take"""
+
+    def __init__(self):
+        # [{'week_start', 'day_index', 'date', 'person'}] in date order
+        self.proposals = []
+        # [{'week_start', 'day_index', 'date'}]
+        self.unfilled = []
+        # People skipped because their constraint columns didn't parse: {name: error}
+        self.invalid = {}
+
+    def load(self):
+        """Pickups per person in this plan"""
+        return Counter(proposal['person']['name'] for proposal in self.proposals)
+
+
+def plan_schedule(people, schedule, history, week_starts, today=None):
+    """Fill the empty days of `week_starts`
+
+    `schedule` is {week_start: {day_index: assignment}} for at least those
+    weeks. Days before `today` (YYYY-MM-DD) are left alone.
+    """
+    plan = Plan()
+    candidates = []
+    for order, person in enumerate(people):
+        try:
+            candidates.append((order, person, Constraints(person)))
+        except ValueError as e:
+            plan.invalid[person['name']] = str(e)
+
+    # Snapshot the history once; from here on only this plan's own picks change the counts
+    load = {person['name']: history.count(person['name']) for _, person, _ in candidates}
+    last = {person['name']: history.last(person['name']) for _, person, _ in candidates}
+    for week_start in sorted(week_starts):
+        week = schedule.get(week_start, {})
+        this_week = Counter(assignment['person_name'] for assignment in week.values())
+        for day_index in range(len(DAY_NAMES)):
+            date = slot_date(week_start, day_index)
+            if day_index in week or (today and date < today):
+                continue
+
+            best, best_key = None, None
+            for order, person, constraints in candidates:
+                name = person['name']
+                if not constraints.allows(day_index, date):
+                    continue
+                if constraints.max_per_week is not None and this_week[name] >= constraints.max_per_week:
+                    continue
+                key = (load[name], last[name], order)
+                if best_key is None or key < best_key:
+                    best, best_key = person, key
+
+            if best is None:
+                plan.unfilled.append({'week_start': week_start, 'day_index': day_index, 'date': date})
+                continue
+            load[best['name']] += 1
+            last[best['name']] = date
+            this_week[best['name']] += 1
+            plan.proposals.append({'week_start': week_start, 'day_index': day_index, 'date': date, 'person': best})
+    return plan
@@ -0,0 +1,434 @@
+"""Offline benchmark: Sheets/webhook round trips, bytes and wall time per user action
+
+Drives streamlit_app.py headlessly through Streamlit's AppTest against the
+in-memory Sheets fake (storage_backend = "memory") and a local HTTP stand-in
+for the Make.com webhooks, both with injectable latency. For every schedule
+size it measures:
+
+    import       module-level imports of streamlit_app.py in a fresh interpreter
+    first_paint  time from a cold process's first script run until its first element is sent
+    render_cold  first page load with empty caches
+    render_warm  rerun of the same page
+    navigate     "next week" click
+    render_stale rerun once the cached reads are due for a change check
+    assign       pick a person and click "שבץ"
+    clear        admin clicks "❌ בטל"
+    add_person   admin adds a contact
+
+Usage:
+
+    python benchmarks/bench_actions.py
+    python benchmarks/bench_actions.py --sizes 10 1000 100000 --sheets-latency 0.05
+    python benchmarks/bench_actions.py --check benchmarks/baseline.json
+    python benchmarks/bench_actions.py --update-baseline benchmarks/baseline.json
+
+--check exits with status 1 when an action needs more round trips or bytes
+than the baseline allows, or is slower than its wall-time budget. `import`
+and `first_paint` are reported but only gated on round trips and bytes: in
+a fresh interpreter their time depends on the machine's disk cache and on
+whether bytecode is compiled yet far more than on the app.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import fake_sheets  # noqa: E402
+from journal import WriteJournal  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "streamlit_app.py")
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+ACTIONS = ["import", "first_paint", "render_cold", "render_warm", "navigate", "render_stale", "assign", "clear", "add_person"]
+
+# Bytes may grow with the data a little without being a regression; wall time is noisy
+BYTES_TOLERANCE = 1.2
+WALL_TOLERANCE = 2.0
+# Measured in fresh interpreters - their wall time isn't reproducible across machines
+UNTIMED_ACTIONS = {"import", "first_paint"}
+
+# Short enough to wait out once per size, long enough that no other action crosses it
+CHANGE_CHECK_SECONDS = 6
+
+
+# ===========================
+# Webhook stand-in
+# ===========================
+
+class WebhookStandIn:
+    """Local HTTP server that accepts Make.com webhook posts after `latency` seconds
+
+    With `limit`, posts beyond that many per second are turned away with a
+    429, like Make.com does.
+    """
+
+    def __init__(self, latency=0.0, limit=None):
+        self.latency = latency
+        self.limit = limit
+        self.calls = 0
+        self.bytes = 0
+        self.throttled = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not stand_in._admit():
+                    self.send_response(429)
+                    self.end_headers()
+                    return
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                with stand_in._lock:
+                    stand_in.calls += 1
+                    stand_in.bytes += len(body)
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b"Accepted")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _admit(self):
+        """Count a post against the per-second limit; False if it is over"""
+        if self.limit is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] >= 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.limit:
+                self.throttled += 1
+                return False
+            self._recent.append(now)
+            return True
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}/{path}"
+
+    def wait_idle(self, quiet=0.3, timeout=10):
+        """Wait until no new webhook call has arrived for `quiet` seconds"""
+        deadline = time.monotonic() + timeout
+        last = -1
+        while time.monotonic() < deadline:
+            if self.calls == last:
+                return
+            last = self.calls
+            time.sleep(quiet)
+
+    def close(self):
+        self.server.shutdown()
+
+
+# ===========================
+# Fixtures
+# ===========================
+
+def week_start_of(date):
+    """Sunday of the week, as the app computes it"""
+    return (date - timedelta(days=(date.weekday() + 1) % 7)).strftime("%Y-%m-%d")
+
+
+def seeded_spreadsheet(rows, people=20, latency=0.0, indexed=True):
+    """Fake spreadsheet with `rows` schedule rows of history ending before the current week"""
+    spreadsheet = fake_sheets.empty_spreadsheet()
+    people_tab = spreadsheet._worksheets["People"]
+    schedule_tab = spreadsheet._worksheets["Schedule"]
+    index_tab = spreadsheet._worksheets["ScheduleIndex"]
+
+    for i in range(people):
+        people_tab._rows.append([f"Person {i}", f"05{i:08d}", f"person{i}@example.com"])
+
+    current = datetime.strptime(week_start_of(datetime.now()), "%Y-%m-%d")
+    weeks = {}
+    for i in range(rows):
+        week = (current - timedelta(weeks=1 + i // 6)).strftime("%Y-%m-%d")
+        day = i % 6
+        schedule_tab._rows.append([week, str(day), f"Person {i % people}", f"05{i % people:08d}", ""])
+        weeks.setdefault(week, {})[day] = len(schedule_tab._rows)
+
+    if indexed:
+        for week in sorted(weeks):
+            slots = weeks[week]
+            index_tab._rows.append([week, ','.join(f"{day}:{slots[day]}" for day in sorted(slots))])
+    else:
+        del spreadsheet._worksheets["ScheduleIndex"]
+
+    schedule_tab.row_count = max(schedule_tab.row_count, len(schedule_tab._rows))
+    spreadsheet.latency = latency
+    return spreadsheet
+
+
+def wait_for_background(journal_path=None, timeout=10):
+    """Let prefetch threads and the journal syncer finish, so their calls are charged to the action that started them"""
+    for thread in threading.enumerate():
+        if thread.name in ("schedule-prefetch", "warm-up"):
+            thread.join(timeout)
+    if journal_path and os.path.exists(journal_path):
+        journal = WriteJournal(journal_path)
+        deadline = time.monotonic() + timeout
+        while journal.stats()['pending'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+# ===========================
+# Cold start
+# ===========================
+
+# Run in a fresh interpreter: Streamlit is loaded by the server before any script runs, so it isn't counted
+IMPORT_PROBE = """
+import ast, json, sys, time
+import streamlit
+sys.path.insert(0, {root!r})
+with open({path!r}, encoding="utf-8") as f:
+    tree = ast.parse(f.read())
+imports = ast.Module([node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))], [])
+code = compile(imports, {path!r}, "exec")
+started = time.perf_counter()
+exec(code, {{}})
+print(json.dumps({{"wall_ms": round((time.perf_counter() - started) * 1000, 1)}}))
+"""
+
+
+def watch_first_element():
+    """Note when the first element of a script run is sent to the browser; returns the dict it fills in"""
+    from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+    sent = {}
+    enqueue = ForwardMsgQueue.enqueue
+
+    def watched(queue, msg):
+        if not sent and msg.WhichOneof("type") == "delta":
+            sent["at"] = time.perf_counter()
+        return enqueue(queue, msg)
+
+    ForwardMsgQueue.enqueue = watched
+    return sent
+
+
+def cold_start(rows, args):
+    """Measure `import` and `first_paint` in fresh interpreters, where nothing is imported or connected yet"""
+    results = {}
+    probe = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(root=ROOT, path=APP_PATH)],
+                           capture_output=True, text=True, check=True, cwd=ROOT)
+    results["import"] = dict(sheets_calls=0, sheets_bytes=0, webhook_calls=0, webhook_bytes=0,
+                             **json.loads(probe.stdout.splitlines()[-1]))
+    child = subprocess.run([sys.executable, os.path.abspath(__file__), "--first-paint", "--sizes", str(rows),
+                            "--sheets-latency", str(args.sheets_latency)] + (["--no-index"] if args.no_index else []),
+                           capture_output=True, text=True, check=True, cwd=ROOT)
+    results["first_paint"] = json.loads(child.stdout.splitlines()[-1])
+    return results
+
+
+def first_paint(args):
+    """Child process of cold_start(): one cold page load, timed to its first element"""
+    logging.disable(logging.WARNING)
+    sent = watch_first_element()
+    webhooks = WebhookStandIn()
+    with tempfile.TemporaryDirectory() as workdir:
+        scenario = Scenario(args.sizes[0], args, webhooks, workdir)
+        started = time.perf_counter()
+        scenario.app.run()
+        paint = sent.get("at", time.perf_counter()) - started
+        # Calls the warm-up started before the first element are charged to the first paint
+        wait_for_background(scenario.journal_path)
+    webhooks.close()
+    print(json.dumps({"sheets_calls": scenario.spreadsheet.api_calls,
+                      "sheets_bytes": scenario.spreadsheet.bytes_transferred,
+                      "webhook_calls": 0, "webhook_bytes": 0, "wall_ms": round(paint * 1000, 1)}))
+    return 0
+
+
+# ===========================
+# Runner
+# ===========================
+
+class Scenario:
+    """One schedule size: a fresh fake spreadsheet, fresh caches and one AppTest session"""
+
+    def __init__(self, rows, args, webhooks, workdir):
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        self.spreadsheet = seeded_spreadsheet(rows, latency=args.sheets_latency, indexed=not args.no_index)
+        fake_sheets.set_shared_spreadsheet(self.spreadsheet)
+        self.webhooks = webhooks
+        self.results = {}
+
+        self.app = AppTest.from_file(APP_PATH, default_timeout=120)
+        self.app.secrets["storage_backend"] = "memory"
+        self.app.secrets["make_webhook_url"] = webhooks.url("admin")
+        self.app.secrets["make_webhook_url_person"] = webhooks.url("person")
+        self.app.secrets["outbox_path"] = os.path.join(workdir, f"outbox-{rows}.sqlite3")
+        self.journal_path = os.path.join(workdir, f"journal-{rows}.sqlite3")
+        self.app.secrets["write_journal_path"] = self.journal_path
+        self.app.secrets["stats_path"] = os.path.join(workdir, f"stats-{rows}.sqlite3")
+        self.app.secrets["admin_password"] = "bench"
+        self.app.secrets["change_check_seconds"] = CHANGE_CHECK_SECONDS
+        self.week = week_start_of(datetime.now())
+
+    def measure(self, action, step):
+        """Run `step()` and record the round trips, bytes and wall time it caused"""
+        calls, sent = self.spreadsheet.api_calls, self.spreadsheet.bytes_transferred
+        hooks, hook_bytes = self.webhooks.calls, self.webhooks.bytes
+        started = time.perf_counter()
+        step()
+        wall = time.perf_counter() - started
+        wait_for_background(self.journal_path)
+        self.webhooks.wait_idle(quiet=0.2 + self.webhooks.latency)
+        if self.app.exception:
+            raise RuntimeError(f"{action} raised: {self.app.exception[0].message}")
+        self.results[action] = {
+            "sheets_calls": self.spreadsheet.api_calls - calls,
+            "sheets_bytes": self.spreadsheet.bytes_transferred - sent,
+            "webhook_calls": self.webhooks.calls - hooks,
+            "webhook_bytes": self.webhooks.bytes - hook_bytes,
+            "wall_ms": round(wall * 1000, 1),
+        }
+
+    def run(self):
+        app = self.app
+        self.measure("render_cold", app.run)
+        self.measure("render_warm", app.run)
+
+        def navigate():
+            next(b for b in app.button if b.label == "שבוע הבא ▶️").click().run()
+        self.measure("navigate", navigate)
+        next(b for b in app.button if b.label == "◀️ שבוע קודם").click().run()
+
+        # Nothing changed in the sheet, so this should cost one metadata request and no re-reads
+        time.sleep(CHANGE_CHECK_SECONDS + 0.1)
+        self.measure("render_stale", app.run)
+
+        def assign():
+            app.selectbox(key=f"select_0_{self.week}").set_value("Person 0").run()
+            app.button(key=f"assign_0_{self.week}").click().run()
+        self.measure("assign", assign)
+
+        app.session_state["admin_authenticated"] = True
+        app.run()
+
+        def clear():
+            app.button(key=f"clear_0_{self.week}").click().run()
+        self.measure("clear", clear)
+
+        app.sidebar.radio[0].set_value("⚙️ הגדרות מנהל").run()
+
+        def add_person():
+            app.text_input[0].input("New Person")
+            app.text_input[1].input("0501234567")
+            next(b for b in app.button if b.label == "הוסף").click().run()
+        self.measure("add_person", add_person)
+        return self.results
+
+
+def run_benchmarks(args):
+    logging.disable(logging.WARNING)
+    webhooks = WebhookStandIn(latency=args.webhook_latency)
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for rows in args.sizes:
+                results[str(rows)] = cold_start(rows, args)
+                results[str(rows)].update(Scenario(rows, args, webhooks, workdir).run())
+    finally:
+        webhooks.close()
+    return results
+
+
+# ===========================
+# Reporting
+# ===========================
+
+def print_report(results):
+    header = f"{'rows':>8}  {'action':<12}{'sheets':>8}{'bytes':>12}{'hooks':>7}{'wall ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for rows, actions in results.items():
+        for action in ACTIONS:
+            r = actions[action]
+            print(f"{rows:>8}  {action:<12}{r['sheets_calls']:>8}{r['sheets_bytes']:>12}"
+                  f"{r['webhook_calls']:>7}{r['wall_ms']:>10}")
+
+
+def check_regressions(results, baseline):
+    """Compare against a baseline file; returns a list of human-readable failures"""
+    failures = []
+    for rows, actions in results.items():
+        for action, measured in actions.items():
+            allowed = baseline.get(rows, {}).get(action)
+            if not allowed:
+                continue
+            if measured["sheets_calls"] > allowed["sheets_calls"]:
+                failures.append(f"{rows} rows / {action}: {measured['sheets_calls']} Sheets calls "
+                                f"(baseline {allowed['sheets_calls']})")
+            if measured["webhook_calls"] > allowed["webhook_calls"]:
+                failures.append(f"{rows} rows / {action}: {measured['webhook_calls']} webhook calls "
+                                f"(baseline {allowed['webhook_calls']})")
+            if measured["sheets_bytes"] > allowed["sheets_bytes"] * BYTES_TOLERANCE + 1024:
+                failures.append(f"{rows} rows / {action}: {measured['sheets_bytes']} bytes "
+                                f"(baseline {allowed['sheets_bytes']})")
+            if action not in UNTIMED_ACTIONS and measured["wall_ms"] > allowed["wall_ms"] * WALL_TOLERANCE + 50:
+                failures.append(f"{rows} rows / {action}: {measured['wall_ms']} ms "
+                                f"(baseline {allowed['wall_ms']})")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="schedule sizes (rows of history) to run")
+    parser.add_argument("--sheets-latency", type=float, default=0.0,
+                        help="seconds added to every simulated Sheets round trip")
+    parser.add_argument("--webhook-latency", type=float, default=0.0,
+                        help="seconds the webhook stand-in waits before answering")
+    parser.add_argument("--no-index", action="store_true",
+                        help="benchmark a sheet without the ScheduleIndex tab")
+    parser.add_argument("--json", help="write the raw results to this file")
+    parser.add_argument("--check", metavar="BASELINE", help="fail if results regress against this file")
+    parser.add_argument("--update-baseline", metavar="BASELINE", help="write the results as the new baseline")
+    parser.add_argument("--first-paint", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.first_paint:
+        return first_paint(args)
+
+    results = run_benchmarks(args)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.update_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if args.check:
+        with open(args.check) as f:
+            failures = check_regressions(results, json.load(f))
+        if failures:
+            print("\nRegressions:")
+            for failure in failures:
+                print(f"  {failure}")
+            return 1
+        print("\nNo regressions against", args.check)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
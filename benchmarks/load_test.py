@@ -0,0 +1,769 @@
+"""Load test: many concurrent sessions against local HTTP stand-ins for the Sheets API and Make.com
+
+Simulates the Sunday-evening rush: N users open the app at about the same
+time and keep browsing weeks, assigning themselves free days and (the
+admins among them) clearing days, with random think time in between. Each
+user is a Streamlit session driven through AppTest on its own thread, all
+in one process, so they share the app's caches, journal, outbox and
+request scheduler the way sessions of one deployment do.
+
+The app runs on the "memory" backend, but its spreadsheet is a client for
+`SheetsStandIn`, a local HTTP server holding the data: every call is a real
+HTTP round trip with log-normally distributed latency, and the server
+answers 429 once the per-minute read or write quota is used up, like the
+Sheets API. Make.com webhooks go to the same stand-in as the benchmark's,
+limited to `--webhook-limit` posts a second.
+
+The stand-in speaks a JSON protocol of its own rather than the Sheets REST
+API, and `RemoteSpreadsheet` raises requests' HTTPError for its 429s. So
+the request scheduler's backoff on a 429 is exercised, but gspread's HTTP
+client and its APIError handling of one are not.
+
+It reports throughput and latency percentiles per action, the 429 and
+error rates seen by both stand-ins, and once the journal and outbox have
+drained, whether the final sheet has any double-booked day or lost write
+(a day whose last acknowledged assignment or clearing isn't what the sheet
+ended up with).
+
+`--scenario races` runs a fixed script of the races that random traffic
+may or may not hit, instead of the timed mix:
+
+    first bookings  six sessions book the six days of an empty week at once
+    same day        four sessions book one day at once - one of them gets it
+    stale cache     a session books a day its cached week shows free, after
+                    another process took it straight in the sheet - refused
+
+Usage:
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --users 50 --duration 120 --think 2
+    python benchmarks/load_test.py --users 30 --read-quota 300 --write-quota 300 --json load.json
+    python benchmarks/load_test.py --scenario races
+
+Exits with status 1 if any day was double-booked, any write was lost or
+rejected on sync, or (races) any session's write didn't end as expected.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import fake_sheets  # noqa: E402
+from bench_actions import APP_PATH, WebhookStandIn, seeded_spreadsheet  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from journal import CLEAR, SAVE, WriteJournal  # noqa: E402
+from outbox import Outbox  # noqa: E402
+from storage import READ_METHODS, SheetsConnection, SheetsStorage  # noqa: E402
+
+ACTIONS = ["open", "browse", "assign", "clear"]
+DEFAULT_MIX = {"browse": 70, "assign": 20, "clear": 10}
+
+# Metadata reads are charged to the read quota too; Drive's modifiedTime isn't a Sheets call at all
+QUOTA_READS = READ_METHODS | {'worksheet', 'worksheets'}
+UNMETERED = {'get_lastUpdateTime'}
+
+
+# ===========================
+# Sheets stand-in
+# ===========================
+
+def _worksheet_meta(worksheet):
+    return {'title': worksheet.title, 'row_count': worksheet.row_count, 'col_count': worksheet.col_count}
+
+
+class SheetsStandIn:
+    """Local HTTP server exposing a fake_sheets spreadsheet with Sheets-like quotas and latency
+
+    Clients post {"tab", "method", "args", "kwargs"} and get {"result"}
+    back; `RemoteSpreadsheet` wraps that in the gspread API subset the app
+    uses. Reads and writes each have a quota per rolling minute; requests
+    over it are answered with a 429 right away, the others after a
+    log-normal delay with the given median.
+    """
+
+    def __init__(self, spreadsheet, read_quota=60, write_quota=60, read_latency=0.2, write_latency=0.4,
+                 sigma=0.5):
+        self.spreadsheet = spreadsheet
+        self.quotas = {'read': read_quota, 'write': write_quota}
+        self.latencies = {'read': read_latency, 'write': write_latency, None: read_latency}
+        self.sigma = sigma
+        self.requests = Counter()
+        self.throttled = Counter()
+        self.errors = 0
+        self._recent = {'read': deque(), 'write': deque()}
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                status, body = stand_in.handle(request)
+                payload = json.dumps(body, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/call"
+
+    def _kind(self, method):
+        if method in UNMETERED:
+            return None
+        return 'read' if method in QUOTA_READS else 'write'
+
+    def _admit(self, kind):
+        """Count a request against its quota; False if the last minute's quota is used up"""
+        with self._lock:
+            # Drive metadata requests are counted, but don't use up Sheets quota
+            self.requests[kind or 'drive'] += 1
+            if kind is None:
+                return True
+            recent, now = self._recent[kind], time.monotonic()
+            while recent and now - recent[0] >= 60:
+                recent.popleft()
+            if len(recent) >= self.quotas[kind]:
+                self.throttled[kind] += 1
+                return False
+            recent.append(now)
+            return True
+
+    def handle(self, request):
+        """(status, body) for one call"""
+        method = request['method']
+        kind = self._kind(method)
+        if method.startswith('_'):
+            return 400, {'error': {'code': 400, 'message': f"unknown method {method}"}}
+        if not self._admit(kind):
+            return 429, {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED',
+                                   'message': f"Quota exceeded for {kind} requests per minute per user"}}
+        time.sleep(random.lognormvariate(math.log(self.latencies[kind]), self.sigma))
+
+        tab, args, kwargs = request.get('tab'), request.get('args', []), request.get('kwargs', {})
+        try:
+            if tab is None:
+                target = self.spreadsheet
+                if method == 'del_worksheet':
+                    args = [self.spreadsheet._worksheets[args[0]]]
+            else:
+                target = self.spreadsheet._worksheets[tab]
+            result = getattr(target, method)(*args, **kwargs)
+        except KeyError as e:
+            return 404, {'error': {'code': 404, 'message': f"no worksheet {e}"}}
+        except Exception as e:
+            if type(e).__name__ == 'WorksheetNotFound':
+                return 404, {'error': {'code': 404, 'message': f"no worksheet {e}"}}
+            with self._lock:
+                self.errors += 1
+            return 500, {'error': {'code': 500, 'message': str(e)}}
+
+        if isinstance(result, fake_sheets.FakeWorksheet):
+            result = _worksheet_meta(result)
+        elif method == 'worksheets':
+            result = [_worksheet_meta(worksheet) for worksheet in result]
+        return 200, {'result': result}
+
+    def close(self):
+        self.server.shutdown()
+
+
+class RemoteWorksheet:
+    """A tab of the stand-in; any worksheet method becomes one HTTP call"""
+
+    def __init__(self, spreadsheet, meta):
+        self.spreadsheet = spreadsheet
+        self.title = meta['title']
+        self.row_count = meta['row_count']
+        self.col_count = meta['col_count']
+
+    def resize(self, rows=None, cols=None):
+        result = self.spreadsheet._call(self.title, 'resize', rows=rows, cols=cols)
+        self.row_count = rows if rows is not None else self.row_count
+        self.col_count = cols if cols is not None else self.col_count
+        return result
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self.spreadsheet._call(self.title, method, *args, **kwargs)
+
+
+class RemoteSpreadsheet:
+    """Client for `SheetsStandIn`, raising what gspread would: WorksheetNotFound, or an error carrying
+    the HTTP response (the request scheduler backs off on its 429s)"""
+
+    def __init__(self, url):
+        self.url = url
+        self.id = "stand-in"
+        self.title = "Stand-in"
+        self._session = requests.Session()
+
+    def _call(self, tab, method, *args, **kwargs):
+        response = self._session.post(self.url, json={'tab': tab, 'method': method, 'args': args, 'kwargs': kwargs},
+                                      timeout=60)
+        if response.status_code == 404:
+            import gspread
+            raise gspread.exceptions.WorksheetNotFound(tab or (args[0] if args else ''))
+        response.raise_for_status()
+        return response.json()['result']
+
+    def worksheet(self, title):
+        return RemoteWorksheet(self, self._call(None, 'worksheet', title))
+
+    def worksheets(self):
+        return [RemoteWorksheet(self, meta) for meta in self._call(None, 'worksheets')]
+
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        return RemoteWorksheet(self, self._call(None, 'add_worksheet', title, rows=rows, cols=cols))
+
+    def del_worksheet(self, worksheet):
+        return self._call(None, 'del_worksheet', worksheet.title)
+
+    def get_lastUpdateTime(self):
+        return self._call(None, 'get_lastUpdateTime')
+
+
+# ===========================
+# Simulated users
+# ===========================
+
+class Results:
+    """Latencies and outcomes of every action"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)  # action -> [seconds]
+        self.outcomes = defaultdict(Counter)  # action -> {ok / conflict / skipped / error: count}
+        self.errors = Counter()  # message -> count
+        self._lock = threading.Lock()
+
+    def record(self, action, seconds, outcome, error=None):
+        with self._lock:
+            # Skipped actions (nothing to assign or clear) did nothing worth timing
+            if outcome != "skipped":
+                self.latencies[action].append(seconds)
+            self.outcomes[action][outcome] += 1
+            if error:
+                self.errors[error] += 1
+
+
+def share_app_test_globals(secrets):
+    """Let AppTest sessions run side by side
+
+    AppTest is written for one session at a time: every run installs its own
+    st.secrets, mock Runtime and test config and takes them down again when
+    it ends, which pulls them out from under the other sessions' runs, and
+    compiles the script afresh (which isn't thread-safe on every Python).
+    Here the secrets and config are installed once for everyone, the first
+    run's Runtime is kept and the compiled script is shared, as a Streamlit
+    server does.
+    """
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import app_test, local_script_runner
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    class KeepFirstRuntime(type(Runtime)):
+        def __setattr__(cls, name, value):
+            if name != '_instance':
+                super().__setattr__(name, value)
+            elif value is not None and Runtime._instance is None:
+                Runtime._instance = value
+
+    app_test.Runtime = KeepFirstRuntime("SharedRuntime", (Runtime,), {})
+    script_cache = ScriptCache()
+    script_cache.get_bytecode(APP_PATH)
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    st.secrets = Secrets()
+    st.secrets._secrets = dict(secrets)
+    config.get_option = build_mock_config_get_option({"global.appTest": True})
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+
+
+class SimulatedUser:
+    """One browser session: opens the app, then acts and thinks until the deadline"""
+
+    def __init__(self, number, person, admin, journal_path, args, results):
+        self.number = number
+        self.person = person
+        self.admin = admin
+        self.args = args
+        self.results = results
+        self.journal_path = journal_path
+        self.random = random.Random(args.seed + number)
+        self.mix = dict(args.mix)
+        if not admin:
+            # Only admins see the clear button
+            self.mix['browse'] = self.mix.get('browse', 0) + self.mix.pop('clear', 0)
+        # Secrets are shared by all sessions (see share_app_test_globals)
+        self.app = AppTest.from_file(APP_PATH, default_timeout=120)
+        self.offset = 0
+
+    def run(self, deadline):
+        if self.admin:
+            self.app.session_state["admin_authenticated"] = True
+        self.act("open", self.open)
+        while time.monotonic() < deadline:
+            time.sleep(self.random.expovariate(1 / self.args.think) if self.args.think else 0)
+            action = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            self.act(action, getattr(self, action))
+
+    def act(self, action, step):
+        """Time one action, record how it went and return the outcome"""
+        started = time.perf_counter()
+        try:
+            outcome = step() or "ok"
+            error = "write not saved" if outcome == "error" else None
+            if self.app.exception:
+                outcome, error = "error", self.app.exception[0].message
+            elif self.app.error:
+                outcome, error = "error", self.app.error[0].value
+        except Exception as e:
+            outcome, error = "error", f"{type(e).__name__}: {e}"
+        self.results.record(action, time.perf_counter() - started, outcome, error)
+        return outcome
+
+    def open(self):
+        self.app.run()
+
+    def browse(self):
+        """Redraw, or move a week forward or back within the next `--weeks` weeks"""
+        if self.random.random() < 0.3:
+            self.app.run()
+        elif self.offset == 0 or (self.offset < self.args.weeks - 1 and self.random.random() < 0.5):
+            next(b for b in self.app.button if b.label == "שבוע הבא ▶️").click().run()
+            self.offset += 1
+        else:
+            next(b for b in self.app.button if b.label == "◀️ שבוע קודם").click().run()
+            self.offset -= 1
+
+    def assign(self):
+        """Take a day that looks free"""
+        free = [box.key for box in self.app.selectbox if box.key and box.key.startswith("select_")]
+        if not free:
+            return "skipped"
+        _, day, week = self.random.choice(free).split("_")
+        self.app.selectbox(key=f"select_{day}_{week}").set_value(self.person).run()
+        if not any(button.key == f"assign_{day}_{week}" for button in self.app.button):
+            # Someone took the day while we were choosing
+            return "conflict"
+        clicked = time.time()
+        self.app.button(key=f"assign_{day}_{week}").click().run()
+        return self._outcome(SAVE, week, day, self.person, clicked)
+
+    def clear(self):
+        """Admin clears an assigned day"""
+        taken = [button.key for button in self.app.button if button.key and button.key.startswith("clear_")]
+        if not taken:
+            return "skipped"
+        key = self.random.choice(taken)
+        _, day, week = key.split("_")
+        clicked = time.time()
+        self.app.button(key=key).click().run()
+        return self._outcome(CLEAR, week, day, "", clicked)
+
+    def _outcome(self, op, week, day, person_name, since):
+        """How a write went - acknowledged if the app put it in the journal (its confirmation is gone with
+        the redraw that follows), else the day changed under us: a warning, or no button left to click"""
+        with sqlite3.connect(self.journal_path, timeout=30) as db:
+            journaled = db.execute("SELECT 1 FROM entries WHERE op = ? AND week_start = ? AND day_index = ? "
+                                   "AND person_name = ? AND created_at >= ?",
+                                   (op, week, int(day), person_name, since)).fetchone()
+        if journaled:
+            return "ok"
+        if self.app.error or self.app.exception:
+            return None
+        return "conflict"
+
+
+# ===========================
+# Consistency
+# ===========================
+
+def wait_for_drain(journal_path, outbox_path, timeout):
+    """Wait for the journal to replay and the outbox to deliver everything; returns the seconds it took"""
+    started = time.monotonic()
+    journal, outbox = WriteJournal(journal_path), Outbox(outbox_path)
+    while time.monotonic() - started < timeout:
+        outbox_counts = outbox.stats()
+        if not journal.stats()['pending'] and not outbox_counts['pending'] + outbox_counts['sending']:
+            break
+        time.sleep(0.2)
+    return time.monotonic() - started
+
+
+def acknowledged_writes(journal_path):
+    """[(op, week_start, day_index, person_name, status)] of every write a user was told had been saved, in order"""
+    with sqlite3.connect(journal_path, timeout=30) as db:
+        return db.execute("SELECT op, week_start, day_index, person_name, status FROM entries ORDER BY id").fetchall()
+
+
+def check_consistency(spreadsheet, acknowledged):
+    """(double-booked days, lost writes) in the stand-in's final Schedule tab
+
+    A write is lost when it is the last one acknowledged for its day and the
+    sheet doesn't show it - rejected on replay or overwritten by mistake.
+    """
+    rows = spreadsheet._worksheets["Schedule"]._rows[1:]
+    holders = defaultdict(list)
+    for row in rows:
+        if len(row) > 2 and row[0] and row[2]:
+            holders[(row[0], int(row[1]))].append(row[2])
+    double_booked = {slot: names for slot, names in holders.items() if len(names) > 1}
+
+    expected = {}
+    for op, week_start, day_index, person_name, _ in acknowledged:
+        expected[(week_start, day_index)] = person_name if op == SAVE else None
+    lost = {slot: (person_name, holders.get(slot))
+            for slot, person_name in expected.items()
+            if (holders.get(slot) or [None])[-1] != person_name}
+    return double_booked, lost
+
+
+# ===========================
+# Runner
+# ===========================
+
+def start_stand_ins(args, workdir, people, **settings):
+    """Seed the sheet, start both stand-ins and point the app at them (with extra `settings` secrets);
+    returns (spreadsheet, sheets, webhooks, journal_path, outbox_path)"""
+    spreadsheet = seeded_spreadsheet(args.rows, people=people)
+    sheets = SheetsStandIn(spreadsheet, read_quota=args.read_quota, write_quota=args.write_quota,
+                           read_latency=args.read_latency, write_latency=args.write_latency, sigma=args.latency_sigma)
+    webhooks = WebhookStandIn(latency=args.webhook_latency, limit=args.webhook_limit)
+    fake_sheets.set_shared_spreadsheet(RemoteSpreadsheet(sheets.url))
+
+    journal_path = os.path.join(workdir, "journal.sqlite3")
+    outbox_path = os.path.join(workdir, "outbox.sqlite3")
+    secrets = {
+        "storage_backend": "memory",
+        "make_webhook_url": webhooks.url("admin"),
+        "make_webhook_url_person": webhooks.url("person"),
+        "outbox_path": outbox_path,
+        "write_journal_path": journal_path,
+        "stats_path": os.path.join(workdir, "stats.sqlite3"),
+        "admin_password": "load",
+        "sheets_reads_per_minute": args.read_quota,
+        "sheets_writes_per_minute": args.write_quota,
+        **settings,
+    }
+    share_app_test_globals(secrets)
+    return spreadsheet, sheets, webhooks, journal_path, outbox_path
+
+
+def run_load_test(args, workdir):
+    spreadsheet, sheets, webhooks, journal_path, outbox_path = start_stand_ins(args, workdir,
+                                                                               people=max(args.users, 20))
+    results = Results()
+    admins = max(1, round(args.users * args.admins)) if args.mix.get('clear') else 0
+    users = [SimulatedUser(number, f"Person {number}", number < admins, journal_path, args, results)
+             for number in range(args.users)]
+
+    started = time.monotonic()
+    deadline = started + args.ramp + args.duration
+    threads = []
+    for user in users:
+        thread = threading.Thread(target=user.run, args=(deadline,), name=f"load-user-{user.number}", daemon=True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(args.ramp / args.users)
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    drain_seconds = wait_for_drain(journal_path, outbox_path, args.drain_timeout)
+    journal = WriteJournal(journal_path).stats()
+    outbox = Outbox(outbox_path).stats()
+    acknowledged = acknowledged_writes(journal_path)
+    double_booked, lost = check_consistency(spreadsheet, acknowledged)
+    sheets.close()
+    webhooks.close()
+    return build_report(args, results, elapsed, sheets, webhooks, journal, outbox, drain_seconds,
+                        acknowledged, double_booked, lost)
+
+
+# ===========================
+# Races
+# ===========================
+
+def _pick_day(user, offset, day):
+    """Open the app `offset` weeks ahead and choose the session's person for `day`; returns the week"""
+    def next_week():
+        next(b for b in user.app.button if b.label == "שבוע הבא ▶️").click().run()
+
+    user.act("open", user.open)
+    for _ in range(offset):
+        user.act("browse", next_week)
+    box = next(box for box in user.app.selectbox if box.key and box.key.startswith(f"select_{day}_"))
+    box.set_value(user.person).run()
+    return box.key.split("_")[2]
+
+
+def _assign_together(users, week, days):
+    """Every session clicks "שבץ" on its day of `week` at the same moment; returns their outcomes"""
+    barrier = threading.Barrier(len(users))
+    outcomes = [None] * len(users)
+
+    def click(number):
+        user, day = users[number], days[number]
+        barrier.wait()
+        since = time.time()
+
+        def assign():
+            user.app.button(key=f"assign_{day}_{week}").click().run()
+            return user._outcome(SAVE, week, day, user.person, since)
+        outcomes[number] = user.act("assign", assign)
+
+    threads = [threading.Thread(target=click, args=(number,)) for number in range(len(users))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def run_races(args, workdir):
+    """The fixed race scenario (see the module docstring); returns its report"""
+    # No change checks, so a session's cached week stays as stale as it was when it was drawn
+    spreadsheet, sheets, webhooks, journal_path, outbox_path = start_stand_ins(args, workdir, people=20,
+                                                                               change_check_seconds=0)
+    results = Results()
+    numbers = iter(range(20))
+    phases = []
+
+    def sessions(count):
+        return [SimulatedUser(number, f"Person {number}", False, journal_path, args, results)
+                for number in (next(numbers) for _ in range(count))]
+
+    def another_process():
+        return SheetsStorage(SheetsConnection(lambda: (None, RemoteSpreadsheet(sheets.url))), TTLCache())
+
+    users = sessions(6)
+    first_week = [_pick_day(user, 0, day) for day, user in enumerate(users)][0]
+    outcomes = _assign_together(users, first_week, list(range(6)))
+    phases.append(("first bookings", first_week, ["ok"] * 6, outcomes))
+
+    users = sessions(4)
+    week = [_pick_day(user, 1, 0) for user in users][0]
+    outcomes = _assign_together(users, week, [0] * 4)
+    phases.append(("same day", week, ["conflict"] * 3 + ["ok"], sorted(outcomes)))
+
+    user, = sessions(1)
+    week = _pick_day(user, 2, 0)
+    another_process().save_assignment(week, 0, "Person 19", "0500000019", expected_version=0)
+    outcome, = _assign_together([user], week, [0])
+    # Refused by the check against the sheet, not by a button that was gone
+    phases.append(("stale cache", week, ["conflict"], [outcome if user.app.warning else "no warning"]))
+
+    drain_seconds = wait_for_drain(journal_path, outbox_path, args.drain_timeout)
+    journal = WriteJournal(journal_path).stats()
+    double_booked, lost = check_consistency(spreadsheet, acknowledged_writes(journal_path))
+    index_rows = Counter(row[0] for row in spreadsheet._worksheets["ScheduleIndex"]._rows[1:] if row and row[0])
+    seen = sorted(another_process().load_schedule(first_week))
+    sheets.close()
+    webhooks.close()
+
+    failures = [f"{name} ({week}): expected {expected}, got {outcomes}"
+                for name, week, expected, outcomes in phases if outcomes != expected]
+    failures += [f"{week} day {day} double-booked: {', '.join(names)}" for (week, day), names in double_booked.items()]
+    failures += [f"{week} day {day} lost: expected {expected or 'empty'}, sheet has {found or 'empty'}"
+                 for (week, day), (expected, found) in lost.items()]
+    if journal['rejected']:
+        failures.append(f"{journal['rejected']} acknowledged writes rejected on sync")
+    if journal['pending']:
+        failures.append(f"{journal['pending']} writes still pending after {drain_seconds:.1f} s")
+    failures += [f"{week} is on {index_rows[week]} ScheduleIndex rows"
+                 for _, week, _, _ in phases if index_rows[week] > 1]
+    if seen != list(range(6)):
+        failures.append(f"another process sees days {seen} of {first_week}")
+    return {
+        "scenario": "races",
+        "phases": [{"name": name, "week": week, "expected": expected, "outcomes": outcomes}
+                   for name, week, expected, outcomes in phases],
+        "sheets": {"requests": dict(sheets.requests), "throttled": dict(sheets.throttled), "errors": sheets.errors},
+        "rejected_on_sync": journal['rejected'],
+        "drain_seconds": round(drain_seconds, 1),
+        "failures": failures,
+    }
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def build_report(args, results, elapsed, sheets, webhooks, journal, outbox, drain_seconds,
+                 acknowledged, double_booked, lost):
+    actions = {}
+    for action in ACTIONS:
+        if action not in results.outcomes:
+            continue
+        latencies = results.latencies.get(action) or [0.0]
+        actions[action] = dict(results.outcomes[action], count=sum(results.outcomes[action].values()), **{
+            f"p{int(fraction * 100)}_ms": round(_percentile(latencies, fraction) * 1000, 1)
+            for fraction in (0.5, 0.95, 0.99)
+        }, max_ms=round(max(latencies) * 1000, 1))
+    total = sum(action["count"] for action in actions.values())
+    sheets_requests = sum(sheets.requests.values())
+    webhook_posts = webhooks.calls + webhooks.throttled
+    return {
+        "users": args.users,
+        "seconds": round(elapsed, 1),
+        "actions": total,
+        "actions_per_second": round(total / elapsed, 2),
+        "errors": sum(outcomes['error'] for outcomes in results.outcomes.values()),
+        "by_action": actions,
+        "error_messages": dict(results.errors.most_common(10)),
+        "sheets": {
+            "requests": dict(sheets.requests, total=sheets_requests),
+            "throttled": dict(sheets.throttled, total=sum(sheets.throttled.values())),
+            "throttled_rate": round(sum(sheets.throttled.values()) / sheets_requests, 4) if sheets_requests else 0.0,
+            "errors": sheets.errors,
+        },
+        "webhooks": {
+            "delivered": webhooks.calls,
+            "throttled": webhooks.throttled,
+            "throttled_rate": round(webhooks.throttled / webhook_posts, 4) if webhook_posts else 0.0,
+            "outbox": outbox,
+        },
+        "consistency": {
+            "acknowledged_writes": len(acknowledged),
+            "double_booked": len(double_booked),
+            "lost_writes": len(lost),
+            "rejected_on_sync": journal['rejected'],
+            "still_pending": journal['pending'],
+            "drain_seconds": round(drain_seconds, 1),
+            "examples": {
+                "double_booked": [f"{week} day {day}: {', '.join(names)}"
+                                  for (week, day), names in list(double_booked.items())[:5]],
+                "lost_writes": [f"{week} day {day}: expected {expected or 'empty'}, sheet has {found or 'empty'}"
+                                for (week, day), (expected, found) in list(lost.items())[:5]],
+            },
+        },
+    }
+
+
+# ===========================
+# Reporting
+# ===========================
+
+def print_report(report):
+    print(f"{report['users']} sessions, {report['seconds']} s, {report['actions']} actions "
+          f"({report['actions_per_second']}/s), {report['errors']} errors")
+    print()
+    header = (f"{'action':<8}{'count':>7}{'ok':>6}{'conflict':>10}{'skipped':>9}{'error':>7}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    print(header)
+    print("-" * len(header))
+    for action, r in report["by_action"].items():
+        print(f"{action:<8}{r['count']:>7}{r.get('ok', 0):>6}{r.get('conflict', 0):>10}{r.get('skipped', 0):>9}"
+              f"{r.get('error', 0):>7}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+    for message, count in report["error_messages"].items():
+        print(f"  {count} x {message}")
+
+    sheets, webhooks, consistency = report["sheets"], report["webhooks"], report["consistency"]
+    print()
+    print(f"Sheets:   {sheets['requests']['total']} requests ({sheets['requests'].get('read', 0)} reads, "
+          f"{sheets['requests'].get('write', 0)} writes), {sheets['throttled']['total']} throttled "
+          f"({sheets['throttled_rate']:.1%}), {sheets['errors']} errors")
+    print(f"Webhooks: {webhooks['delivered']} delivered, {webhooks['throttled']} throttled "
+          f"({webhooks['throttled_rate']:.1%}), outbox {webhooks['outbox']}")
+    print(f"Writes:   {consistency['acknowledged_writes']} acknowledged, {consistency['double_booked']} double-booked "
+          f"days, {consistency['lost_writes']} lost, {consistency['rejected_on_sync']} rejected on sync, "
+          f"{consistency['still_pending']} still pending after {consistency['drain_seconds']} s")
+    for example in consistency["examples"]["double_booked"] + consistency["examples"]["lost_writes"]:
+        print(f"  {example}")
+
+
+def print_race_report(report):
+    for phase in report["phases"]:
+        status = "ok" if phase["outcomes"] == phase["expected"] else "FAILED"
+        print(f"{phase['name']:<16}{phase['week']}  {', '.join(phase['outcomes']):<40}{status}")
+    sheets = report["sheets"]
+    print(f"Sheets:   {sum(sheets['requests'].values())} requests, {sum(sheets['throttled'].values())} throttled, "
+          f"{sheets['errors']} errors; journal drained in {report['drain_seconds']} s")
+    print(f"Failures: {len(report['failures'])}")
+    for failure in report["failures"]:
+        print(f"  {failure}")
+
+
+def _mix(text):
+    name, _, weight = text.partition("=")
+    if name not in DEFAULT_MIX:
+        raise argparse.ArgumentTypeError(f"unknown action {name!r} (choose from {', '.join(DEFAULT_MIX)})")
+    return name, float(weight)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent sessions")
+    parser.add_argument("--duration", type=float, default=60, help="seconds each session keeps acting after the ramp")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which sessions open the app")
+    parser.add_argument("--think", type=float, default=2, help="mean seconds between a session's actions")
+    parser.add_argument("--mix", type=_mix, nargs="+", default=list(DEFAULT_MIX.items()), metavar="ACTION=WEIGHT",
+                        help="relative weights of browse, assign and clear (default: browse=70 assign=20 clear=10)")
+    parser.add_argument("--weeks", type=int, default=3, help="weeks, from the current one, that sessions browse")
+    parser.add_argument("--admins", type=float, default=0.1, help="fraction of sessions logged in as admin")
+    parser.add_argument("--rows", type=int, default=1000, help="rows of schedule history in the sheet")
+    parser.add_argument("--read-quota", type=int, default=60, help="Sheets reads allowed per minute")
+    parser.add_argument("--write-quota", type=int, default=60, help="Sheets writes allowed per minute")
+    parser.add_argument("--read-latency", type=float, default=0.2, help="median seconds per Sheets read")
+    parser.add_argument("--write-latency", type=float, default=0.4, help="median seconds per Sheets write")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="spread of the log-normal Sheets latency (0 = always the median)")
+    parser.add_argument("--webhook-latency", type=float, default=0.2, help="seconds Make.com takes to answer")
+    parser.add_argument("--webhook-limit", type=int, default=30, help="Make.com webhook posts accepted per second")
+    parser.add_argument("--drain-timeout", type=float, default=300,
+                        help="seconds to wait for queued sheet writes and webhooks after the run")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the sessions' choices")
+    parser.add_argument("--scenario", choices=["mix", "races"], default="mix",
+                        help="timed random traffic, or the fixed race script")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+    args.mix = dict(args.mix)
+
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as workdir:
+        report = run_races(args, workdir) if args.scenario == "races" else run_load_test(args, workdir)
+    (print_race_report if args.scenario == "races" else print_report)(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.scenario == "races":
+        return 1 if report["failures"] else 0
+    consistency = report["consistency"]
+    return 1 if consistency["double_booked"] or consistency["lost_writes"] or consistency["rejected_on_sync"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
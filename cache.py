@@ -0,0 +1,270 @@
+"""Thread-safe TTL cache shared by all sessions of the app"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class ChangeDetector:
+    """Cheap "has the source changed?" check, asked at most once every `interval` seconds
+
+    `fetch_version()` returns an opaque token that changes whenever the data
+    does (the spreadsheet's Drive modifiedTime). Errors count as "unknown",
+    which makes the cache reload rather than trust stale data.
+    """
+
+    def __init__(self, fetch_version, interval=10, clock=time.monotonic):
+        self.interval = interval
+        self.last = None
+        self.checks = 0
+        self.changes = 0
+        self._fetch_version = fetch_version
+        self._clock = clock
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        """The current version token (None if unknown), re-fetched only when the last one is old"""
+        with self._lock:
+            if self._checked_at is not None and self._clock() - self._checked_at < self.interval:
+                return self.last
+            try:
+                version = self._fetch_version()
+            except Exception:
+                version = None
+            self.checks += 1
+            if version is not None and self.last is not None and version != self.last:
+                self.changes += 1
+            self.last = version
+            self._checked_at = self._clock()
+            return version
+
+
+class CacheBudget:
+    """Entry limit shared by several TTLCaches, evicting the least recently used entry across all of them
+
+    With one cache per tenant, each is bounded by its own `maxsize` and all of
+    them together by the budget, so busy tenants keep their entries and idle
+    ones give theirs up instead of memory growing with the number of tenants.
+    Entries a cache dropped on its own are forgotten lazily: they are never
+    used again, so they drift to the front and are the first to go.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._order = OrderedDict()  # (id(cache), key) -> cache
+        self._lock = threading.Lock()
+
+    def touch(self, cache, keys):
+        """Mark `keys` of `cache` as just used; returns the (cache, key) pairs to evict"""
+        evicted = []
+        with self._lock:
+            for key in keys:
+                token = (id(cache), key)
+                self._order[token] = cache
+                self._order.move_to_end(token)
+            while len(self._order) > self.maxsize:
+                (_, key), owner = self._order.popitem(last=False)
+                evicted.append((owner, key))
+        return evicted
+
+    def __len__(self):
+        with self._lock:
+            return len(self._order)
+
+
+class TTLCache:
+    """LRU-bounded mapping whose entries expire `ttl` seconds after they were stored
+
+    With a `ChangeDetector`, entries older than `detector.interval` are only
+    served after the source's version is confirmed unchanged since they were
+    loaded; a changed version drops them so the next read reloads. With a
+    `CacheBudget` the cache also gives up entries when the caches sharing the
+    budget hold too many between them.
+    """
+
+    def __init__(self, ttl=300, maxsize=256, detector=None, budget=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.detector = detector
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._entries = OrderedDict()  # key -> (stored_at, checked_at, version, value)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        # Bumped on every invalidation so loads that started earlier don't store stale data
+        self._generation = 0
+
+    def _needs_check(self, entry, now):
+        return self.detector is not None and now - entry[1] >= self.detector.interval
+
+    def _lookup(self, key, version=_MISSING):
+        """Return the cached value or _MISSING (caller holds the lock)
+
+        `version` is the detector's current token, fetched by the caller
+        outside the lock; entries due for a check without one are misses.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        stored_at, checked_at, stored_version, value = entry
+        now = time.monotonic()
+        if now - stored_at >= self.ttl:
+            del self._entries[key]
+            return _MISSING
+        if self._needs_check(entry, now):
+            if version is _MISSING or version is None or version != stored_version:
+                del self._entries[key]
+                return _MISSING
+            self._entries[key] = (stored_at, now, stored_version, value)
+            self.revalidations += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def _check_version(self, keys):
+        """Ask the detector for the current version if any of `keys` is due for a check"""
+        if self.detector is None:
+            return _MISSING
+        now = time.monotonic()
+        with self._lock:
+            due = any(key in self._entries and self._needs_check(self._entries[key], now) for key in keys)
+        return self.detector.check() if due else _MISSING
+
+    def _version_before_load(self):
+        """The version to stamp on what a load is about to return (fetched before it, not after)"""
+        return self.detector.check() if self.detector is not None else None
+
+    def _store(self, key, value, version=_MISSING):
+        """Store a value and evict the least recently used entries (caller holds the lock)"""
+        if version is _MISSING:
+            version = self.detector.last if self.detector is not None else None
+        now = time.monotonic()
+        self._entries[key] = (now, now, version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _used(self, keys):
+        """Tell the shared budget about used or stored keys (never while holding our own lock)"""
+        if self.budget is None or not keys:
+            return
+        for cache, key in self.budget.touch(self, keys):
+            cache._evict(key)
+
+    def _evict(self, key):
+        """Drop an entry to stay within the shared budget - not an invalidation, so loads may still store"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get(self, key, default=None):
+        """Return a fresh cached value, or `default` if missing or expired"""
+        version = self._check_version([key])
+        with self._lock:
+            value = self._lookup(key, version)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+        self._used([key])
+        return value
+
+    def set(self, key, value):
+        """Store a value for `key`"""
+        with self._lock:
+            self._store(key, value)
+        self._used([key])
+
+    def get_or_load(self, key, loader):
+        """Return the cached value, calling `loader()` once on a miss even under concurrent readers"""
+        version = self._check_version([key])
+        with self._lock:
+            value = self._lookup(key, version)
+            if value is not _MISSING:
+                self.hits += 1
+            else:
+                self.misses += 1
+                load_lock = self._load_locks.setdefault(key, threading.Lock())
+        if value is not _MISSING:
+            self._used([key])
+            return value
+
+        with load_lock:
+            with self._lock:
+                # Another session may have loaded it while we waited
+                value = self._lookup(key, version)
+                if value is not _MISSING:
+                    return value
+                generation = self._generation
+
+            # A change made while loading shows up as a newer version at the next check
+            loaded_version = self._version_before_load()
+            value = loader()
+
+            with self._lock:
+                stored = generation == self._generation
+                if stored:
+                    self._store(key, value, loaded_version)
+                self._load_locks.pop(key, None)
+        if stored:
+            self._used([key])
+        return value
+
+    def missing(self, keys):
+        """Keys that are absent or expired, without touching the hit/miss counters"""
+        version = self._check_version(keys)
+        with self._lock:
+            return [key for key in keys if self._lookup(key, version) is _MISSING]
+
+    def get_or_load_many(self, keys, loader):
+        """Return {key: value}, calling `loader(missing_keys) -> {key: value}` once for all misses"""
+        values = {}
+        version = self._check_version(keys)
+        with self._lock:
+            for key in keys:
+                value = self._lookup(key, version)
+                if value is _MISSING:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    values[key] = value
+            missing = [key for key in keys if key not in values]
+            generation = self._generation
+
+        used = list(values)
+        if missing:
+            loaded_version = self._version_before_load()
+            loaded = loader(missing)
+            with self._lock:
+                if generation == self._generation:
+                    for key in missing:
+                        self._store(key, loaded[key], loaded_version)
+                    used += missing
+            values.update(loaded)
+        self._used(used)
+        return values
+
+    def invalidate(self, key):
+        """Drop a single key"""
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drop every key for which `predicate(key)` is true"""
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop everything"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,311 @@
+"""ICS calendar feeds of the schedule, pre-rendered and served with conditional GET
+
+A `CalendarFeed` holds one tenant's feeds - the whole schedule and one per
+person - as rendered .ics documents, each with its own ETag and
+Last-Modified. A background thread refreshes it from the shared read cache
+every `interval` seconds, or right away after a write (`changed()`), and a
+document is only re-rendered when the days it lists are different from the
+last render; otherwise it keeps its body, ETag and Last-Modified.
+
+`FeedServer` serves the documents over HTTP on a port of its own and
+answers If-None-Match / If-Modified-Since with 304, so calendar apps polling
+every few minutes are served from memory and never cause a Sheets read:
+
+    GET /calendar.ics?tenant=<id>                whole schedule
+    GET /calendar.ics?tenant=<id>&person=<name>  one person's days
+"""
+import email.utils
+import hashlib
+import logging
+import threading
+import time
+import urllib.parse
+from collections import namedtuple
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from autoschedule import slot_date
+
+logger = logging.getLogger(__name__)
+
+FEED_PATH = "/calendar.ics"
+
+# body: bytes, etag: quoted string, last_modified: epoch seconds (whole)
+Document = namedtuple('Document', 'body etag last_modified')
+
+
+# ===========================
+# Rendering
+# ===========================
+
+def _escape(text):
+    """Escape a TEXT value (RFC 5545 3.3.11)"""
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """Split a content line into lines of at most 75 octets, never inside a UTF-8 character"""
+    parts = []
+    limit = 75
+    while len(line.encode('utf-8')) > limit:
+        cut = limit
+        while len(line[:cut].encode('utf-8')) > limit:
+            cut -= 1
+        parts.append(line[:cut])
+        line = line[cut:]
+        # Continuation lines start with a space, which counts towards their 75
+        limit = 74
+    parts.append(line)
+    return '\r\n '.join(parts)
+
+
+def render_calendar(name, events, stamp, refresh_minutes=None):
+    """An iCalendar document of all-day `events` ([(uid, date YYYY-MM-DD, summary)]) as bytes"""
+    dtstamp = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(stamp))
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//pickup-scheduler//calendar feed//HE',
+             'CALSCALE:GREGORIAN', 'METHOD:PUBLISH', f'X-WR-CALNAME:{_escape(name)}']
+    if refresh_minutes:
+        # How often clients should poll - a hint most of them follow
+        lines += [f'REFRESH-INTERVAL;VALUE=DURATION:PT{refresh_minutes}M', f'X-PUBLISHED-TTL:PT{refresh_minutes}M']
+    for uid, date, summary in events:
+        day = datetime.strptime(date, "%Y-%m-%d")
+        lines += ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{dtstamp}',
+                  f'DTSTART;VALUE=DATE:{day.strftime("%Y%m%d")}',
+                  f'DTEND;VALUE=DATE:{(day + timedelta(days=1)).strftime("%Y%m%d")}',
+                  f'SUMMARY:{_escape(summary)}', 'TRANSP:TRANSPARENT', 'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(_fold(line) for line in lines) + '\r\n').encode('utf-8')
+
+
+# ===========================
+# Feeds
+# ===========================
+
+class CalendarFeed:
+    """One tenant's pre-rendered feeds, refreshed in the background
+
+    `load_weeks()` returns {week_start: schedule} for the weeks the feed
+    covers; it is meant to read through the shared cache, so a refresh only
+    reaches the sheet when the cache itself would. Calendar names and event
+    titles come from `child_name`.
+    """
+
+    def __init__(self, load_weeks, child_name, uid_prefix, interval=300, clock=time.time):
+        self.child_name = child_name
+        self.uid_prefix = uid_prefix
+        self.interval = interval
+        self.refreshes = 0
+        self.renders = 0
+        self.served = 0
+        self.not_modified = 0
+        self._load_weeks = load_weeks
+        self._clock = clock
+        self._events = {}      # person name (None = everyone) -> events of its current document
+        self._documents = None  # person name (None = everyone) -> Document; swapped whole on refresh
+        self._empty = None
+        self._refreshed_at = None
+        self._refresh_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._documents is not None
+
+    def _event_lists(self, weeks):
+        """{None: every assigned day, person_name: their days} as (uid, date, summary) lists, in date order"""
+        everyone, by_person = [], {}
+        for week_start in sorted(weeks):
+            for day_index, assignment in sorted(weeks[week_start].items()):
+                date = slot_date(week_start, day_index)
+                name = assignment['person_name']
+                uid = f"{self.uid_prefix}-{date}"
+                everyone.append((f"{uid}@pickup-scheduler", date, f"{name} עם {self.child_name}"))
+                by_person.setdefault(name, []).append((f"{uid}-{_digest(name)}@pickup-scheduler", date,
+                                                       f"בילוי עם {self.child_name}"))
+        return {None: everyone, **by_person}
+
+    def _render(self, person, events, stamp):
+        name = f"מי מבלה עם {self.child_name}" if person is None else f"בילוי עם {self.child_name}"
+        body = render_calendar(name, events, stamp, refresh_minutes=max(1, self.interval // 60))
+        self.renders += 1
+        return Document(body, f'"{hashlib.sha1(body).hexdigest()[:20]}"', stamp)
+
+    def refresh(self):
+        """Reload the schedule and re-render the documents whose days changed; returns how many were"""
+        with self._refresh_lock:
+            event_lists = self._event_lists(self._load_weeks())
+            stamp = int(self._clock())
+            previous = self._documents or {}
+            documents, rendered = {}, 0
+            # People whose last day just left keep a (now empty) document, so their clients see the change
+            for person in previous:
+                event_lists.setdefault(person, [])
+            for person, events in event_lists.items():
+                if person in previous and self._events.get(person) == events:
+                    documents[person] = previous[person]
+                else:
+                    documents[person] = self._render(person, events, stamp)
+                    rendered += 1
+            self._events = event_lists
+            self._documents = documents
+            self._refreshed_at = self._clock()
+            self.refreshes += 1
+            return rendered
+
+    def document(self, person=None):
+        """The current document for `person` (None = the whole schedule), rendered now if there is none yet"""
+        if self._due():
+            self._changed.clear()
+            self.refresh()
+        person = person.strip() if person else None
+        document = self._documents.get(person)
+        if document is None:
+            # Someone with no days in the window gets an empty calendar, rendered once
+            if self._empty is None:
+                self._empty = self._render('', [], int(self._clock()))
+            document = self._empty
+        return document
+
+    def _due(self):
+        """Without the refresh thread running, documents are brought up to date when they are asked for"""
+        if self._documents is None:
+            return True
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        return self._changed.is_set() or self._clock() - self._refreshed_at >= self.interval
+
+    def changed(self):
+        """The schedule was just written - refresh now instead of at the next interval"""
+        self._changed.set()
+
+    def start(self):
+        """Start the refresh thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='calendar-feed', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._changed.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # The documents we have keep being served; tried again at the next tick
+                logger.exception("Calendar feed refresh failed")
+            self._changed.wait(self.interval)
+            self._changed.clear()
+
+
+def _digest(name):
+    """Short stable token for a person's name, for UIDs (names can hold any character)"""
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+
+
+# ===========================
+# HTTP
+# ===========================
+
+def not_modified(document, if_none_match, if_modified_since):
+    """Whether a conditional GET for `document` can be answered with 304 (If-None-Match wins, RFC 9110)"""
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any(tag.removeprefix('W/') == document.etag for tag in tags)
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since is not None and document.last_modified <= since.timestamp()
+    return False
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    server_version = "PickupCalendar/1.0"
+
+    def do_GET(self):
+        self._answer(body=True)
+
+    def do_HEAD(self):
+        self._answer(body=False)
+
+    def _answer(self, body):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        feeds = self.server.feeds
+        tenant_id = query.get('tenant', [self.server.default_tenant])[0]
+        if url.path != FEED_PATH or tenant_id not in feeds:
+            self.send_error(404)
+            return
+        feed = feeds[tenant_id]
+        if not feed.ready:
+            # Still loading after a start - polling never triggers a load itself
+            self.send_response(503)
+            self.send_header('Retry-After', '30')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        document = feed.document(query.get('person', [None])[0])
+        headers = {'ETag': document.etag, 'Last-Modified': email.utils.formatdate(document.last_modified, usegmt=True),
+                   'Cache-Control': 'no-cache'}
+        if not_modified(document, self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')):
+            feed.not_modified += 1
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        feed.served += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar; charset=utf-8')
+        self.send_header('Content-Length', str(len(document.body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(document.body)
+
+    def log_message(self, format, *args):
+        logger.debug("calendar %s - " + format, self.address_string(), *args)
+
+
+class FeedServer:
+    """HTTP server for the feeds of every tenant ({tenant_id: CalendarFeed}) on a background thread"""
+
+    def __init__(self, feeds, host='0.0.0.0', port=8502, default_tenant=None):
+        self.feeds = feeds
+        self.host = host
+        self.port = port
+        self.default_tenant = default_tenant
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        """Bind and start serving (idempotent); port 0 picks a free port, available as `.port` afterwards"""
+        if self._httpd is not None:
+            return
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _FeedHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.feeds = self.feeds
+        self._httpd.default_tenant = self.default_tenant
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='calendar-server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._httpd = None
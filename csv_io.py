@@ -0,0 +1,153 @@
+"""Bulk CSV import and export of people and schedule rows
+
+People CSVs need `name` and `phone` columns; `email` and the scheduling
+constraint columns (see `autoschedule`) are optional. Schedule CSVs use the
+Schedule tab's own columns, `week_start,day_index,person_name,person_phone,person_email`,
+so an export can be imported back as is; `day_index` may also be a Hebrew
+day name.
+
+Readers only validate and deduplicate - they return an `ImportResult` and the
+caller writes `result.rows` with one batched storage call. Nothing here talks
+to storage, so the admin page and `manage.py` share it.
+"""
+import csv
+import io
+import re
+from datetime import datetime
+
+from autoschedule import DAY_NAMES, Constraints
+from storage import PEOPLE_COLUMNS
+
+SCHEDULE_COLUMNS = ('week_start', 'day_index', 'person_name', 'person_phone', 'person_email')
+
+
+class ImportResult:
+    """Rows ready to write, plus the ones skipped and why"""
+
+    def __init__(self):
+        self.rows = []
+        # [(line, name or slot, reason)] - already known or repeated in the file
+        self.duplicates = []
+        # [(line, message)] - rows that didn't validate
+        self.errors = []
+
+
+def name_key(name):
+    """Names compare case- and whitespace-insensitively"""
+    return ' '.join(str(name or '').split()).casefold()
+
+
+def phone_key(phone):
+    """Digits only, with +972 folded into the local 0 prefix, so 050-1234567 == +972501234567"""
+    digits = re.sub(r'\D', '', str(phone or ''))
+    if digits.startswith('972'):
+        digits = '0' + digits[3:]
+    return digits
+
+
+def _records(source, required):
+    """(line, {column: value}) for each row of a CSV given as text, bytes or a file"""
+    if hasattr(source, 'read'):
+        source = source.read()
+    if isinstance(source, bytes):
+        # utf-8-sig drops the BOM Excel puts in front of Hebrew CSVs
+        source = source.decode('utf-8-sig')
+    reader = csv.reader(io.StringIO(source.lstrip('\ufeff')))
+    headers = [header.strip().lower() for header in next(reader, [])]
+    missing = [column for column in required if column not in headers]
+    if missing:
+        raise ValueError(f"חסרות עמודות בקובץ: {', '.join(missing)}")
+    for line, values in enumerate(reader, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        yield line, {header: value.strip() for header, value in zip(headers, values)}
+
+
+def read_people(source, existing=()):
+    """Validate a people CSV, dropping anyone already in `existing` or earlier in the file by name or phone"""
+    result = ImportResult()
+    names = {name_key(person['name']) for person in existing}
+    phones = {phone_key(person.get('phone')) for person in existing} - {''}
+    for line, record in _records(source, ('name', 'phone')):
+        person = {column: record.get(column, '') for column in PEOPLE_COLUMNS}
+        if not person['name']:
+            result.errors.append((line, "חסר שם"))
+            continue
+        phone = phone_key(person['phone'])
+        if person['phone'] and len(phone) < 9:
+            result.errors.append((line, f"מספר טלפון לא תקין: {person['phone']}"))
+            continue
+        try:
+            Constraints(person)
+        except ValueError as e:
+            result.errors.append((line, str(e)))
+            continue
+        if name_key(person['name']) in names:
+            result.duplicates.append((line, person['name'], "השם כבר קיים"))
+            continue
+        if phone and phone in phones:
+            result.duplicates.append((line, person['name'], "הטלפון כבר קיים"))
+            continue
+        names.add(name_key(person['name']))
+        phones.add(phone)
+        result.rows.append(person)
+    return result
+
+
+def _day_index(value):
+    if value in DAY_NAMES:
+        return DAY_NAMES.index(value)
+    if value.isdigit() and int(value) < len(DAY_NAMES):
+        return int(value)
+    raise ValueError(f"יום לא מוכר: {value}")
+
+
+def read_schedule(source, people=()):
+    """Validate a schedule CSV; blank phone/email are filled from `people`, a slot repeated in the file is skipped"""
+    result = ImportResult()
+    contacts = {name_key(person['name']): person for person in people}
+    slots = set()
+    for line, record in _records(source, ('week_start', 'day_index', 'person_name')):
+        try:
+            week_start = datetime.strptime(record['week_start'], "%Y-%m-%d")
+            if (week_start.weekday() + 1) % 7:
+                raise ValueError(f"week_start צריך להיות יום ראשון: {record['week_start']}")
+            day_index = _day_index(record['day_index'])
+        except ValueError as e:
+            result.errors.append((line, str(e)))
+            continue
+        if not record['person_name']:
+            result.errors.append((line, "חסר שם"))
+            continue
+
+        slot = (record['week_start'], day_index)
+        if slot in slots:
+            result.duplicates.append((line, f"{record['week_start']} {DAY_NAMES[day_index]}", "היום מופיע פעמיים"))
+            continue
+        slots.add(slot)
+        contact = contacts.get(name_key(record['person_name']), {})
+        result.rows.append({
+            'week_start': record['week_start'],
+            'day_index': day_index,
+            'person_name': record['person_name'],
+            'person_phone': record.get('person_phone') or contact.get('phone', ''),
+            'person_email': record.get('person_email') or contact.get('email', ''),
+        })
+    return result
+
+
+def schedule_csv(assignments):
+    """Yield a schedule export line by line from `Storage.iter_schedule()`, without building it in memory"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(row):
+        writer.writerow(row)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(SCHEDULE_COLUMNS)
+    for assignment in assignments:
+        yield line([assignment[column] for column in SCHEDULE_COLUMNS])
@@ -0,0 +1,308 @@
+"""In-memory stand-in for a gspread Spreadsheet
+
+Implements the subset of the gspread Spreadsheet/Worksheet API the app uses,
+so `storage.SheetsStorage` can run offline for tests and benchmarks. Every
+API-equivalent call is counted, can be slowed down by `latency` seconds and
+records roughly how many bytes of JSON it would have moved.
+"""
+import json
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+_A1_CELL = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def _parse_range(a1):
+    """Turn "Tab!A2:C9", "5:5", "A2:B" or "A1" into 1-based (row1, col1, row2, col2) - None is open"""
+    a1 = a1.split('!')[-1]
+    start, _, end = a1.partition(':')
+    cells = []
+    for cell in (start, end or start):
+        match = _A1_CELL.match(cell.upper())
+        if not match:
+            raise ValueError(f"Unsupported range: {a1}")
+        letters, digits = match.groups()
+        cells.append((int(digits) if digits else None, _column_number(letters) if letters else None))
+    (row1, col1), (row2, col2) = cells
+    return row1 or 1, col1 or 1, row2, col2
+
+
+def _cell_text(value):
+    if value is None or value is False:
+        return ''
+    return str(value)
+
+
+def _trim(rows):
+    """Drop trailing empty cells and rows, the way the Sheets API does"""
+    rows = [list(row) for row in rows]
+    for row in rows:
+        while row and row[-1] == '':
+            row.pop()
+    while rows and not rows[-1]:
+        rows.pop()
+    return rows
+
+
+def _numericise(value):
+    """Mimic gspread's get_all_records conversion of numeric strings"""
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+class FakeWorksheet:
+    """A single tab kept as a list of string rows"""
+
+    def __init__(self, spreadsheet, title, rows=1000, cols=26, values=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self._rows = [[_cell_text(v) for v in row] for row in (values or [])]
+        self.row_count = max(self.row_count, len(self._rows))
+
+    def _api(self, method, payload=None):
+        self.spreadsheet._record(self.title, method, payload)
+
+    def _last_row(self):
+        last = len(self._rows)
+        while last and not any(self._rows[last - 1]):
+            last -= 1
+        return last
+
+    def _write(self, row1, col1, values):
+        for offset, row_values in enumerate(values):
+            row_number = row1 + offset
+            while len(self._rows) < row_number:
+                self._rows.append([])
+            row = self._rows[row_number - 1]
+            needed = col1 - 1 + len(row_values)
+            row.extend([''] * (needed - len(row)))
+            row[col1 - 1:needed] = [_cell_text(v) for v in row_values]
+        self.row_count = max(self.row_count, len(self._rows))
+        self.spreadsheet._touch()
+
+    def _read(self, a1):
+        row1, col1, row2, col2 = _parse_range(a1)
+        row2 = row2 or len(self._rows)
+        values = []
+        for row in self._rows[row1 - 1:row2]:
+            values.append(row[col1 - 1:col2] if col2 else row[col1 - 1:])
+        return _trim(values)
+
+    # ---------------------------
+    # Reads
+    # ---------------------------
+
+    def get_all_values(self):
+        with self.spreadsheet._lock:
+            rows = self._rows[:self._last_row()]
+            width = max((len(row) for row in rows), default=0)
+            values = [row + [''] * (width - len(row)) for row in rows]
+        self._api('get_all_values', values)
+        return values
+
+    def get_all_records(self):
+        with self.spreadsheet._lock:
+            rows = [list(row) for row in self._rows[:self._last_row()]]
+        self._api('get_all_records', rows)
+        if not rows:
+            return []
+        headers = rows[0]
+        return [
+            {header: _numericise(row[i]) if i < len(row) else '' for i, header in enumerate(headers)}
+            for row in rows[1:]
+        ]
+
+    def row_values(self, row):
+        with self.spreadsheet._lock:
+            values = self._read(f"{row}:{row}")
+        self._api('row_values', values)
+        return values[0] if values else []
+
+    def get(self, range_name):
+        with self.spreadsheet._lock:
+            values = self._read(range_name)
+        self._api('get', values)
+        return values
+
+    def batch_get(self, ranges):
+        with self.spreadsheet._lock:
+            values = [self._read(a1) for a1 in ranges]
+        self._api('batch_get', values)
+        return values
+
+    # ---------------------------
+    # Writes
+    # ---------------------------
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        with self.spreadsheet._lock:
+            first = self._last_row() + 1
+            self._write(first, 1, values)
+            last = first + len(values) - 1
+            width = max((len(row) for row in values), default=1)
+        self._api('append_rows', values)
+        end_column = chr(ord('A') + width - 1)
+        return {'updates': {'updatedRange': f"{self.title}!A{first}:{end_column}{last}",
+                            'updatedRows': len(values)}}
+
+    def update(self, values=None, range_name=None, **kwargs):
+        with self.spreadsheet._lock:
+            row1, col1, _, _ = _parse_range(range_name or "A1")
+            self._write(row1, col1, values)
+        self._api('update', values)
+        return {'updatedRange': f"{self.title}!{range_name}"}
+
+    def batch_update(self, data, **kwargs):
+        with self.spreadsheet._lock:
+            for item in data:
+                row1, col1, _, _ = _parse_range(item['range'])
+                self._write(row1, col1, item['values'])
+        self._api('batch_update', data)
+        return {'totalUpdatedRows': sum(len(item['values']) for item in data)}
+
+    def delete_rows(self, start_index, end_index=None):
+        with self.spreadsheet._lock:
+            del self._rows[start_index - 1:end_index or start_index]
+            self.spreadsheet._touch()
+        self._api('delete_rows')
+
+    def resize(self, rows=None, cols=None):
+        with self.spreadsheet._lock:
+            if rows is not None:
+                self.row_count = rows
+                if len(self._rows) > rows:
+                    del self._rows[rows:]
+                    self.spreadsheet._touch()
+            if cols is not None:
+                self.col_count = cols
+        self._api('resize')
+
+    def clear(self):
+        with self.spreadsheet._lock:
+            self._rows = []
+            self.spreadsheet._touch()
+        self._api('clear')
+
+    def batch_clear(self, ranges):
+        with self.spreadsheet._lock:
+            for a1 in ranges:
+                row1, col1, row2, col2 = _parse_range(a1)
+                for row in self._rows[row1 - 1:row2 or len(self._rows)]:
+                    end = min(col2 or len(row), len(row))
+                    row[col1 - 1:end] = [''] * max(0, end - col1 + 1)
+            self.spreadsheet._touch()
+        self._api('batch_clear')
+
+
+class FakeSpreadsheet:
+    """Spreadsheet of FakeWorksheets with per-method call counters"""
+
+    def __init__(self, tabs=None, latency=0.0, title="Fake"):
+        self.id = "fake"
+        self.title = title
+        self.latency = latency
+        self.calls = Counter()
+        self.bytes_transferred = 0
+        self.last_update_time = time.time()
+        self._lock = threading.RLock()
+        self._worksheets = {}
+        for name, values in (tabs or {}).items():
+            self._worksheets[name] = FakeWorksheet(self, name, values=values)
+
+    def _record(self, title, method, payload=None):
+        """Count one API round trip and sleep for the configured latency"""
+        size = len(json.dumps(payload, ensure_ascii=False)) if payload is not None else 0
+        with self._lock:
+            self.calls[method] += 1
+            self.bytes_transferred += size
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _touch(self):
+        self.last_update_time = time.time()
+
+    @property
+    def api_calls(self):
+        """Total number of simulated round trips so far"""
+        return sum(self.calls.values())
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.bytes_transferred = 0
+
+    def get_lastUpdateTime(self):
+        """Drive's modifiedTime as an RFC 3339 string"""
+        self._record(None, 'get_lastUpdateTime')
+        return datetime.fromtimestamp(self.last_update_time, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def worksheets(self):
+        self._record(None, 'fetch_sheet_metadata')
+        return list(self._worksheets.values())
+
+    def worksheet(self, title):
+        self._record(title, 'fetch_sheet_metadata')
+        try:
+            return self._worksheets[title]
+        except KeyError:
+            # Imported here so the fake doesn't load gspread before the app would (see the cold-start benchmark)
+            import gspread
+            raise gspread.exceptions.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        self._record(title, 'add_worksheet')
+        with self._lock:
+            worksheet = FakeWorksheet(self, title, rows=int(rows), cols=int(cols))
+            self._worksheets[title] = worksheet
+            return worksheet
+
+    def del_worksheet(self, worksheet):
+        self._record(worksheet.title, 'del_worksheet')
+        with self._lock:
+            self._worksheets.pop(worksheet.title, None)
+
+
+def empty_spreadsheet(latency=0.0):
+    """A fake spreadsheet with the app's tabs and headers and no data"""
+    return FakeSpreadsheet({
+        "People": [['name', 'phone', 'email']],
+        "Schedule": [['week_start', 'day_index', 'person_name', 'person_phone', 'person_email', 'version']],
+        "ScheduleIndex": [['week_start', 'rows']],
+    }, latency=latency)
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_spreadsheet(key="default"):
+    """Process-wide fake used by the "memory" storage backend - one per tenant"""
+    with _shared_lock:
+        if key not in _shared:
+            _shared[key] = empty_spreadsheet()
+        return _shared[key]
+
+
+def set_shared_spreadsheet(spreadsheet, key="default"):
+    """Swap in a pre-seeded fake (benchmarks and tests)"""
+    with _shared_lock:
+        _shared[key] = spreadsheet
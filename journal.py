@@ -0,0 +1,516 @@
+"""Local write-ahead journal for schedule writes
+
+`JournaledStorage` wraps a storage backend. Assignments and clears go into a
+local SQLite journal and are acknowledged as soon as they are on disk, and
+a `JournalSyncer` thread replays them against the backend in the order they
+were made. Until an entry has been replayed its write is laid over what the
+backend returns, so the schedule shows it at once and Sheets latency, quota
+waits and outages never reach the click handler.
+
+A pending assignment's version is the negative id of its journal entry. A
+compare-and-set clear that targets it is resolved to the real version once
+the save has been replayed (see `storage.check_expected_version`).
+
+Before a compare-and-set write is acknowledged, the slot is read from the
+backend (unless a pending entry of ours already decides it), so a day
+someone else took - in another process, or behind a stale cache - is
+refused at once instead of being acknowledged and rejected on replay. The
+check is best effort: when the backend fails or doesn't answer within
+`check_timeout` seconds the write is journaled anyway, and a conflict is
+found (and reported through `on_rejected`) when it is replayed.
+
+Replays are idempotent. If the process died after the backend write but
+before the entry was marked done, the slot already holds what the entry
+wanted, and the entry is marked applied without writing again. Entries
+whose slot was changed by someone else in the meantime are marked rejected
+and kept for the admin page.
+"""
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from storage import SlotConflictError, SlotLocks, Storage, check_expected_version
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+APPLIED = 'applied'
+REJECTED = 'rejected'
+DISMISSED = 'dismissed'
+
+SAVE = 'save'
+CLEAR = 'clear'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    week_start TEXT NOT NULL,
+    day_index INTEGER NOT NULL,
+    person_name TEXT NOT NULL DEFAULT '',
+    person_phone TEXT NOT NULL DEFAULT '',
+    person_email TEXT NOT NULL DEFAULT '',
+    -- NULL = unconditional, 0 = slot must be empty, < 0 = the assignment made by entry -n
+    expected_version INTEGER,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT NOT NULL DEFAULT '',
+    -- Version the backend gave the write, for resolving later entries that refer to it
+    result_version INTEGER,
+    -- JSON of what the slot held when the entry was rejected
+    current TEXT,
+    created_at REAL NOT NULL,
+    applied_at REAL
+);
+CREATE INDEX IF NOT EXISTS entries_status ON entries (status, id);
+"""
+
+_COLUMNS = ('id', 'op', 'week_start', 'day_index', 'person_name', 'person_phone', 'person_email',
+            'expected_version', 'status', 'attempts', 'last_error', 'result_version', 'current', 'created_at')
+
+
+def _assignment(entry):
+    """What a pending entry puts in its slot"""
+    if entry['op'] == CLEAR:
+        return None
+    return {'person_name': entry['person_name'], 'person_phone': entry['person_phone'],
+            'person_email': entry['person_email'], 'version': -entry['id']}
+
+
+class WriteJournal:
+    """SQLite journal of schedule writes waiting to reach the storage backend"""
+
+    def __init__(self, path):
+        self.path = path
+        self._db_lock = threading.Lock()
+        # Set on every append so the syncer doesn't wait out its poll interval
+        self.wakeup = threading.Event()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection that commits on success and always closes"""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _select(self, where, params=(), limit=None):
+        query = f"SELECT {', '.join(_COLUMNS)} FROM entries WHERE {where} ORDER BY id"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        with self._connect() as db:
+            rows = db.execute(query, params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    # ---------------------------
+    # Producer side
+    # ---------------------------
+
+    def append(self, entries):
+        """Persist writes ({'op', 'week_start', 'day_index', 'person_*', 'expected_version'}) and return their ids"""
+        now = time.time()
+        ids = []
+        with self._db_lock, self._connect() as db:
+            for entry in entries:
+                cursor = db.execute(
+                    "INSERT INTO entries (op, week_start, day_index, person_name, person_phone, person_email, "
+                    "expected_version, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry['op'], entry['week_start'], int(entry['day_index']), entry.get('person_name', ''),
+                     entry.get('person_phone', ''), entry.get('person_email', ''), entry.get('expected_version'),
+                     PENDING, now)
+                )
+                ids.append(cursor.lastrowid)
+        self.wakeup.set()
+        return ids
+
+    def pending(self, limit=None):
+        """Entries not yet replayed, oldest first"""
+        return self._select("status = ?", (PENDING,), limit)
+
+    def overlay(self):
+        """{(week_start, day_index): assignment or None} - the state pending entries leave each slot in"""
+        slots = {}
+        for entry in self.pending():
+            slots[(entry['week_start'], entry['day_index'])] = _assignment(entry)
+        return slots
+
+    # ---------------------------
+    # Syncer side
+    # ---------------------------
+
+    def entry(self, entry_id):
+        entries = self._select("id = ?", (entry_id,))
+        return entries[0] if entries else None
+
+    def entries(self, entry_ids):
+        """{id: entry} for the given ids (ones already purged are missing)"""
+        entry_ids = [int(entry_id) for entry_id in entry_ids]
+        if not entry_ids:
+            return {}
+        entries = self._select(f"id IN ({','.join('?' * len(entry_ids))})", entry_ids)
+        for entry in entries:
+            entry['current'] = json.loads(entry['current']) if entry['current'] else None
+        return {entry['id']: entry for entry in entries}
+
+    def mark_applied(self, entry_id, result_version):
+        with self._db_lock, self._connect() as db:
+            db.execute("UPDATE entries SET status = ?, result_version = ?, applied_at = ?, last_error = '' "
+                       "WHERE id = ?", (APPLIED, result_version, time.time(), entry_id))
+
+    def mark_rejected(self, entry_id, current):
+        with self._db_lock, self._connect() as db:
+            db.execute("UPDATE entries SET status = ?, current = ? WHERE id = ?",
+                       (REJECTED, json.dumps(current, ensure_ascii=False), entry_id))
+
+    def mark_failed(self, entry_id, error):
+        with self._db_lock, self._connect() as db:
+            db.execute("UPDATE entries SET attempts = attempts + 1, last_error = ? WHERE id = ?", (error, entry_id))
+
+    def purge_applied(self, older_than=7 * 24 * 3600):
+        """Forget replayed entries older than `older_than` seconds"""
+        with self._db_lock, self._connect() as db:
+            db.execute("DELETE FROM entries WHERE status IN (?, ?) AND COALESCE(applied_at, created_at) < ?",
+                       (APPLIED, DISMISSED, time.time() - older_than))
+
+    # ---------------------------
+    # Reporting
+    # ---------------------------
+
+    def stats(self):
+        """Count entries per status, plus the age in seconds of the oldest pending one"""
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM entries GROUP BY status").fetchall()
+            oldest = db.execute("SELECT MIN(created_at) FROM entries WHERE status = ?", (PENDING,)).fetchone()[0]
+        counts = {PENDING: 0, APPLIED: 0, REJECTED: 0, DISMISSED: 0}
+        counts.update(dict(rows))
+        counts['oldest_pending_seconds'] = time.time() - oldest if oldest else 0.0
+        return counts
+
+    def rejected(self, limit=50):
+        """Most recent writes the backend turned down because the slot had changed"""
+        entries = self._select("status = ?", (REJECTED,))[-limit:]
+        for entry in entries:
+            entry['current'] = json.loads(entry['current']) if entry['current'] else None
+        return list(reversed(entries))
+
+    def dismiss_rejected(self):
+        """Hide the rejected writes from the admin page once someone has dealt with them"""
+        with self._db_lock, self._connect() as db:
+            cursor = db.execute("UPDATE entries SET status = ?, applied_at = ? WHERE status = ?",
+                                (DISMISSED, time.time(), REJECTED))
+        return cursor.rowcount
+
+
+class JournalSyncer:
+    """Background thread replaying journal entries against the backend, in order"""
+
+    def __init__(self, journal, backend, on_applied=None, on_rejected=None, batch_size=50,
+                 base_delay=2.0, max_delay=300.0):
+        self.journal = journal
+        self.backend = backend
+        # on_applied(entry, result): result is the stored assignment for a save, the cleared one for a clear
+        self.on_applied = on_applied
+        # on_rejected(entry, current): current is what the slot holds instead
+        self.on_rejected = on_rejected
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._failures = 0
+        # drain_once() can also be called directly (manage.py), so only one replay runs at a time
+        self._drain_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """Start the background worker (idempotent)"""
+        if self._worker and self._worker.is_alive():
+            return
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run, name='journal-sync', daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout=5):
+        """Stop the worker; unreplayed entries stay in the journal"""
+        self._stopping.set()
+        self.journal.wakeup.set()
+        if self._worker:
+            self._worker.join(timeout)
+
+    def _run(self):
+        last_purge = 0
+        while not self._stopping.is_set():
+            self.journal.wakeup.clear()
+            try:
+                self.drain_once()
+                if time.time() - last_purge > 3600:
+                    self.journal.purge_applied()
+                    last_purge = time.time()
+            except Exception:
+                logger.exception("Journal syncer iteration failed")
+            if self._failures:
+                # The backend is failing - back off, but a new write still wakes us to try again
+                delay = min(self.max_delay, self.base_delay * 2 ** (self._failures - 1))
+                self.journal.wakeup.wait(delay * random.uniform(0.5, 1.5))
+            else:
+                self.journal.wakeup.wait(60)
+
+    def drain_once(self):
+        """Replay every pending entry, stopping at the first backend failure; returns how many were replayed"""
+        replayed = 0
+        with self._drain_lock:
+            while not self._stopping.is_set():
+                entries = self.journal.pending(limit=self.batch_size)
+                if not entries:
+                    break
+                try:
+                    replayed += self._replay_batch(entries)
+                except Exception as e:
+                    # Keep the order: nothing after a failed entry is replayed before it
+                    self.journal.mark_failed(entries[0]['id'], str(e))
+                    self._failures += 1
+                    logger.warning("Journal replay failed (attempt %s): %s", self._failures, e)
+                    return replayed
+                self._failures = 0
+        return replayed
+
+    def _replay_batch(self, entries):
+        """Replay the leading run of plain "fill an empty day" saves with one fill_slots, or else one entry"""
+        run, slots = [], set()
+        for entry in entries:
+            slot = (entry['week_start'], entry['day_index'])
+            if entry['op'] != SAVE or entry['expected_version'] != 0 or slot in slots:
+                break
+            run.append(entry)
+            slots.add(slot)
+
+        if len(run) < 2:
+            self._replay(entries[0])
+            return 1
+
+        saved, taken = self.backend.fill_slots([
+            {'week_start': entry['week_start'], 'day_index': entry['day_index'], 'person_name': entry['person_name'],
+             'person_phone': entry['person_phone'], 'person_email': entry['person_email'], 'entry': entry}
+            for entry in run
+        ])
+        for assignment in saved:
+            self._applied(assignment['entry'], {key: assignment[key] for key in
+                                                ('person_name', 'person_phone', 'person_email', 'version')})
+        for assignment in taken:
+            # One more read tells a replay of our own earlier write apart from a real conflict
+            self._replay(assignment['entry'])
+        return len(run)
+
+    def _expected_version(self, entry):
+        """The entry's compare-and-set version, with a reference to an earlier entry resolved"""
+        expected = entry['expected_version']
+        if expected is None or expected >= 0:
+            return expected
+        earlier = self.journal.entry(-expected)
+        if earlier is None or earlier['status'] != APPLIED:
+            # What the caller saw never made it to the backend, or is too old to tell
+            raise SlotConflictError(entry['week_start'], entry['day_index'],
+                                    self.backend.load_slot(entry['week_start'], entry['day_index']))
+        return earlier['result_version']
+
+    def _replay(self, entry):
+        week_start, day_index = entry['week_start'], entry['day_index']
+        try:
+            expected = self._expected_version(entry)
+            if entry['op'] == SAVE:
+                result = self.backend.save_assignment(week_start, day_index, entry['person_name'],
+                                                      entry['person_phone'], entry['person_email'],
+                                                      expected_version=expected)
+            else:
+                result = self.backend.clear_assignment(week_start, day_index, expected_version=expected)
+        except SlotConflictError as e:
+            wanted = _assignment(entry)
+            if wanted is None and e.current is None:
+                self._applied(entry, None)
+            elif wanted is not None and e.current is not None and all(
+                    e.current.get(key, '') == wanted[key] for key in ('person_name', 'person_phone', 'person_email')):
+                self._applied(entry, e.current)
+            else:
+                self.journal.mark_rejected(entry['id'], e.current)
+                logger.warning("Journal entry %s rejected: slot %s/%s changed", entry['id'], week_start, day_index)
+                if self.on_rejected:
+                    self.on_rejected(entry, e.current)
+            return
+        self._applied(entry, result)
+
+    def _applied(self, entry, result):
+        version = result.get('version') if entry['op'] == SAVE and result else None
+        self.journal.mark_applied(entry['id'], version)
+        if self.on_applied:
+            self.on_applied(entry, result)
+
+
+class JournaledStorage(Storage):
+    """A backend whose schedule writes go through a `WriteJournal` - everything else is passed through"""
+
+    def __init__(self, backend, journal, check_timeout=2.0):
+        self.backend = backend
+        self.journal = journal
+        # Seconds a write waits for the backend check before it is journaled unchecked
+        self.check_timeout = check_timeout
+        # Checks run here, so one that hangs on a slow backend is abandoned rather than waited out
+        self._checks = ThreadPoolExecutor(max_workers=4, thread_name_prefix='journal-check')
+        # Checking a slot against the pending entries and appending to them is one step
+        self._lock = threading.Lock()
+        # Held around the backend check too, so two writes to one slot can't both pass it
+        self._slot_locks = SlotLocks()
+
+    # ---------------------------
+    # Pass-through
+    # ---------------------------
+
+    def load_people(self):
+        return self.backend.load_people()
+
+    def save_person(self, name, phone, email=''):
+        return self.backend.save_person(name, phone, email)
+
+    def save_people(self, people):
+        return self.backend.save_people(people)
+
+    def delete_person(self, name):
+        return self.backend.delete_person(name)
+
+    def archive(self, before_week):
+        return self.backend.archive(before_week)
+
+    # ---------------------------
+    # Reads, with pending writes laid over them
+    # ---------------------------
+
+    def load_schedule(self, week_start):
+        return self.load_schedule_weeks([week_start])[week_start]
+
+    def load_schedule_weeks(self, week_starts):
+        week_starts = list(week_starts)
+        # Read the journal first: an entry replayed while the backend read runs is then in one or the other
+        overlay = self.journal.overlay()
+        weeks = self.backend.load_schedule_weeks(week_starts)
+        for (week_start, day_index), assignment in overlay.items():
+            if week_start not in weeks:
+                continue
+            if assignment:
+                weeks[week_start][day_index] = assignment
+            else:
+                weeks[week_start].pop(day_index, None)
+        return weeks
+
+    def load_slot(self, week_start, day_index):
+        overlay = self.journal.overlay()
+        if (week_start, int(day_index)) in overlay:
+            return overlay[(week_start, int(day_index))]
+        return self.backend.load_slot(week_start, day_index)
+
+    def iter_schedule(self):
+        overlay = self.journal.overlay()
+        for assignment in self.backend.iter_schedule():
+            if (assignment['week_start'], assignment['day_index']) not in overlay:
+                yield assignment
+        for (week_start, day_index), assignment in sorted(overlay.items()):
+            if assignment:
+                yield {'week_start': week_start, 'day_index': day_index, 'person_name': assignment['person_name'],
+                       'person_phone': assignment['person_phone'], 'person_email': assignment['person_email']}
+
+    # ---------------------------
+    # Writes, acknowledged once journaled
+    # ---------------------------
+
+    def _check_pending(self, overlay, week_start, day_index, expected_version):
+        """Compare-and-set against a pending write to the slot (the backend was checked when there was none)"""
+        slot = (week_start, int(day_index))
+        if slot in overlay:
+            check_expected_version(week_start, day_index, overlay[slot], expected_version)
+
+    def _read_backend(self, what, method, *args):
+        """`backend.method(*args)` within `check_timeout`; None when it failed or took longer
+
+        Only a SlotConflictError gets through - the backend's answer.
+        """
+        future = self._checks.submit(getattr(self.backend, method), *args)
+        try:
+            return future.result(timeout=self.check_timeout)
+        except SlotConflictError:
+            raise
+        except Exception as e:
+            # Unknown - the replay checks the write against the backend instead
+            logger.warning("Couldn't check %s against the backend, journaling unchecked: %s",
+                           what, str(e) or type(e).__name__)
+            return None
+
+    def _check_backend(self, week_start, day_index, expected_version):
+        """Compare-and-set against what the backend holds now, when no pending entry of ours decides the slot
+
+        Called under the slot's lock, so a write of this process can't slip
+        in between the read and the append. A backend that fails or is slow
+        doesn't hold the write up (see `_read_backend`).
+        """
+        if expected_version is None or (week_start, int(day_index)) in self.journal.overlay():
+            return
+        if expected_version < 0:
+            # The caller saw one of our writes that has been replayed since - compare with what it became
+            earlier = self.journal.entry(-expected_version)
+            if earlier is not None and earlier['status'] == APPLIED:
+                expected_version = earlier['result_version']
+        self._read_backend(f"{week_start} day {day_index}", 'verify_slot', week_start, day_index, expected_version)
+
+    def save_assignment(self, week_start, day_index, person_name, person_phone, person_email='',
+                        expected_version=None):
+        with self._slot_locks(week_start, day_index):
+            self._check_backend(week_start, day_index, expected_version)
+            with self._lock:
+                self._check_pending(self.journal.overlay(), week_start, day_index, expected_version)
+                entry_id, = self.journal.append([{
+                    'op': SAVE, 'week_start': week_start, 'day_index': day_index, 'person_name': person_name,
+                    'person_phone': person_phone, 'person_email': person_email, 'expected_version': expected_version,
+                }])
+        return {'person_name': person_name, 'person_phone': person_phone, 'person_email': person_email,
+                'version': -entry_id}
+
+    def clear_assignment(self, week_start, day_index, expected_version=None):
+        with self._slot_locks(week_start, day_index):
+            self._check_backend(week_start, day_index, expected_version)
+            with self._lock:
+                overlay = self.journal.overlay()
+                self._check_pending(overlay, week_start, day_index, expected_version)
+                self.journal.append([{'op': CLEAR, 'week_start': week_start, 'day_index': day_index,
+                                      'expected_version': expected_version}])
+        # Only a pending assignment is known here; the syncer reports what the backend actually cleared
+        return overlay.get((week_start, int(day_index)))
+
+    def fill_slots(self, assignments):
+        assignments = list(assignments)
+        slots = [(assignment['week_start'], int(assignment['day_index'])) for assignment in assignments]
+        saved, taken, entries, claimed = [], [], [], set()
+        with self._slot_locks.many(slots):
+            # Days already taken in the backend are turned down now, in one read for all the weeks -
+            # without an answer every day counts as free and the replay turns the taken ones down
+            weeks = sorted({week_start for week_start, _ in slots})
+            stored = self._read_backend(f"weeks {', '.join(weeks)}", 'load_schedule_weeks', weeks) or {}
+            with self._lock:
+                overlay = self.journal.overlay()
+                for assignment, slot in zip(assignments, slots):
+                    held = overlay[slot] if slot in overlay else stored.get(slot[0], {}).get(slot[1])
+                    if held is not None or slot in claimed:
+                        taken.append(assignment)
+                        continue
+                    claimed.add(slot)
+                    entries.append(dict(assignment, op=SAVE, day_index=slot[1], expected_version=0))
+                ids = self.journal.append(entries) if entries else []
+        for entry, entry_id in zip(entries, ids):
+            assignment = {key: value for key, value in entry.items() if key not in ('op', 'expected_version')}
+            saved.append(dict(assignment, version=-entry_id))
+        return saved, taken
@@ -0,0 +1,159 @@
+"""Maintenance commands for the pickup scheduler spreadsheet
+
+Run from the app directory so .streamlit/secrets.toml is picked up, e.g.:
+
+    python manage.py build-index
+    python manage.py archive --weeks 26
+    python manage.py import-people contacts.csv
+    python manage.py import-schedule schedule.csv --dry-run
+    python manage.py export-schedule -o schedule.csv
+    python manage.py rebuild-stats
+    python manage.py --tenant zohar build-index
+"""
+import argparse
+import sys
+
+import csv_io
+import streamlit_app as app
+from journal import JournaledStorage
+from storage import SheetsStorage
+
+
+def build_index(args):
+    """Create or refresh the ScheduleIndex tab from the full Schedule history (and add the version column)"""
+    storage = app.get_storage()
+    if isinstance(storage, JournaledStorage):
+        storage = storage.backend
+    if not isinstance(storage, SheetsStorage):
+        print("build-index only applies to the Google Sheets backend")
+        return 1
+    
+    index = storage.create_week_index()
+    rows = sum(len(slots) for slots in index.values())
+    print(f"Indexed {rows} rows across {len(index)} weeks")
+    return 0
+
+
+def archive(args):
+    """Move weeks older than --weeks to yearly archive tabs and drop blank rows"""
+    result = app.archive_schedule(args.weeks)
+    if result is None:
+        return 1
+    archived, dropped = result
+    print(f"Archived {archived} rows, dropped {dropped} blank rows")
+    return 0
+
+
+def _report(result):
+    """Print what an import will skip; returns False if the file had invalid rows"""
+    for line, message in result.errors:
+        print(f"line {line}: {message}", file=sys.stderr)
+    for line, label, reason in result.duplicates:
+        print(f"line {line}: skipping {label} ({reason})", file=sys.stderr)
+    return not result.errors
+
+
+def import_people(args):
+    """Add people from a CSV with one write, skipping names or phones already on the list"""
+    with open(args.file, 'rb') as f:
+        result = csv_io.read_people(f, app.load_people())
+    if not _report(result) and not args.force:
+        print("Nothing imported - fix the rows above or pass --force to skip them")
+        return 1
+    if args.dry_run or not result.rows:
+        print(f"{len(result.rows)} people to import")
+        return 0
+    if app.import_people(result.rows) is None:
+        return 1
+    print(f"Imported {len(result.rows)} people, skipped {len(result.duplicates)} duplicates")
+    return 0
+
+
+def import_schedule(args):
+    """Fill empty days from a schedule CSV with batched writes; days already taken are left alone"""
+    with open(args.file, 'rb') as f:
+        result = csv_io.read_schedule(f, app.load_people())
+    if not _report(result) and not args.force:
+        print("Nothing imported - fix the rows above or pass --force to skip them")
+        return 1
+    if args.dry_run or not result.rows:
+        print(f"{len(result.rows)} assignments to import")
+        return 0
+    filled = app.fill_slots(result.rows)
+    if filled is None:
+        return 1
+    saved, taken = filled
+    for assignment in taken:
+        print(f"skipping {assignment['week_start']} day {assignment['day_index']}: already taken", file=sys.stderr)
+    print(f"Imported {len(saved)} assignments, {len(taken)} days were already taken")
+    return 0
+
+
+def export_schedule(args):
+    """Write every assignment, archived weeks included, as CSV"""
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for line in app.export_schedule():
+            out.write(line)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def rebuild_stats(args):
+    """Recount the per-person statistics from the whole schedule, e.g. after editing the sheet by hand"""
+    slots = app.rebuild_stats()
+    if slots is None:
+        return 1
+    print(f"Counted {slots} assignments for {len(app.pickup_stats().people())} people")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenant", default=app.DEFAULT_TENANT_ID, choices=list(app.TENANTS),
+                        help="schedule to work on (default: default_tenant)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    commands.add_parser("build-index", help=build_index.__doc__).set_defaults(func=build_index)
+    
+    archive_parser = commands.add_parser("archive", help=archive.__doc__)
+    archive_parser.add_argument("--weeks", type=int, default=app.ARCHIVE_AFTER_WEEKS,
+                                help="archive weeks older than this many weeks (default: archive_after_weeks)")
+    archive_parser.set_defaults(func=archive)
+    
+    for name, func in (("import-people", import_people), ("import-schedule", import_schedule)):
+        import_parser = commands.add_parser(name, help=func.__doc__)
+        import_parser.add_argument("file", help="CSV file with a header row")
+        import_parser.add_argument("--dry-run", action="store_true", help="validate and report without writing")
+        import_parser.add_argument("--force", action="store_true", help="import the valid rows even if some are invalid")
+        import_parser.set_defaults(func=func)
+    
+    export_parser = commands.add_parser("export-schedule", help=export_schedule.__doc__)
+    export_parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    export_parser.set_defaults(func=export_schedule)
+    
+    commands.add_parser("rebuild-stats", help=rebuild_stats.__doc__).set_defaults(func=rebuild_stats)
+    
+    args = parser.parse_args(argv)
+    app.use_tenant(args.tenant)
+    status = args.func(args)
+    flush_journal()
+    return status
+
+
+def flush_journal():
+    """Replay journaled writes before exiting, so a one-off command's writes reach the sheet"""
+    storage = app.get_storage()
+    if not isinstance(storage, JournaledStorage):
+        return
+    app.write_journal().drain_once()
+    pending = storage.journal.stats()['pending']
+    if pending:
+        print(f"{pending} writes are still waiting in {storage.journal.path} - "
+              "they will be sent the next time the app runs", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
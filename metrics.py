@@ -0,0 +1,206 @@
+"""Timing and outcome records for every external call the app makes
+
+`CallRecorder.record()` is called around each gspread request and webhook
+post. Calls are attributed to the Streamlit rerun running on the current
+thread (see `CallRecorder.rerun()`); calls from worker threads are grouped
+under the "background" session. The admin page renders the aggregates and
+they can be exported as Prometheus text or logged as JSON lines.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND = 'background'
+
+
+def payload_size(value):
+    """Rough number of bytes a JSON-ish value takes on the wire, without serializing it"""
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value) + 2
+    if isinstance(value, (int, float, bool)):
+        return len(str(value))
+    if isinstance(value, dict):
+        return sum(payload_size(k) + payload_size(v) + 2 for k, v in value.items()) + 2
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(v) + 1 for v in value) + 2
+    return len(str(value))
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    position = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[position]
+
+
+class CallRecorder:
+    """Process-wide store of external call timings, aggregated per operation, rerun and session"""
+
+    def __init__(self, samples_per_op=1000, max_sessions=200, reruns_per_session=50, log_calls=False):
+        self.log_calls = log_calls
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._durations = defaultdict(lambda: deque(maxlen=samples_per_op))
+        self._totals = defaultdict(lambda: {'count': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0})
+        self._recent = deque()  # (timestamp, op) for the last minute, for quota estimates
+        self._errors = deque(maxlen=20)
+        self._sessions = OrderedDict()
+        self._max_sessions = max_sessions
+        self._reruns_per_session = reruns_per_session
+
+    # ---------------------------
+    # Rerun attribution
+    # ---------------------------
+
+    @contextmanager
+    def rerun(self, session_id):
+        """Attribute calls made on this thread to one rerun of `session_id`"""
+        if self._current_rerun() is not None:
+            # A fragment drawn inside a full rerun belongs to that rerun
+            yield self._current_rerun()
+            return
+        stats = {'started': time.time(), 'calls': 0, 'seconds': 0.0, 'bytes': 0, 'errors': 0}
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or deque(maxlen=self._reruns_per_session)
+            session.append(stats)
+            self._sessions[session_id] = session
+            while len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+        self._local.rerun = stats
+        started = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats['wall_seconds'] = time.perf_counter() - started
+            self._local.rerun = None
+
+    def _current_rerun(self):
+        return getattr(self._local, 'rerun', None)
+
+    # ---------------------------
+    # Recording
+    # ---------------------------
+
+    def record(self, op, seconds, nbytes=0, outcome='ok'):
+        """Store one external call"""
+        now = time.time()
+        failed = outcome != 'ok'
+        rerun = self._current_rerun()
+        with self._lock:
+            self._durations[op].append(seconds)
+            totals = self._totals[op]
+            totals['count'] += 1
+            totals['bytes'] += nbytes
+            totals['seconds'] += seconds
+            if failed:
+                totals['errors'] += 1
+                self._errors.append({'time': now, 'op': op, 'outcome': outcome})
+            self._recent.append((now, op))
+            while self._recent and self._recent[0][0] < now - 60:
+                self._recent.popleft()
+            if rerun is None:
+                session = self._sessions.setdefault(BACKGROUND, deque(maxlen=1))
+                if not session:
+                    session.append({'started': now, 'calls': 0, 'seconds': 0.0, 'bytes': 0, 'errors': 0})
+                rerun = session[-1]
+            rerun['calls'] += 1
+            rerun['seconds'] += seconds
+            rerun['bytes'] += nbytes
+            rerun['errors'] += int(failed)
+
+        if self.log_calls:
+            logger.info(json.dumps({'op': op, 'ms': round(seconds * 1000, 1), 'bytes': nbytes,
+                                    'outcome': outcome, 'rerun': rerun is not None}))
+
+    @contextmanager
+    def timed(self, op, request=None):
+        """Time a block; set `call.response` inside it so the response size is counted too"""
+        call = type('Call', (), {'response': None, 'outcome': 'ok'})()
+        started = time.perf_counter()
+        try:
+            yield call
+        except Exception as e:
+            call.outcome = f"error:{getattr(e, 'code', None) or type(e).__name__}"
+            raise
+        finally:
+            self.record(op, time.perf_counter() - started,
+                        payload_size(request) + payload_size(call.response), call.outcome)
+
+    # ---------------------------
+    # Reporting
+    # ---------------------------
+
+    def operations(self):
+        """Per-operation count, error count, bytes and p50/p95 latency in ms"""
+        with self._lock:
+            rows = []
+            for op, totals in sorted(self._totals.items()):
+                durations = sorted(self._durations[op])
+                rows.append({
+                    'op': op,
+                    'count': totals['count'],
+                    'errors': totals['errors'],
+                    'bytes': totals['bytes'],
+                    'p50_ms': round(_percentile(durations, 0.50) * 1000, 1),
+                    'p95_ms': round(_percentile(durations, 0.95) * 1000, 1),
+                })
+            return rows
+
+    def session_reruns(self, session_id):
+        """The recent reruns of one session, oldest first"""
+        with self._lock:
+            return [dict(rerun) for rerun in self._sessions.get(session_id, ())]
+
+    def calls_per_rerun(self):
+        """Average external calls per rerun across all recent user reruns"""
+        with self._lock:
+            reruns = [rerun for session_id, session in self._sessions.items()
+                      if session_id != BACKGROUND for rerun in session]
+        if not reruns:
+            return 0.0
+        return sum(rerun['calls'] for rerun in reruns) / len(reruns)
+
+    def calls_last_minute(self, prefix=''):
+        """External calls whose op starts with `prefix` in the last 60 seconds"""
+        cutoff = time.time() - 60
+        with self._lock:
+            return sum(1 for timestamp, op in self._recent if timestamp >= cutoff and op.startswith(prefix))
+
+    def recent_errors(self):
+        with self._lock:
+            return list(self._errors)
+
+    def prometheus_text(self, extra=None):
+        """Aggregates in the Prometheus text exposition format, one metric family at a time"""
+        families = [
+            ('pickup_external_calls_total', 'counter', "External calls made", 'count'),
+            ('pickup_external_errors_total', 'counter', "External calls that failed", 'errors'),
+            ('pickup_external_bytes_total', 'counter', "Approximate bytes on the wire in external calls", 'bytes'),
+            ('pickup_external_seconds_total', 'counter', "Time spent in external calls", 'seconds'),
+        ]
+        with self._lock:
+            totals = sorted(self._totals.items())
+            durations = {op: sorted(self._durations[op]) for op, _ in totals}
+
+        lines = []
+        for name, kind, help_text, field in families:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for op, op_totals in totals:
+                value = f"{op_totals[field]:.6f}" if field == 'seconds' else op_totals[field]
+                lines.append(f'{name}{{op="{op}"}} {value}')
+        lines += ["# HELP pickup_external_latency_seconds External call latency",
+                  "# TYPE pickup_external_latency_seconds summary"]
+        for op, _ in totals:
+            for quantile in (0.5, 0.95):
+                lines.append(f'pickup_external_latency_seconds{{op="{op}",quantile="{quantile}"}} '
+                             f"{_percentile(durations[op], quantile):.6f}")
+        for name, value in (extra or {}).items():
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
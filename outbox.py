@@ -0,0 +1,275 @@
+"""Durable outbox for Make.com webhook notifications
+
+Notifications are written to a local SQLite journal and delivered by a
+background worker, so the click handler never waits on the webhook and a
+failed delivery is retried instead of dropped.
+"""
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+DEAD = 'dead'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    -- Optional; a second message with the same key is not queued (e.g. one reminder batch per day)
+    dedupe_key TEXT,
+    -- When a worker claimed it for sending; a claim older than the lease is taken to be abandoned
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS messages_due ON messages (status, next_attempt_at);
+"""
+
+
+class Outbox:
+    """SQLite-backed webhook queue drained by a worker thread over a pooled HTTP session"""
+
+    def __init__(self, path, max_workers=4, max_attempts=6, base_delay=2.0,
+                 max_delay=300.0, timeout=10, lease=300.0, session=None, recorder=None):
+        self.path = path
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # Several processes may share the file: a message another worker claimed is only taken over
+        # once its claim is this old, so a live sender is never doubled (must be well above `timeout`)
+        self.lease = lease
+        # Optional metrics.CallRecorder timing every delivery attempt
+        self.recorder = recorder
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update({"Content-Type": "application/json"})
+        self.session = session
+
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+        self._executor = None
+
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            # Outboxes created before messages had dedupe keys
+            columns = [row[1] for row in db.execute("PRAGMA table_info(messages)")]
+            if 'dedupe_key' not in columns:
+                db.execute("ALTER TABLE messages ADD COLUMN dedupe_key TEXT")
+            if 'claimed_at' not in columns:
+                db.execute("ALTER TABLE messages ADD COLUMN claimed_at REAL")
+            db.execute("CREATE UNIQUE INDEX IF NOT EXISTS messages_dedupe_key ON messages (dedupe_key)")
+            # Messages left mid-delivery by a process that died are picked up again once their lease runs out
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection that commits on success and always closes"""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # ---------------------------
+    # Producer side
+    # ---------------------------
+
+    def enqueue(self, url, payload, dedupe_key=None):
+        """Persist a notification and wake the worker; returns the message id
+
+        With `dedupe_key`, a message already queued (or sent in the last week)
+        under the same key wins and None is returned.
+        """
+        now = time.time()
+        with self._db_lock, self._connect() as db:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO messages (url, payload, status, next_attempt_at, created_at, dedupe_key) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, json.dumps(payload, ensure_ascii=False), PENDING, now, now, dedupe_key)
+            )
+        if not cursor.rowcount:
+            return None
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def stats(self):
+        """Count messages per status"""
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM messages GROUP BY status").fetchall()
+        counts = {PENDING: 0, SENDING: 0, SENT: 0, DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def dead_letters(self, limit=50):
+        """Most recent notifications that gave up after all retries"""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, url, payload, attempts, last_error, created_at FROM messages "
+                "WHERE status = ? ORDER BY id DESC LIMIT ?", (DEAD, limit)
+            ).fetchall()
+        return [
+            {'id': row[0], 'url': row[1], 'payload': json.loads(row[2]), 'attempts': row[3],
+             'last_error': row[4], 'created_at': row[5]}
+            for row in rows
+        ]
+
+    def retry_dead(self):
+        """Put every dead letter back in the queue with a fresh attempt budget"""
+        with self._db_lock, self._connect() as db:
+            cursor = db.execute(
+                "UPDATE messages SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+                (PENDING, time.time(), DEAD)
+            )
+        self._wakeup.set()
+        return cursor.rowcount
+
+    def purge_sent(self, older_than=7 * 24 * 3600):
+        """Forget delivered messages older than `older_than` seconds"""
+        with self._db_lock, self._connect() as db:
+            db.execute("DELETE FROM messages WHERE status = ? AND sent_at < ?",
+                       (SENT, time.time() - older_than))
+
+    # ---------------------------
+    # Delivery side
+    # ---------------------------
+
+    def start(self):
+        """Start the background worker (idempotent)"""
+        if self._worker and self._worker.is_alive():
+            return
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='outbox-send')
+        self._worker = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout=5):
+        """Stop the worker; undelivered messages stay in the journal"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._worker:
+            self._worker.join(timeout)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+
+    def _run(self):
+        last_purge = 0
+        while not self._stopping.is_set():
+            try:
+                self.drain_once()
+                if time.time() - last_purge > 3600:
+                    self.purge_sent()
+                    last_purge = time.time()
+            except Exception:
+                logger.exception("Outbox worker iteration failed")
+            self._wakeup.wait(self._seconds_until_next_due())
+            self._wakeup.clear()
+
+    def _seconds_until_next_due(self):
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT MIN(CASE status WHEN ? THEN next_attempt_at ELSE COALESCE(claimed_at, 0) + ? END) "
+                "FROM messages WHERE status IN (?, ?)", (PENDING, self.lease, PENDING, SENDING)
+            ).fetchone()
+        if row[0] is None:
+            return 60
+        return min(60, max(0.05, row[0] - time.time()))
+
+    def _claim_due(self):
+        """Mark up to max_workers due messages as being sent and return them
+
+        The claim is one UPDATE inside a write transaction, so workers of
+        other processes sharing the file never claim the same message.
+        Messages whose claim is older than the lease count as due again.
+        """
+        now = time.time()
+        due = "(status = ? AND next_attempt_at <= ?) OR (status = ? AND COALESCE(claimed_at, 0) <= ?)"
+        params = (PENDING, now, SENDING, now - self.lease)
+        with self._db_lock, self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                f"UPDATE messages SET status = ?, claimed_at = ? WHERE ({due}) AND id IN "
+                f"(SELECT id FROM messages WHERE {due} ORDER BY id LIMIT ?) "
+                "RETURNING id, url, payload, attempts",
+                (SENDING, now) + params + params + (self.max_workers,)
+            ).fetchall()
+        return sorted(rows)
+
+    def drain_once(self):
+        """Deliver every message that is currently due; returns how many were attempted"""
+        attempted = 0
+        while not self._stopping.is_set():
+            batch = self._claim_due()
+            if not batch:
+                break
+            if self._executor:
+                list(self._executor.map(self._deliver, batch))
+            else:
+                for message in batch:
+                    self._deliver(message)
+            attempted += len(batch)
+        return attempted
+
+    def _deliver(self, message):
+        message_id, url, payload, attempts = message
+        attempts += 1
+        body = payload.encode('utf-8')
+        started = time.perf_counter()
+        try:
+            response = self.session.post(url, data=body, timeout=self.timeout)
+            self._record(started, len(body), 'ok' if response.ok else f"http:{response.status_code}")
+            if 200 <= response.status_code < 300:
+                self._mark(message_id, SENT, attempts, sent_at=time.time())
+                return
+            error = f"HTTP {response.status_code}"
+            # Other 4xx responses won't succeed on retry
+            permanent = 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+        except requests.RequestException as e:
+            self._record(started, len(body), f"error:{type(e).__name__}")
+            error = str(e)
+            permanent = False
+
+        if permanent or attempts >= self.max_attempts:
+            logger.warning("Webhook message %s dead after %s attempts: %s", message_id, attempts, error)
+            self._mark(message_id, DEAD, attempts, error=error)
+        else:
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            delay *= random.uniform(0.5, 1.5)
+            self._mark(message_id, PENDING, attempts, error=error, next_attempt_at=time.time() + delay)
+
+    def _record(self, started, nbytes, outcome):
+        if self.recorder is not None:
+            self.recorder.record('webhook.post', time.perf_counter() - started, nbytes, outcome)
+
+    def _mark(self, message_id, status, attempts, error='', next_attempt_at=None, sent_at=None):
+        with self._db_lock, self._connect() as db:
+            db.execute(
+                "UPDATE messages SET status = ?, attempts = ?, last_error = ?, "
+                "next_attempt_at = COALESCE(?, next_attempt_at), sent_at = ? WHERE id = ?",
+                (status, attempts, error, next_attempt_at, sent_at, message_id)
+            )
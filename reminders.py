@@ -0,0 +1,229 @@
+"""WhatsApp reminders: normalized phones, cached texts and links, and whole-period batches
+
+Phones are normalized to E.164 once, when the People list is loaded
+(`with_e164`), and reminder texts and wa.me links are rendered once per
+person and week by a `ReminderBook` instead of on every page draw. A week's
+or month's reminders can be collected in one go (`ReminderBook.collect`)
+and handed out as a single Make.com payload (`batch_payload`), a CSV list
+(`reminders_csv`) or sent every day at a fixed time by a
+`ReminderScheduler`.
+
+A reminder is a dict with 'week_start', 'day_index', 'date' (YYYY-MM-DD),
+'day_name', 'person_name', 'phone' (E.164), 'text' and 'link'.
+"""
+import csv
+import io
+import logging
+import re
+import threading
+import urllib.parse
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from autoschedule import DAY_NAMES, slot_date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COUNTRY_CODE = "972"
+
+REMINDER_COLUMNS = ('date', 'day_name', 'person_name', 'phone', 'text', 'link')
+
+
+# ===========================
+# Phones and links
+# ===========================
+
+@lru_cache(maxsize=4096)
+def e164(phone, country_code=DEFAULT_COUNTRY_CODE):
+    """'050-123 4567' -> '+972501234567'; '' if there are no digits
+
+    Numbers written with + or 00, or already starting with the country
+    code, keep the country code they have.
+    """
+    text = str(phone or '').strip()
+    digits = re.sub(r'\D', '', text)
+    if not digits:
+        return ''
+    if text.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    if not digits.startswith(country_code):
+        digits = country_code + (digits[1:] if digits.startswith('0') else digits)
+    return '+' + digits
+
+
+def with_e164(people, country_code=DEFAULT_COUNTRY_CODE):
+    """Add 'phone_e164' to People rows - done when the list is loaded, so renders never re-parse phones"""
+    for person in people:
+        person['phone_e164'] = e164(person.get('phone'), country_code)
+    return people
+
+
+def whatsapp_link(phone, text):
+    """wa.me link opening a chat with `phone` (E.164) with `text` typed in"""
+    return f"https://wa.me/{phone.lstrip('+')}?text={urllib.parse.quote(text)}"
+
+
+# ===========================
+# Rendering
+# ===========================
+
+class ReminderBook:
+    """Reminders rendered once per (person, phone, week) and kept in an LRU
+
+    `render_text(name, day_name, date)` is the tenant's template
+    (`Tenant.reminder`). Entries never go stale: a reminder depends only on
+    the person, their phone and the day, which are all part of its key.
+    """
+
+    def __init__(self, render_text, country_code=DEFAULT_COUNTRY_CODE, maxsize=2048):
+        self.country_code = country_code
+        self.maxsize = maxsize
+        self.renders = 0
+        self._render_text = render_text
+        self._weeks = OrderedDict()  # (person_name, phone, week_start) -> {day_index: reminder}
+        self._lock = threading.Lock()
+
+    def phone_of(self, assignment, phones):
+        """The phone to remind: the person's current one from People, else the one saved with the assignment"""
+        return phones.get(assignment['person_name']) or e164(assignment.get('person_phone'), self.country_code)
+
+    def reminder(self, week_start, day_index, person_name, phone):
+        """The reminder for one assigned day, or None without a phone"""
+        if not phone:
+            return None
+        key = (person_name, phone, week_start)
+        with self._lock:
+            week = self._weeks.get(key)
+            if week is None:
+                week = self._weeks[key] = {}
+                while len(self._weeks) > self.maxsize:
+                    self._weeks.popitem(last=False)
+            else:
+                self._weeks.move_to_end(key)
+            reminder = week.get(day_index)
+        if reminder is not None:
+            return reminder
+
+        date = slot_date(week_start, day_index)
+        day_name = DAY_NAMES[day_index]
+        text = self._render_text(person_name, day_name, datetime.strptime(date, "%Y-%m-%d").strftime("%d/%m"))
+        reminder = {'week_start': week_start, 'day_index': day_index, 'date': date, 'day_name': day_name,
+                    'person_name': person_name, 'phone': phone, 'text': text, 'link': whatsapp_link(phone, text)}
+        with self._lock:
+            week[day_index] = reminder
+            self.renders += 1
+        return reminder
+
+    def collect(self, weeks, phones, first=None, last=None):
+        """Reminders for every assigned day of `weeks` ({week_start: schedule}) between `first` and `last`
+        (YYYY-MM-DD, inclusive), in date order
+
+        `phones` is {person_name: E.164 phone} from the People list.
+        """
+        reminders = []
+        for week_start in sorted(weeks):
+            for day_index, assignment in sorted(weeks[week_start].items()):
+                date = slot_date(week_start, day_index)
+                if (first and date < first) or (last and date > last):
+                    continue
+                reminder = self.reminder(week_start, day_index, assignment['person_name'],
+                                         self.phone_of(assignment, phones))
+                if reminder is not None:
+                    reminders.append(reminder)
+        return reminders
+
+
+# ===========================
+# Batches
+# ===========================
+
+def reminders_csv(reminders):
+    """The reminders as CSV text, one row per assigned day"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REMINDER_COLUMNS)
+    for reminder in reminders:
+        writer.writerow([reminder[column] for column in REMINDER_COLUMNS])
+    return buffer.getvalue()
+
+
+def batch_payload(reminders, first, last, app_url=''):
+    """One Make.com webhook body carrying every reminder of a period"""
+    return {
+        "type": "reminders",
+        "from": first,
+        "to": last,
+        "count": len(reminders),
+        "reminders": [{column: reminder[column] for column in REMINDER_COLUMNS} for reminder in reminders],
+        "app_url": app_url,
+    }
+
+
+def parse_send_time(text):
+    """"18:30" -> (18, 30); None when empty (scheduled sends off); ValueError when not HH:MM"""
+    text = str(text or '').strip()
+    if not text:
+        return None
+    try:
+        send_at = datetime.strptime(text, "%H:%M")
+    except ValueError:
+        raise ValueError(f"reminders_send_at must be HH:MM (24-hour), got {text!r}") from None
+    return send_at.hour, send_at.minute
+
+
+class ReminderScheduler:
+    """Background thread calling `send(date)` once a day at `send_at`, for the day `days_ahead` days later
+
+    `send` should be idempotent per date (the outbox's dedupe key makes it
+    so), because every process of a deployment runs its own scheduler and a
+    restart after the send time sends again.
+    """
+
+    def __init__(self, send_at, send, days_ahead=1, interval=60, clock=datetime.now):
+        self.send_at = send_at
+        self.days_ahead = days_ahead
+        self.interval = interval
+        self.last_sent = None
+        self._send = send
+        self._clock = clock
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def due(self):
+        """The date to send reminders for now, or None if today's batch went out or it is too early"""
+        now = self._clock()
+        if self.last_sent == now.date() or (now.hour, now.minute) < self.send_at:
+            return None
+        return (now + timedelta(days=self.days_ahead)).strftime("%Y-%m-%d")
+
+    def run_once(self):
+        date = self.due()
+        if date is None:
+            return
+        self._send(date)
+        self.last_sent = self._clock().date()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # Tried again at the next tick
+                logger.exception("Scheduled reminders failed")
+            self._stopping.wait(self.interval)
@@ -0,0 +1,221 @@
+"""Quota-aware scheduler for Google Sheets API calls
+
+Every Sheets request from the process goes through one `RequestScheduler`,
+which keeps us inside the per-minute read/write quotas with token buckets,
+hands free request slots to writes before reads, retries quota errors with
+jittered exponential backoff and lets identical concurrent reads share one
+request.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+
+READ = 'read'
+WRITE = 'write'
+
+# Lower number = served first
+_PRIORITY = {WRITE: 0, READ: 1}
+
+RETRYABLE_STATUS = (500, 502, 503, 504)
+
+
+def _status_code(error):
+    """HTTP status of a gspread APIError (or anything carrying a response), else None"""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, if it said so"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate_per_minute`"""
+
+    def __init__(self, rate_per_minute, burst, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self._clock = clock
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    def wait_time(self):
+        """Seconds until a token is available (0 if one is available now)"""
+        now = self._refill()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """Stop handing out tokens for a while (after the server said we're over quota)"""
+        now = self._refill()
+        self.tokens = 0.0
+        self._paused_until = max(self._paused_until, now + seconds)
+
+
+class _Flight:
+    """A read in progress that other callers with the same key can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestScheduler:
+    """Rate limits, prioritizes, retries and coalesces Sheets requests for the whole process"""
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, burst=10, max_concurrency=4,
+                 max_retries=5, base_delay=1.0, max_delay=32.0, clock=time.monotonic, sleep=time.sleep):
+        self.buckets = {
+            READ: TokenBucket(reads_per_minute, burst, clock),
+            WRITE: TokenBucket(writes_per_minute, burst, clock),
+        }
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+
+        self._cond = threading.Condition()
+        self._waiting = []  # heap of (priority, seq, kind)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+        self.stats = {
+            'requests': 0, 'reads': 0, 'writes': 0, 'coalesced': 0,
+            'throttled': 0, 'quota_errors': 0, 'retries': 0, 'failures': 0,
+        }
+
+    # ---------------------------
+    # Admission
+    # ---------------------------
+
+    def _next_runnable(self):
+        """The highest-priority waiter whose bucket has a token right now, and the shortest wait otherwise"""
+        shortest = None
+        for ticket in sorted(self._waiting):
+            wait = self.buckets[ticket[2]].wait_time()
+            if wait == 0:
+                return ticket, 0.0
+            shortest = wait if shortest is None else min(shortest, wait)
+        return None, shortest
+
+    def _acquire(self, kind):
+        ticket = (_PRIORITY[kind], next(self._seq), kind)
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            throttled = False
+            try:
+                while True:
+                    if self._in_flight < self.max_concurrency:
+                        runnable, wait = self._next_runnable()
+                        if runnable == ticket:
+                            self.buckets[kind].take()
+                            self._in_flight += 1
+                            return
+                    else:
+                        wait = None
+                    throttled = True
+                    self._cond.wait(wait if wait else 1.0)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                if throttled:
+                    self.stats['throttled'] += 1
+                self._cond.notify_all()
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    # ---------------------------
+    # Execution
+    # ---------------------------
+
+    def _backoff(self, attempt, error):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after else delay
+
+    def _execute(self, fn, kind):
+        for attempt in range(self.max_retries + 1):
+            self._acquire(kind)
+            try:
+                self.stats['requests'] += 1
+                self.stats[kind + 's'] += 1
+                return fn()
+            except Exception as e:
+                status = _status_code(e)
+                if status == 429:
+                    self.stats['quota_errors'] += 1
+                # 429 means nothing was done; other server errors are only safe to retry for reads
+                retryable = status == 429 or (kind == READ and status in RETRYABLE_STATUS)
+                if not retryable or attempt == self.max_retries:
+                    self.stats['failures'] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                if status == 429:
+                    # Everyone of this kind backs off, not just this caller
+                    with self._cond:
+                        self.buckets[kind].pause(delay)
+                self.stats['retries'] += 1
+            finally:
+                self._release()
+            self._sleep(delay)
+
+    def run(self, fn, kind=READ, key=None):
+        """Run `fn()` under the quota; reads with the same `key` in flight share one request"""
+        if kind != READ or key is None:
+            return self._execute(fn, kind)
+
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self.stats['coalesced'] += 1
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._execute(fn, kind)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
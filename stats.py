@@ -0,0 +1,241 @@
+"""Per-person pickup statistics, kept up to date by every schedule write
+
+`StatsStore` is a local SQLite summary of the schedule: pickups per person,
+per weekday and per month, the last date each person was assigned and their
+streaks of consecutive weeks. Every write the app makes is recorded as it
+happens, so the admin dashboard reads one row per person instead of
+scanning the whole Schedule history.
+
+The store also mirrors who holds each slot, which makes recording
+idempotent - recording a slot with the person it already has changes
+nothing, and overwriting or clearing a slot knows whose counts to take it
+from. It is built from the full schedule once (or on demand, when the sheet
+was edited by hand) and maintained incrementally after that.
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from autoschedule import slot_date
+
+# Every day a week can hold: the app books Sunday-Friday, but the Schedule tab and the storage API
+# take any day of the week, and a Saturday row must be counted like the rest
+DAYS_PER_WEEK = 7
+_DAY_COLUMNS = [f"day_{day_index}" for day_index in range(DAYS_PER_WEEK)]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS slots (
+    week_start TEXT NOT NULL,
+    day_index INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    person_name TEXT NOT NULL,
+    PRIMARY KEY (week_start, day_index)
+);
+CREATE INDEX IF NOT EXISTS slots_person ON slots (person_name, week_start);
+
+CREATE TABLE IF NOT EXISTS people (
+    person_name TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    {', '.join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in _DAY_COLUMNS)},
+    last_date TEXT NOT NULL DEFAULT '',
+    -- Consecutive weeks with a pickup: the run ending at their latest week, and the longest ever
+    streak INTEGER NOT NULL DEFAULT 0,
+    streak_end TEXT NOT NULL DEFAULT '',
+    longest_streak INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS months (
+    person_name TEXT NOT NULL,
+    month TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (person_name, month)
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_PEOPLE_COLUMNS = ['person_name', 'total'] + _DAY_COLUMNS + ['last_date', 'streak', 'streak_end', 'longest_streak']
+
+
+def _checked_day(day_index):
+    """`day_index` as an int, or ValueError if it isn't a day of the week"""
+    day_index = int(day_index)
+    if not 0 <= day_index < DAYS_PER_WEEK:
+        raise ValueError(f"day_index {day_index} is outside the week (0-{DAYS_PER_WEEK - 1})")
+    return day_index
+
+
+def _streaks(week_starts):
+    """(length of the run ending at the last week, longest run) for sorted YYYY-MM-DD week starts"""
+    run = longest = 0
+    previous = None
+    for week_start in week_starts:
+        week = datetime.strptime(week_start, "%Y-%m-%d")
+        run = run + 1 if previous is not None and week - previous == timedelta(weeks=1) else 1
+        longest = max(longest, run)
+        previous = week
+    return run, longest
+
+
+class StatsStore:
+    """SQLite summary of who picked up when, updated one slot at a time"""
+
+    def __init__(self, path):
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        # Slots recorded while a rebuild reads the schedule, re-applied on top of what it read
+        self._recorded_during_rebuild = None
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+            # Stores created with fewer day columns get the missing ones; their counts need a rebuild
+            existing = {row[1] for row in db.execute("PRAGMA table_info(people)")}
+            missing = [column for column in _DAY_COLUMNS if column not in existing]
+            for column in missing:
+                db.execute(f"ALTER TABLE people ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+            if missing:
+                db.execute("DELETE FROM meta WHERE key = 'built_at'")
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection that commits on success and always closes"""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    # ---------------------------
+    # Writes
+    # ---------------------------
+
+    def record(self, week_start, day_index, person_name):
+        """The slot now belongs to `person_name` (None or '' = cleared); ValueError for a day outside the week"""
+        day_index = _checked_day(day_index)
+        with self._db_lock:
+            if self._recorded_during_rebuild is not None:
+                self._recorded_during_rebuild.append((week_start, day_index, person_name))
+            with self._connect() as db:
+                self._set_slot(db, week_start, day_index, person_name or None)
+
+    def _set_slot(self, db, week_start, day_index, person_name):
+        row = db.execute("SELECT person_name FROM slots WHERE week_start = ? AND day_index = ?",
+                         (week_start, day_index)).fetchone()
+        previous = row[0] if row else None
+        if previous == person_name:
+            return
+        date = slot_date(week_start, day_index)
+        if previous:
+            db.execute("DELETE FROM slots WHERE week_start = ? AND day_index = ?", (week_start, day_index))
+            self._count(db, previous, day_index, date, -1)
+        if person_name:
+            db.execute("INSERT INTO slots (week_start, day_index, date, person_name) VALUES (?, ?, ?, ?)",
+                       (week_start, day_index, date, person_name))
+            self._count(db, person_name, day_index, date, 1)
+        for name in {previous, person_name} - {None}:
+            self._refresh_person(db, name)
+
+    def _count(self, db, person_name, day_index, date, delta):
+        """Add `delta` to a person's total, weekday and month counters"""
+        day_column = _DAY_COLUMNS[day_index]
+        db.execute("INSERT INTO people (person_name) VALUES (?) ON CONFLICT (person_name) DO NOTHING", (person_name,))
+        db.execute(f"UPDATE people SET total = total + ?, {day_column} = {day_column} + ? WHERE person_name = ?",
+                   (delta, delta, person_name))
+        db.execute("INSERT INTO months (person_name, month, count) VALUES (?, ?, ?) "
+                   "ON CONFLICT (person_name, month) DO UPDATE SET count = count + excluded.count",
+                   (person_name, date[:7], delta))
+        db.execute("DELETE FROM months WHERE person_name = ? AND count <= 0", (person_name,))
+        db.execute("DELETE FROM people WHERE person_name = ? AND total <= 0", (person_name,))
+
+    def _refresh_person(self, db, person_name):
+        """Recompute a person's last date and streaks from their own slots (a removal can break a run)"""
+        weeks = [row[0] for row in db.execute(
+            "SELECT DISTINCT week_start FROM slots WHERE person_name = ? ORDER BY week_start", (person_name,)
+        )]
+        if not weeks:
+            return
+        last_date, = db.execute("SELECT MAX(date) FROM slots WHERE person_name = ?", (person_name,)).fetchone()
+        streak, longest = _streaks(weeks)
+        db.execute("UPDATE people SET last_date = ?, streak = ?, streak_end = ?, longest_streak = ? "
+                   "WHERE person_name = ?", (last_date, streak, weeks[-1], longest, person_name))
+
+    def rebuild(self, assignments):
+        """Replace everything with the schedule in `assignments` (`Storage.iter_schedule()`); returns the slot count"""
+        with self._rebuild_lock:
+            with self._db_lock:
+                self._recorded_during_rebuild = []
+            try:
+                slots = {(assignment['week_start'], _checked_day(assignment['day_index'])): assignment['person_name']
+                         for assignment in assignments}
+            except Exception:
+                with self._db_lock:
+                    self._recorded_during_rebuild = None
+                raise
+
+            with self._db_lock, self._connect() as db:
+                # Writes made while we were reading are newer than what we read
+                for week_start, day_index, person_name in self._recorded_during_rebuild:
+                    slots[(week_start, day_index)] = person_name
+                self._recorded_during_rebuild = None
+
+                for table in ('slots', 'people', 'months'):
+                    db.execute(f"DELETE FROM {table}")
+                db.executemany(
+                    "INSERT INTO slots (week_start, day_index, date, person_name) VALUES (?, ?, ?, ?)",
+                    [(week_start, day_index, slot_date(week_start, day_index), person_name)
+                     for (week_start, day_index), person_name in slots.items() if person_name]
+                )
+                db.execute(
+                    f"INSERT INTO people (person_name, total, {', '.join(_DAY_COLUMNS)}) "
+                    f"SELECT person_name, COUNT(*), "
+                    f"{', '.join(f'SUM(day_index = {day_index})' for day_index in range(DAYS_PER_WEEK))} "
+                    "FROM slots GROUP BY person_name"
+                )
+                db.execute("INSERT INTO months (person_name, month, count) "
+                           "SELECT person_name, substr(date, 1, 7), COUNT(*) FROM slots GROUP BY 1, 2")
+                for person_name, in db.execute("SELECT person_name FROM people").fetchall():
+                    self._refresh_person(db, person_name)
+                db.execute("INSERT INTO meta (key, value) VALUES ('built_at', ?) "
+                           "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (str(time.time()),))
+                return db.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+
+    # ---------------------------
+    # Reads - one row per person (or per person and month), never the history
+    # ---------------------------
+
+    def mark_stale(self):
+        """Forget the last rebuild, so the next dashboard load recounts from the schedule"""
+        with self._connect() as db:
+            db.execute("DELETE FROM meta WHERE key = 'built_at'")
+
+    def built_at(self):
+        """When the store was last rebuilt from the full schedule (epoch seconds), or None if never"""
+        with self._connect() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def people(self):
+        """[{'person_name', 'total', 'days': [count per weekday], 'last_date', 'streak', 'streak_end',
+        'longest_streak'}] for everyone with at least one pickup, most pickups first"""
+        with self._connect() as db:
+            rows = db.execute(f"SELECT {', '.join(_PEOPLE_COLUMNS)} FROM people "
+                              "ORDER BY total DESC, person_name").fetchall()
+        people = []
+        for row in rows:
+            person = dict(zip(_PEOPLE_COLUMNS, row))
+            person['days'] = [person.pop(column) for column in _DAY_COLUMNS]
+            people.append(person)
+        return people
+
+    def months(self, since):
+        """[(month, person_name, count)] for months from `since` (YYYY-MM) on"""
+        with self._connect() as db:
+            return db.execute("SELECT month, person_name, count FROM months WHERE month >= ? "
+                              "ORDER BY month, person_name", (since,)).fetchall()
@@ -0,0 +1,1249 @@
+"""Storage backends for the people list and the weekly schedule
+
+`SheetsStorage` keeps everything in a Google spreadsheet (or a
+`fake_sheets.FakeSpreadsheet` for offline runs) and `SQLiteStorage` keeps it
+in a local database. Backends raise on failure; the Streamlit layer turns
+errors into messages and owns the shared read cache.
+"""
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from request_scheduler import READ, WRITE
+
+logger = logging.getLogger(__name__)
+
+# Access tokens are valid for an hour - refresh them a few minutes early
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# People columns the auto-scheduler reads when they exist (see autoschedule.py)
+PEOPLE_OPTIONAL_COLUMNS = ('available_days', 'blackout_dates', 'max_per_week')
+PEOPLE_COLUMNS = ('name', 'phone', 'email') + PEOPLE_OPTIONAL_COLUMNS
+
+# Worksheet methods that only read - everything else counts against the write quota
+READ_METHODS = {'get_all_values', 'get_all_records', 'batch_get', 'get', 'row_values', 'col_values', 'acell', 'cell'}
+
+# The ScheduleIndex tab maps each week to the Schedule rows holding its days
+# ("0:12,3:20" = Sunday is on row 12, Wednesday on row 20) so loading a week
+# reads only those rows instead of the whole history.
+SCHEDULE_INDEX_TAB = "ScheduleIndex"
+
+# Weeks older than the archive horizon move to one tab per year ("Schedule_2025"), and the
+# index's third column says which tab a week lives in (blank = the live Schedule tab)
+ARCHIVE_TAB_PREFIX = "Schedule_"
+
+
+def archive_tab(week_start):
+    """The archive tab a week is moved to"""
+    return f"{ARCHIVE_TAB_PREFIX}{week_start[:4]}"
+
+
+class SheetFormatError(Exception):
+    """A tab is missing the header columns we rely on"""
+
+
+class SlotConflictError(Exception):
+    """A schedule slot changed between when the user saw it and when they tried to change it"""
+
+    def __init__(self, week_start, day_index, current):
+        super().__init__(f"slot {week_start}/{day_index} was changed by someone else")
+        self.week_start = week_start
+        self.day_index = int(day_index)
+        # What the slot holds now - an assignment dict, or None if it is empty
+        self.current = current
+
+
+def check_expected_version(week_start, day_index, current, expected_version):
+    """Raise SlotConflictError unless the slot is still in the state the caller saw
+
+    `expected_version` None skips the check, 0 means "the slot was empty" and
+    anything else is the version of the assignment the caller saw.
+    """
+    if expected_version is None:
+        return
+    if expected_version == 0:
+        unchanged = current is None
+    else:
+        unchanged = current is not None and current.get('version') == expected_version
+    if not unchanged:
+        raise SlotConflictError(week_start, day_index, current)
+
+
+class SlotLocks:
+    """Striped locks, so writes to the same slot queue up without serializing different slots"""
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _stripe(self, week_start, day_index):
+        return hash((week_start, int(day_index))) % len(self._locks)
+
+    def __call__(self, week_start, day_index):
+        return self._locks[self._stripe(week_start, day_index)]
+
+    @contextmanager
+    def many(self, slots):
+        """Hold the locks of several (week_start, day_index) slots, taken in a fixed order so writers can't deadlock"""
+        with self._hold(sorted({self._stripe(week_start, day_index) for week_start, day_index in slots})):
+            yield
+
+    def all(self):
+        """Hold every slot lock (for rewriting the whole tab)"""
+        return self._hold(range(len(self._locks)))
+
+    @contextmanager
+    def _hold(self, stripes):
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
+
+
+class Storage:
+    """Interface every backend implements"""
+
+    def load_people(self):
+        """Return [{'name', 'phone', 'email', ...PEOPLE_OPTIONAL_COLUMNS}, ...] in sheet order"""
+        raise NotImplementedError
+
+    def save_person(self, name, phone, email=''):
+        """Add a person"""
+        raise NotImplementedError
+
+    def save_people(self, people):
+        """Add many people (dicts with PEOPLE_COLUMNS keys) - backends override this to write them at once"""
+        for person in people:
+            self.save_person(person['name'], person.get('phone', ''), person.get('email', ''))
+
+    def delete_person(self, name):
+        """Delete a person by name; returns False if there was no such person"""
+        raise NotImplementedError
+
+    def load_schedule(self, week_start):
+        """Return {day_index: {'person_name', 'person_phone', 'person_email', 'version'}} for one week"""
+        raise NotImplementedError
+
+    def load_schedule_weeks(self, week_starts):
+        """Return {week_start: schedule} for several weeks - backends override this to use one read"""
+        return {week_start: self.load_schedule(week_start) for week_start in week_starts}
+
+    def load_slot(self, week_start, day_index):
+        """Return the assignment for one day, or None - backends override this to read a single row"""
+        return self.load_schedule(week_start).get(int(day_index))
+
+    def verify_slot(self, week_start, day_index, expected_version):
+        """Raise SlotConflictError unless the stored slot is as `expected_version` says, reading it fresh"""
+        check_expected_version(week_start, day_index, self.load_slot(week_start, day_index), expected_version)
+
+    def save_assignment(self, week_start, day_index, person_name, person_phone, person_email='',
+                        expected_version=None):
+        """Assign a person to a day and return the stored assignment
+
+        With `expected_version` (see `check_expected_version`) the write only
+        happens if the slot hasn't changed, otherwise SlotConflictError is raised.
+        """
+        raise NotImplementedError
+
+    def clear_assignment(self, week_start, day_index, expected_version=None):
+        """Remove the assignment for a day and return it (None if it was empty), compare-and-set like save_assignment"""
+        raise NotImplementedError
+
+    def fill_slots(self, assignments):
+        """Write many assignments into empty slots at once
+
+        `assignments` are dicts with 'week_start', 'day_index', 'person_name',
+        'person_phone' and 'person_email'. Returns (saved, taken): the stored
+        assignments (with their version) and the ones whose slot was filled
+        by someone else in the meantime. Backends override this to batch the writes.
+        """
+        saved, taken = [], []
+        for assignment in assignments:
+            try:
+                stored = self.save_assignment(assignment['week_start'], assignment['day_index'],
+                                              assignment['person_name'], assignment['person_phone'],
+                                              assignment['person_email'], expected_version=0)
+                saved.append(dict(assignment, version=stored['version']))
+            except SlotConflictError:
+                taken.append(assignment)
+        return saved, taken
+
+    def iter_schedule(self):
+        """Yield {'week_start', 'day_index', 'person_name', 'person_phone', 'person_email'} for every assignment"""
+        raise NotImplementedError
+
+    def iter_assignments(self):
+        """Yield (week_start, day_index, person_name) for every assignment ever made"""
+        for assignment in self.iter_schedule():
+            yield assignment['week_start'], assignment['day_index'], assignment['person_name']
+
+    def archive(self, before_week):
+        """Move weeks before `before_week` out of the live data and drop blank rows
+
+        Cleared slots keep their row and version stamp, so compare-and-set
+        can't mistake a later assignment for an earlier one. Archived weeks stay readable through the normal load methods.
+        Returns (archived, dropped) row counts.
+        """
+        raise NotImplementedError
+
+
+# ===========================
+# Google Sheets
+# ===========================
+
+def _is_auth_error(error):
+    """Check whether an exception means our token was rejected"""
+    # gspread takes a third of a second to import, so it's imported where it's used rather than at
+    # startup - by the time a Sheets call has failed it is loaded anyway, and SQLite never needs it
+    import gspread
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.code == 401
+    return type(error).__name__ == 'RefreshError'
+
+
+class SheetsConnection:
+    """Shared spreadsheet handle with cached worksheets, token refresh and reconnect on 401"""
+
+    def __init__(self, connect, scheduler=None, recorder=None, on_auth_error=None):
+        # connect() -> (client or None, spreadsheet)
+        self._connect = connect
+        # on_auth_error(client): our credentials were rejected. connect() may hand out a client shared
+        # with other connections, which has to be rebuilt too or the reconnect would reuse its token
+        self.on_auth_error = on_auth_error
+        # Optional request_scheduler.RequestScheduler shared by every connection in the process
+        self.scheduler = scheduler
+        # Optional metrics.CallRecorder timing every call
+        self.recorder = recorder
+        self._lock = threading.RLock()
+        self.client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+
+    def reset(self):
+        """Drop the connection so the next call re-authorizes"""
+        with self._lock:
+            self.client = None
+            self._spreadsheet = None
+            self._worksheets = {}
+
+    def _auth_failed(self):
+        """Reconnect from scratch on the next call, with whatever credentials connect() gives out then"""
+        with self._lock:
+            client = self.client
+            self.reset()
+        if self.on_auth_error:
+            self.on_auth_error(client)
+
+    def _refresh_token_if_needed(self):
+        """Refresh the access token before it expires instead of waiting for a 401"""
+        auth = getattr(getattr(self.client, 'http_client', None), 'auth', None)
+        if auth is None:
+            return
+
+        expiry = getattr(auth, 'expiry', None)
+        if not auth.token or (expiry and expiry - TOKEN_REFRESH_MARGIN <= datetime.utcnow()):
+            self.client.http_client.login()
+
+    def spreadsheet(self):
+        """Return the spreadsheet handle, connecting on first use"""
+        with self._lock:
+            try:
+                if self._spreadsheet is None:
+                    self.client, self._spreadsheet = self._connect()
+                    self._worksheets = {}
+                else:
+                    self._refresh_token_if_needed()
+                return self._spreadsheet
+            except Exception as e:
+                if _is_auth_error(e):
+                    self._auth_failed()
+                else:
+                    self.reset()
+                raise
+
+    def worksheet(self, title):
+        """Return a cached worksheet handle so we don't re-fetch metadata on every call"""
+        spreadsheet = self.spreadsheet()
+        with self._lock:
+            worksheet = self._worksheets.get(title)
+            if worksheet is None:
+                worksheet = spreadsheet.worksheet(title)
+                self._worksheets[title] = worksheet
+            return worksheet
+
+    def _call_once(self, title, method, args, kwargs):
+        """Call a worksheet method (a spreadsheet method when `title` is None), reconnecting once on auth failure"""
+        for attempt in range(2):
+            try:
+                target = self.worksheet(title) if title is not None else self.spreadsheet()
+                return getattr(target, method)(*args, **kwargs)
+            except Exception as e:
+                if attempt or not _is_auth_error(e):
+                    raise
+                if self._spreadsheet is not None:
+                    # Turned down by the call itself - a failed connect has started over already
+                    self._auth_failed()
+
+    def _schedule(self, kind, title, method, args, kwargs, coalesce=True):
+        """Call a worksheet method through the request scheduler when there is one"""
+        if self.scheduler is None:
+            return self._call_once(title, method, args, kwargs)
+
+        # Identical reads running at the same time (e.g. two sessions loading one week) share a request
+        key = None
+        if kind == READ and coalesce:
+            key = (id(self), title, method, repr(args), repr(sorted(kwargs.items())))
+        return self.scheduler.run(lambda: self._call_once(title, method, args, kwargs), kind=kind, key=key)
+
+    def call(self, title, method, *args, coalesce=True, **kwargs):
+        """Call a worksheet method - scheduled, retried and timed
+
+        `coalesce=False` makes a read its own request: reads made under a slot
+        lock to check a version must not reuse a response that was already in
+        flight before the lock was taken.
+        """
+        kind = READ if method in READ_METHODS else WRITE
+        if self.recorder is None:
+            return self._schedule(kind, title, method, args, kwargs, coalesce)
+
+        request = [args, kwargs] if kind == WRITE else None
+        with self.recorder.timed(f"sheets.{kind}.{method}", request) as timed_call:
+            timed_call.response = self._schedule(kind, title, method, args, kwargs, coalesce)
+        return timed_call.response
+
+    def modified_time(self):
+        """Drive's modifiedTime for the spreadsheet - it moves on every edit, ours or anyone else's"""
+        # A Drive metadata request: it isn't charged to the Sheets quota, so it skips the scheduler
+        if self.recorder is None:
+            return self._call_once(None, "get_lastUpdateTime", (), {})
+        with self.recorder.timed("drive.read.get_lastUpdateTime") as timed_call:
+            timed_call.response = self._call_once(None, "get_lastUpdateTime", (), {})
+        return timed_call.response
+
+
+class WeekIndex(dict):
+    """week_start -> {day_index: row_number}, remembering which ScheduleIndex row holds each week
+
+    `tabs` maps archived weeks to their archive tab; every other week is in "Schedule".
+    """
+
+    def __init__(self, *args, positions=None, tabs=None):
+        super().__init__(*args)
+        self.positions = positions or {}
+        self.tabs = tabs or {}
+
+    def tab(self, week_start):
+        return self.tabs.get(week_start, "Schedule")
+
+
+def _schedule_columns(headers):
+    """Find the Schedule column positions, raising SheetFormatError if any are missing"""
+    try:
+        return {
+            'week_start': headers.index('week_start'),
+            'day_index': headers.index('day_index'),
+            'person_name': headers.index('person_name'),
+            'person_phone': headers.index('person_phone'),
+            # Email column is optional
+            'person_email': headers.index('person_email') if 'person_email' in headers else None,
+            # So is the version stamp - it must be column F, right after the values we write
+            'version': 5 if headers[5:6] == ['version'] else None
+        }
+    except ValueError as e:
+        raise SheetFormatError(f"חסרות כותרות בטאב Schedule: {str(e)}")
+
+
+def _parse_schedule_rows(headers, rows, week_start):
+    """Build the {day_index: assignment} dictionary for one week from raw rows"""
+    cols = _schedule_columns(headers)
+
+    schedule = {}
+    for row in rows:
+        # batch_get doesn't pad rows, so short rows just have empty trailing cells
+        row = list(row) + [''] * (len(headers) - len(row))
+        # Cleared slots keep their row with a blank name so it can be reused
+        if row[cols['week_start']] == week_start and row[cols['day_index']] and row[cols['person_name']]:
+            try:
+                day_idx = int(row[cols['day_index']])
+                assignment = {
+                    'person_name': row[cols['person_name']],
+                    'person_phone': row[cols['person_phone']]
+                }
+                # Add email if column exists
+                if cols['person_email'] is not None:
+                    assignment['person_email'] = row[cols['person_email']]
+                else:
+                    assignment['person_email'] = ''
+                assignment['version'] = _row_version(cols, row) if cols['version'] is not None else None
+                schedule[day_idx] = assignment
+            except (ValueError, IndexError):
+                continue
+
+    return schedule
+
+
+def _row_version(cols, row):
+    """The version stamp of a Schedule row - rows written before stamps existed count as version 1"""
+    if cols['version'] is None:
+        return 0
+    try:
+        return int(row[cols['version']] or 1) if len(row) > cols['version'] else 1
+    except ValueError:
+        return 1
+
+
+def _is_slot_row(cols, row, week_start, day_index):
+    """Whether a Schedule row belongs to this week/day"""
+    return (len(row) > max(cols['week_start'], cols['day_index'])
+            and row[cols['week_start']] == week_start and str(row[cols['day_index']]) == str(day_index))
+
+
+def _build_week_index(all_values):
+    """Map week_start -> {day_index: row_number} from a full read of the Schedule tab"""
+    if not all_values:
+        return {}
+
+    cols = _schedule_columns(all_values[0])
+    index = {}
+    for row_number, row in enumerate(all_values[1:], start=2):
+        if len(row) > max(cols['week_start'], cols['day_index']) and row[cols['week_start']]:
+            try:
+                day_idx = int(row[cols['day_index']])
+            except ValueError:
+                continue
+            index.setdefault(row[cols['week_start']], {})[day_idx] = row_number
+    return index
+
+
+def _find_schedule_row(all_values, week_start, day_index):
+    """Return the sheet row number holding this week/day, or None"""
+    if len(all_values) > 1:
+        headers = all_values[0]
+        try:
+            week_start_idx = headers.index('week_start')
+            day_index_idx = headers.index('day_index')
+        except ValueError:
+            return None
+        for idx, row in enumerate(all_values[1:], start=2):
+            if len(row) > max(week_start_idx, day_index_idx):
+                if row[week_start_idx] == week_start and str(row[day_index_idx]) == str(day_index):
+                    return idx
+    return None
+
+
+def _row_spans(row_numbers):
+    """Group sorted row numbers into (first, last) runs: [2, 3, 4, 9] -> [(2, 4), (9, 9)]"""
+    spans = []
+    for row_number in row_numbers:
+        if spans and spans[-1][1] == row_number - 1:
+            spans[-1] = (spans[-1][0], row_number)
+        else:
+            spans.append((row_number, row_number))
+    return spans
+
+
+def _format_index_slots(slots):
+    """Serialize {day_index: row_number} as 0:12,3:20"""
+    return ','.join(f"{day}:{slots[day]}" for day in sorted(slots))
+
+
+def _parse_index_row(row):
+    """Read a ScheduleIndex row as (week_start, {day_index: row_number}, archive tab or ''); week_start is '' if blank"""
+    if not row or not row[0]:
+        return '', {}, ''
+    slots = {}
+    for slot in (row[1] if len(row) > 1 else '').split(','):
+        if ':' in slot:
+            day_idx, row_number = slot.split(':', 1)
+            slots[int(day_idx)] = int(row_number)
+    return row[0], slots, row[2] if len(row) > 2 else ''
+
+
+def _appended_row_number(response):
+    """Extract the row number from an append response ("Schedule!A57:E57" -> 57)"""
+    updated_range = response['updates']['updatedRange']
+    first_cell = updated_range.split('!')[-1].split(':')[0]
+    return int(''.join(filter(str.isdigit, first_cell)))
+
+
+class SheetsStorage(Storage):
+    """People and Schedule tabs of a Google spreadsheet, with the optional ScheduleIndex tab"""
+
+    def __init__(self, connection, cache):
+        self.connection = connection
+        # Shared TTL cache - only the week index lives here, the app caches the rest
+        self.cache = cache
+        # Sheets has no conditional writes, so check-then-write of a slot is made atomic in-process
+        self._slot_locks = SlotLocks()
+        # A week's ScheduleIndex row is shared by its days, so updating it is serialized per week
+        self._week_locks = SlotLocks()
+
+    def _call(self, title, method, *args, **kwargs):
+        return self.connection.call(title, method, *args, **kwargs)
+
+    # ---------------------------
+    # People
+    # ---------------------------
+
+    def load_people(self):
+        # Get all values as a list of lists
+        all_values = self._call("People", "get_all_values")
+
+        if not all_values or len(all_values) < 1:
+            return []
+
+        # First row is headers
+        headers = all_values[0]
+
+        # Find column indices
+        try:
+            name_idx = headers.index('name')
+            phone_idx = headers.index('phone')
+            # Email column is optional - might not exist yet
+            email_idx = headers.index('email') if 'email' in headers else None
+        except ValueError as e:
+            raise SheetFormatError(f"חסרות כותרות בטאב People: {str(e)}")
+        optional_idx = {column: headers.index(column) if column in headers else None
+                        for column in PEOPLE_OPTIONAL_COLUMNS}
+
+        # Build people list
+        people = []
+        for row in all_values[1:]:  # Skip header row
+            if len(row) > name_idx and row[name_idx]:
+                person = {
+                    'name': row[name_idx],
+                    'phone': row[phone_idx] if len(row) > phone_idx else ''
+                }
+                # Add email if column exists
+                if email_idx is not None and len(row) > email_idx:
+                    person['email'] = row[email_idx]
+                else:
+                    person['email'] = ''
+                for column, idx in optional_idx.items():
+                    person[column] = row[idx] if idx is not None and len(row) > idx else ''
+                people.append(person)
+
+        return people
+
+    def save_person(self, name, phone, email=''):
+        self._call("People", "append_row", [name, phone, email])
+
+    def save_people(self, people):
+        people = list(people)
+        if not people:
+            return
+        # Lay the rows out like the tab's own headers, so optional columns land where they belong
+        headers = self._call("People", "row_values", 1)
+        if 'name' not in headers or 'phone' not in headers:
+            raise SheetFormatError("חסרות כותרות בטאב People: name, phone")
+        added = [column for column in PEOPLE_COLUMNS
+                 if column not in headers and any(person.get(column) for person in people)]
+        if added:
+            headers = headers + added
+            self._call("People", "update", values=[headers], range_name="1:1")
+        self._call("People", "append_rows", [[person.get(header, '') for header in headers] for person in people])
+
+    def delete_person(self, name):
+        records = self._call("People", "get_all_records")
+
+        # Find the row to delete (row numbers start at 2 because row 1 is header)
+        for idx, record in enumerate(records, start=2):
+            if record['name'] == name:
+                self._call("People", "delete_rows", idx)
+                return True
+
+        return False
+
+    # ---------------------------
+    # Week index
+    # ---------------------------
+
+    def _fetch_week_index(self, fresh=False):
+        """Read the ScheduleIndex tab, or None if this sheet hasn't been migrated yet
+
+        A week listed on several rows (left by concurrent writers before
+        index updates were serialized) gets the days of all of them.
+        """
+        import gspread
+        try:
+            all_values = self._call(SCHEDULE_INDEX_TAB, "get_all_values", coalesce=not fresh)
+        except gspread.exceptions.WorksheetNotFound:
+            return None
+
+        index = WeekIndex()
+        for position, row in enumerate(all_values[1:], start=2):  # Skip header row
+            week_start, slots, tab = _parse_index_row(row)
+            if week_start:
+                index.setdefault(week_start, {}).update(slots)
+                index.positions.setdefault(week_start, position)
+                if tab:
+                    index.tabs[week_start] = tab
+        return index
+
+    def _refresh_index_weeks(self, index, week_starts):
+        """Bring `week_starts` in `index` (updated in place) up to date with the ScheduleIndex tab
+
+        Only their rows, the last row `index` knows and whatever was appended
+        after it are read. If any of those rows now holds another week, the
+        tab was rewritten (rebuilt or archived) and all of it is read again.
+        """
+        last = max(index.positions.values(), default=1)
+        expected = {position: week_start for week_start, position in index.positions.items()
+                    if week_start in week_starts or position == last}
+        ranges = [f"A{position}:C{position}" for position in sorted(expected)] + [f"A{last + 1}:C"]
+        results = self._call(SCHEDULE_INDEX_TAB, "batch_get", ranges, coalesce=False)
+
+        current = WeekIndex()
+        for position, rows in zip(sorted(expected), results):
+            week_start, slots, tab = _parse_index_row(rows[0] if rows else [])
+            if week_start != expected[position]:
+                # Everything in a full read is current
+                current = self._fetch_week_index(fresh=True) or WeekIndex()
+                index.update(current)
+                index.positions.update(current.positions)
+                index.tabs.update(current.tabs)
+                return index
+            current[week_start], current.positions[week_start] = slots, position
+            if tab:
+                current.tabs[week_start] = tab
+        for position, row in enumerate(results[-1], start=last + 1):
+            week_start, slots, tab = _parse_index_row(row)
+            if week_start:
+                current.setdefault(week_start, {}).update(slots)
+                current.positions.setdefault(week_start, position)
+                if tab:
+                    current.tabs[week_start] = tab
+
+        for week_start in week_starts:
+            if week_start in current:
+                index[week_start] = {**index.get(week_start, {}), **current[week_start]}
+                index.positions[week_start] = current.positions[week_start]
+                if week_start in current.tabs:
+                    index.tabs[week_start] = current.tabs[week_start]
+        return index
+
+    def load_week_index(self):
+        """Load the week -> rows index (None when the sheet has no ScheduleIndex tab)"""
+        return self.cache.get_or_load('schedule_index', self._fetch_week_index)
+
+    def write_week_index(self, index, previous_size=0):
+        """Overwrite the ScheduleIndex tab with `index` in a single update"""
+        index = WeekIndex(index, tabs=dict(getattr(index, 'tabs', {})))
+        width = 3 if index.tabs else 2
+        rows = [['week_start', 'rows', 'tab'][:width]]
+        for week_start in sorted(index):
+            index.positions[week_start] = len(rows) + 1
+            rows.append([week_start, _format_index_slots(index[week_start]), index.tabs.get(week_start, '')][:width])
+
+        # Blank out leftovers if the index got shorter
+        rows += [[''] * width] * max(0, previous_size + 1 - len(rows))
+
+        worksheet = self.connection.worksheet(SCHEDULE_INDEX_TAB)
+        if worksheet.row_count < len(rows) or worksheet.col_count < width:
+            self._call(SCHEDULE_INDEX_TAB, "resize", rows=max(worksheet.row_count, len(rows) + 100),
+                       cols=max(worksheet.col_count, width))
+        self._call(SCHEDULE_INDEX_TAB, "update", range_name="A1", values=rows)
+        self.cache.set('schedule_index', index)
+        return index
+
+    def _archive_tabs(self):
+        """Titles of the yearly archive tabs that exist"""
+        return sorted(worksheet.title for worksheet in self.connection.spreadsheet().worksheets()
+                      if worksheet.title.startswith(ARCHIVE_TAB_PREFIX))
+
+    def rebuild_week_index(self, all_values=None):
+        """Rebuild the ScheduleIndex tab from a full read of the Schedule tab and any archive tabs"""
+        if all_values is None:
+            all_values = self._call("Schedule", "get_all_values")
+
+        index = WeekIndex(_build_week_index(all_values))
+        for tab in self._archive_tabs():
+            for week_start, slots in _build_week_index(self._call(tab, "get_all_values")).items():
+                # A week still in the live tab wins over a stale archived copy
+                if week_start not in index:
+                    index[week_start] = slots
+                    index.tabs[week_start] = tab
+
+        previous = self.load_week_index() or {}
+        return self.write_week_index(index, previous_size=len(previous))
+
+    def create_week_index(self):
+        """Add the ScheduleIndex tab if it is missing and fill it from the Schedule tab"""
+        import gspread
+        spreadsheet = self.connection.spreadsheet()
+        try:
+            spreadsheet.worksheet(SCHEDULE_INDEX_TAB)
+        except gspread.exceptions.WorksheetNotFound:
+            spreadsheet.add_worksheet(SCHEDULE_INDEX_TAB, rows=1000, cols=2)
+        # Sheets from before version stamps get their column, archive tabs included
+        for tab in ["Schedule"] + self._archive_tabs():
+            self.ensure_version_column(tab)
+        self.cache.invalidate('schedule_index')
+        return self.rebuild_week_index()
+
+    def _index_slot(self, index, week_start, day_index, row_number):
+        """Record a new Schedule row in the index, touching only that week's ScheduleIndex row"""
+        self._index_slots(index, [(week_start, day_index, row_number)])
+
+    def _index_slots(self, index, new_rows):
+        """Record new (week_start, day_index, row_number) Schedule rows with at most one update and one append
+
+        Under the weeks' locks their index rows are re-read and the new days
+        are merged into each week's current row, so first bookings of
+        different days of one week don't overwrite (or duplicate) each other's
+        row.
+        """
+        weeks = {week_start for week_start, _, _ in new_rows}
+        with self._week_locks.many([(week_start, 0) for week_start in weeks]):
+            self._refresh_index_weeks(index, weeks)
+            changed = {week_start: dict(index.get(week_start, {})) for week_start in weeks}
+            for week_start, day_index, row_number in new_rows:
+                changed[week_start][int(day_index)] = row_number
+            self._write_index_rows(index, changed)
+
+    def _write_index_rows(self, index, changed):
+        """Write the ScheduleIndex rows of `changed` ({week_start: slots}), updating known rows and appending new ones"""
+        updates, appends = [], []
+        for week_start in sorted(changed):
+            row = [week_start, _format_index_slots(changed[week_start])]
+            if week_start in index.tabs:
+                row.append(index.tabs[week_start])
+            position = index.positions.get(week_start)
+            if position:
+                updates.append({'range': f"A{position}:{'C' if len(row) > 2 else 'B'}{position}", 'values': [row]})
+            else:
+                appends.append(row)
+
+        if len(updates) == 1:
+            self._call(SCHEDULE_INDEX_TAB, "update", range_name=updates[0]['range'], values=updates[0]['values'])
+        elif updates:
+            self._call(SCHEDULE_INDEX_TAB, "batch_update", updates)
+        if appends:
+            first = _appended_row_number(self._call(SCHEDULE_INDEX_TAB, "append_rows", appends))
+            for offset, row in enumerate(appends):
+                index.positions[row[0]] = first + offset
+        index.update(changed)
+
+    # ---------------------------
+    # Schedule
+    # ---------------------------
+
+    def _scan_schedule(self, week_starts):
+        """Read weeks by scanning the whole Schedule tab (sheets without an index)"""
+        all_values = self._call("Schedule", "get_all_values")
+        if not all_values:
+            return {week_start: {} for week_start in week_starts}
+        return {week_start: _parse_schedule_rows(all_values[0], all_values[1:], week_start)
+                for week_start in week_starts}
+
+    def load_schedule(self, week_start):
+        return self.load_schedule_weeks([week_start])[week_start]
+
+    def load_schedule_weeks(self, week_starts):
+        index = self.load_week_index()
+        if index is None:
+            return self._scan_schedule(week_starts)
+
+        # Usually everything is in the live tab; archived weeks cost one more read per archive tab
+        by_tab = {}
+        for week_start in week_starts:
+            by_tab.setdefault(index.tab(week_start), []).append(week_start)
+
+        weeks = {}
+        for tab, tab_weeks in sorted(by_tab.items()):
+            row_numbers = {row for week_start in tab_weeks for row in index.get(week_start, {}).values()}
+            if not row_numbers:
+                weeks.update({week_start: {} for week_start in tab_weeks})
+                continue
+
+            headers, rows = self._read_rows(row_numbers, tab)
+
+            # The sheet was edited by hand since the index was written - fall back and re-index
+            cols = _schedule_columns(headers)
+            if any(len(rows[row_number]) <= cols['week_start'] or rows[row_number][cols['week_start']] != week_start
+                   for week_start in tab_weeks for row_number in index.get(week_start, {}).values()):
+                all_values = self._call(tab, "get_all_values")
+                self.rebuild_week_index(all_values if tab == "Schedule" else None)
+                weeks.update({week_start: _parse_schedule_rows(all_values[0], all_values[1:], week_start)
+                              for week_start in tab_weeks})
+                continue
+
+            weeks.update({
+                week_start: _parse_schedule_rows(
+                    headers, [rows[row_number] for row_number in index.get(week_start, {}).values()], week_start)
+                for week_start in tab_weeks
+            })
+        return weeks
+
+    def _read_rows(self, row_numbers, tab="Schedule", fresh=False):
+        """The header and {row_number: row} in one round trip, with adjacent rows merged into spans
+
+        `fresh` reads for a compare-and-set never share an in-flight request.
+        """
+        spans = _row_spans(sorted(row_numbers))
+        results = self._call(tab, "batch_get", ["1:1"] + [f"{first}:{last}" for first, last in spans],
+                             coalesce=not fresh)
+        headers = results[0][0] if results[0] else []
+        if tab == "Schedule":
+            self.cache.set('schedule_headers', headers)
+        rows = {}
+        for (first, last), value_range in zip(spans, results[1:]):
+            for offset in range(last - first + 1):
+                # The API drops trailing empty rows
+                rows[first + offset] = value_range[offset] if offset < len(value_range) else []
+        return headers, rows
+
+    def _read_row(self, row_number, tab="Schedule", fresh=False):
+        """The header and one Schedule row, in a single round trip (`fresh` as for _read_rows)"""
+        headers, row = self._call(tab, "batch_get", ["1:1", f"{row_number}:{row_number}"], coalesce=not fresh)
+        return (headers[0] if headers else []), (row[0] if row else [])
+
+    def load_slot(self, week_start, day_index):
+        index = self.load_week_index()
+        if index is None:
+            return super().load_slot(week_start, day_index)
+        row_number = index.get(week_start, {}).get(int(day_index))
+        if not row_number:
+            return None
+
+        headers, row = self._read_row(row_number, index.tab(week_start))
+        if not _is_slot_row(_schedule_columns(headers), row, week_start, day_index):
+            # Stale index - the week read falls back to a scan and re-indexes
+            return self.load_schedule(week_start).get(int(day_index))
+        return _parse_schedule_rows(headers, [row], week_start).get(int(day_index))
+
+    def _locate_slot(self, week_start, day_index):
+        """Find the Schedule row for a week/day - from the index when we have one - and the index itself"""
+        index = self.load_week_index()
+        if index is not None:
+            return index.get(week_start, {}).get(int(day_index)), index
+
+        # Unindexed sheet: one full read to find the row (callers hold the slot lock, so it is a fresh read)
+        all_values = self._call("Schedule", "get_all_values", coalesce=False)
+        return _find_schedule_row(all_values, week_start, day_index), None
+
+    def _current_slot(self, week_start, day_index):
+        """Read a slot's row fresh: (row_number, index, headers, assignment or None, version)"""
+        row_number, index = self._locate_slot(week_start, day_index)
+        if not row_number and index is not None:
+            # Another process may have added the slot's row since our copy of the index was read
+            row_number = self._refresh_index_weeks(index, [week_start]).get(week_start, {}).get(int(day_index))
+        if not row_number:
+            headers = self.cache.get_or_load('schedule_headers', lambda: self._call("Schedule", "row_values", 1))
+            return None, index, headers, None, 0
+
+        tab = index.tab(week_start) if index is not None else "Schedule"
+        headers, row = self._read_row(row_number, tab, fresh=True)
+        cols = _schedule_columns(headers)
+        if not _is_slot_row(cols, row, week_start, day_index):
+            # The sheet was edited by hand since the index was written
+            index = self.rebuild_week_index()
+            row_number = index.get(week_start, {}).get(int(day_index))
+            if not row_number:
+                return None, index, headers, None, 0
+            headers, row = self._read_row(row_number, index.tab(week_start), fresh=True)
+
+        assignment = _parse_schedule_rows(headers, [row], week_start).get(int(day_index))
+        return row_number, index, headers, assignment, _row_version(cols, row)
+
+    def verify_slot(self, week_start, day_index, expected_version):
+        with self._slot_locks(week_start, day_index):
+            _, _, _, current, _ = self._current_slot(week_start, day_index)
+        check_expected_version(week_start, day_index, current, expected_version)
+
+    def ensure_version_column(self, tab="Schedule"):
+        """Put the "version" header in F1 of a schedule tab that has none, so its slots get version stamps
+
+        Returns the tab's headers; raises SheetFormatError when F1 holds some other header.
+        """
+        headers = self._call(tab, "row_values", 1, coalesce=False)
+        if _schedule_columns(headers)['version'] is None:
+            if len(headers) > 5 and headers[5]:
+                raise SheetFormatError(f"עמודה F בטאב {tab} שמורה לחותמת הגרסה (version), ויש בה: {headers[5]}")
+            if self.connection.worksheet(tab).col_count < 6:
+                self._call(tab, "resize", cols=6)
+            self._call(tab, "update", range_name="F1", values=[['version']])
+            headers = headers[:5] + [''] * (5 - len(headers)) + ['version'] + headers[6:]
+        if tab == "Schedule":
+            self.cache.set('schedule_headers', headers)
+        return headers
+
+    def _versioned_headers(self, tab, headers):
+        """`headers`, with the version column added to the tab first if it has none and F1 is free"""
+        if _schedule_columns(headers)['version'] is not None:
+            return headers
+        if len(headers) > 5 and headers[5]:
+            logger.warning("Column F of %s is %r, not version - its slots are written without version stamps",
+                           tab, headers[5])
+            return headers
+        return self.ensure_version_column(tab)
+
+    def _write_slot(self, row_number, index, headers, values, version):
+        """Overwrite a slot's row (or append it), bumping its version stamp - the first write to a sheet
+        from before version stamps adds their column"""
+        # Archived weeks are written where they live
+        tab = index.tab(values[0]) if index is not None else "Schedule"
+        if _schedule_columns(headers)['version'] is None:
+            headers = self._versioned_headers(tab, headers)
+            # Rows written before the column existed count as version 1
+            version = 1 if row_number else 0
+        versioned = _schedule_columns(headers)['version'] is not None
+        if versioned:
+            values = values + [version + 1]
+        last_column = 'F' if versioned else 'E'
+        if row_number:
+            self._call(tab, "update", range_name=f"A{row_number}:{last_column}{row_number}", values=[values])
+        else:
+            response = self._call(tab, "append_row", values)
+            if index is not None:
+                self._index_slot(index, values[0], values[1], _appended_row_number(response))
+        return version + 1 if versioned else None
+
+    def save_assignment(self, week_start, day_index, person_name, person_phone, person_email='',
+                        expected_version=None):
+        # Upsert: overwrite the slot's row in place, appending only for a new slot
+        with self._slot_locks(week_start, day_index):
+            row_number, index, headers, current, version = self._current_slot(week_start, day_index)
+            check_expected_version(week_start, day_index, current, expected_version)
+            version = self._write_slot(row_number, index, headers,
+                                       [week_start, day_index, person_name, person_phone, person_email], version)
+        return {'person_name': person_name, 'person_phone': person_phone, 'person_email': person_email,
+                'version': version}
+
+    def clear_assignment(self, week_start, day_index, expected_version=None):
+        # Blank the person but keep the row, so nothing below it shifts and the row can be reused
+        with self._slot_locks(week_start, day_index):
+            row_number, index, headers, current, version = self._current_slot(week_start, day_index)
+            check_expected_version(week_start, day_index, current, expected_version)
+            if row_number:
+                self._write_slot(row_number, index, headers, [week_start, day_index, '', '', ''], version)
+        return current
+
+    def fill_slots(self, assignments):
+        assignments = list(assignments)
+        index = self.load_week_index()
+        if index is None or not assignments or any(a['week_start'] in index.tabs for a in assignments):
+            # Unindexed sheets and archived weeks go slot by slot
+            return super().fill_slots(assignments)
+
+        slots = [(assignment['week_start'], int(assignment['day_index'])) for assignment in assignments]
+        with self._slot_locks.many(slots):
+            # Read every existing row of these slots fresh, re-indexing once if the sheet was edited by hand
+            for attempt in range(2):
+                row_numbers = {index.get(week_start, {}).get(day_index) for week_start, day_index in slots} - {None}
+                headers, rows = (self._read_rows(row_numbers, fresh=True) if row_numbers
+                                 else (self.cache.get_or_load('schedule_headers',
+                                                              lambda: self._call("Schedule", "row_values", 1)), {}))
+                cols = _schedule_columns(headers)
+                stale = any(not _is_slot_row(cols, rows[index[week_start][day_index]], week_start, day_index)
+                            for week_start, day_index in slots if index.get(week_start, {}).get(day_index))
+                if not stale or attempt:
+                    break
+                index = self.rebuild_week_index()
+
+            if cols['version'] is None:
+                headers = self._versioned_headers("Schedule", headers)
+                cols = _schedule_columns(headers)
+            versioned = cols['version'] is not None
+            last_column = 'F' if versioned else 'E'
+            updates, appends, saved, taken, claimed = [], [], [], [], set()
+            for assignment, (week_start, day_index) in zip(assignments, slots):
+                row_number = index.get(week_start, {}).get(day_index)
+                row = rows.get(row_number, [])
+                if (week_start, day_index) in claimed or (row_number and len(row) > cols['person_name']
+                                                          and row[cols['person_name']]):
+                    taken.append(assignment)
+                    continue
+                claimed.add((week_start, day_index))
+
+                version = _row_version(cols, row) if row_number else 0
+                values = [week_start, day_index, assignment['person_name'], assignment['person_phone'],
+                          assignment['person_email']]
+                if versioned:
+                    values.append(version + 1)
+                if row_number:
+                    updates.append({'range': f"A{row_number}:{last_column}{row_number}", 'values': [values]})
+                else:
+                    appends.append(values)
+                saved.append(dict(assignment, version=version + 1 if versioned else None))
+
+            # At most two Schedule writes and two ScheduleIndex writes, however many days were filled
+            if updates:
+                self._call("Schedule", "batch_update", updates)
+            if appends:
+                first = _appended_row_number(self._call("Schedule", "append_rows", appends))
+                self._index_slots(index, [(values[0], values[1], first + offset)
+                                          for offset, values in enumerate(appends)])
+        return saved, taken
+
+    def iter_schedule(self):
+        index = self.load_week_index()
+        for tab in ["Schedule"] + sorted(set(index.tabs.values()) if index is not None else ()):
+            all_values = self._call(tab, "get_all_values")
+            if not all_values:
+                continue
+            cols = _schedule_columns(all_values[0])
+            for row in all_values[1:]:
+                if len(row) > cols['person_name'] and row[cols['person_name']] and row[cols['week_start']]:
+                    try:
+                        day_index = int(row[cols['day_index']])
+                    except ValueError:
+                        continue
+                    assignment = {'week_start': row[cols['week_start']], 'day_index': day_index}
+                    for column in ('person_name', 'person_phone', 'person_email'):
+                        position = cols[column]
+                        assignment[column] = row[position] if position is not None and len(row) > position else ''
+                    yield assignment
+
+    def archive(self, before_week):
+        if self.load_week_index() is None:
+            self.create_week_index()
+
+        # Nobody may write a slot while rows move around underneath the index
+        with self._slot_locks.all():
+            index = self.load_week_index()
+            all_values = self._call("Schedule", "get_all_values")
+            if len(all_values) < 2:
+                return 0, 0
+            headers = all_values[0]
+            cols = _schedule_columns(headers)
+
+            live, old, dropped = [], {}, 0
+            for row in all_values[1:]:
+                row = list(row) + [''] * (len(headers) - len(row))
+                week_start = row[cols['week_start']]
+                cleared = not row[cols['person_name']]
+                if not week_start or not row[cols['day_index']].isdigit() or (cleared and cols['version'] is None):
+                    # Blank rows, and cleared slots of sheets without version stamps. A cleared slot with a
+                    # stamp keeps its row (and moves with its week), so a later assignment gets the next
+                    # version instead of starting over at 1 and matching a stale expected_version
+                    dropped += 1
+                elif week_start < before_week:
+                    old.setdefault(archive_tab(week_start), []).append(row)
+                else:
+                    live.append(row)
+
+            # 1. Copy old weeks to their yearly tabs - they're still in the live tab, so a failure loses nothing
+            new_index = WeekIndex()
+            existing = set(self._archive_tabs())
+            for tab, rows in sorted(old.items()):
+                if tab in existing:
+                    # A run that failed after this step already copied some of these slots: write over
+                    # them with the live rows (the newer copy) instead of appending them a second time
+                    copied = _build_week_index(self._call(tab, "get_all_values"))
+                else:
+                    self.connection.spreadsheet().add_worksheet(tab, rows=len(rows) + 100, cols=len(headers))
+                    self._call(tab, "update", range_name="A1", values=[headers])
+                    copied = {}
+                updates, appends = [], []
+                for row in rows:
+                    week_start, day_index = row[cols['week_start']], int(row[cols['day_index']])
+                    row_number = copied.get(week_start, {}).get(day_index)
+                    if row_number:
+                        updates.append({'range': f"A{row_number}", 'values': [row]})
+                        new_index.setdefault(week_start, {})[day_index] = row_number
+                    else:
+                        appends.append(row)
+                    new_index.tabs[week_start] = tab
+                if updates:
+                    self._call(tab, "batch_update", updates)
+                if appends:
+                    first = _appended_row_number(self._call(tab, "append_rows", appends))
+                    for offset, row in enumerate(appends):
+                        new_index.setdefault(row[cols['week_start']], {})[int(row[cols['day_index']])] = first + offset
+            for week_start, tab in index.tabs.items():
+                if week_start not in new_index:
+                    new_index[week_start] = dict(index[week_start])
+                    new_index.tabs[week_start] = tab
+
+            # 2. Rewrite the live tab with only the current weeks, packed from row 2
+            blanks = [[''] * len(headers)] * (len(all_values) - 1 - len(live))
+            self._call("Schedule", "update", range_name="A1", values=[headers] + live + blanks)
+            for row_number, row in enumerate(live, start=2):
+                new_index.setdefault(row[cols['week_start']], {})[int(row[cols['day_index']])] = row_number
+
+            # 3. Point the index at where everything is now
+            self.write_week_index(new_index, previous_size=len(index))
+        return sum(len(rows) for rows in old.values()), dropped
+
+
+# ===========================
+# SQLite
+# ===========================
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS people (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL DEFAULT '',
+    email TEXT NOT NULL DEFAULT '',
+    available_days TEXT NOT NULL DEFAULT '',
+    blackout_dates TEXT NOT NULL DEFAULT '',
+    max_per_week TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS people_name ON people (name);
+
+CREATE TABLE IF NOT EXISTS schedule (
+    week_start TEXT NOT NULL,
+    day_index INTEGER NOT NULL,
+    person_name TEXT NOT NULL,
+    person_phone TEXT NOT NULL DEFAULT '',
+    person_email TEXT NOT NULL DEFAULT '',
+    -- Bumped on every write; a cleared slot keeps its row with an empty person_name
+    version INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (week_start, day_index)
+);
+CREATE INDEX IF NOT EXISTS schedule_person_name ON schedule (person_name);
+"""
+
+
+class SQLiteStorage(Storage):
+    """Local SQLite database for deployments that have outgrown Sheets latency and quotas"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SQLITE_SCHEMA)
+            # Databases created before slots had version stamps / people had scheduling constraints
+            columns = [row[1] for row in db.execute("PRAGMA table_info(schedule)")]
+            if 'version' not in columns:
+                db.execute("ALTER TABLE schedule ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            columns = [row[1] for row in db.execute("PRAGMA table_info(people)")]
+            for column in PEOPLE_OPTIONAL_COLUMNS:
+                if column not in columns:
+                    db.execute(f"ALTER TABLE people ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection that commits on success and always closes"""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def load_people(self):
+        with self._connect() as db:
+            rows = db.execute(f"SELECT {', '.join(PEOPLE_COLUMNS)} FROM people ORDER BY id").fetchall()
+        return [dict(zip(PEOPLE_COLUMNS, row)) for row in rows]
+
+    def save_person(self, name, phone, email=''):
+        with self._lock, self._connect() as db:
+            db.execute("INSERT INTO people (name, phone, email) VALUES (?, ?, ?)", (name, phone, email))
+
+    def save_people(self, people):
+        with self._lock, self._connect() as db:
+            db.executemany(
+                f"INSERT INTO people ({', '.join(PEOPLE_COLUMNS)}) VALUES ({', '.join('?' * len(PEOPLE_COLUMNS))})",
+                [[person.get(column, '') for column in PEOPLE_COLUMNS] for person in people]
+            )
+
+    def delete_person(self, name):
+        with self._lock, self._connect() as db:
+            # Like the sheet, only the first person with that name is removed
+            cursor = db.execute(
+                "DELETE FROM people WHERE id = (SELECT MIN(id) FROM people WHERE name = ?)", (name,)
+            )
+        return cursor.rowcount > 0
+
+    def load_schedule(self, week_start):
+        return self.load_schedule_weeks([week_start])[week_start]
+
+    def load_schedule_weeks(self, week_starts):
+        week_starts = list(week_starts)
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT week_start, day_index, person_name, person_phone, person_email, version FROM schedule "
+                f"WHERE week_start IN ({','.join('?' * len(week_starts))}) AND person_name != ''", week_starts
+            ).fetchall()
+        weeks = {week_start: {} for week_start in week_starts}
+        for week_start, day_idx, name, phone, email, version in rows:
+            weeks[week_start][day_idx] = {'person_name': name, 'person_phone': phone, 'person_email': email,
+                                          'version': version}
+        return weeks
+
+    def _current_slot(self, db, week_start, day_index):
+        """(assignment or None, version) - a cleared slot keeps its row and version"""
+        row = db.execute(
+            "SELECT person_name, person_phone, person_email, version FROM schedule "
+            "WHERE week_start = ? AND day_index = ?", (week_start, int(day_index))
+        ).fetchone()
+        if row is None:
+            return None, 0
+        name, phone, email, version = row
+        if not name:
+            return None, version
+        return {'person_name': name, 'person_phone': phone, 'person_email': email, 'version': version}, version
+
+    def load_slot(self, week_start, day_index):
+        with self._connect() as db:
+            return self._current_slot(db, week_start, day_index)[0]
+
+    def _upsert_slot(self, db, week_start, day_index, person_name, person_phone, person_email, version):
+        db.execute(
+            "INSERT INTO schedule (week_start, day_index, person_name, person_phone, person_email, version) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (week_start, day_index) DO UPDATE SET "
+            "person_name = excluded.person_name, person_phone = excluded.person_phone, "
+            "person_email = excluded.person_email, version = excluded.version",
+            (week_start, int(day_index), person_name, person_phone, person_email, version)
+        )
+
+    def save_assignment(self, week_start, day_index, person_name, person_phone, person_email='',
+                        expected_version=None):
+        with self._lock, self._connect() as db:
+            # Take the write lock before reading, so other processes can't change the slot in between
+            db.execute("BEGIN IMMEDIATE")
+            current, version = self._current_slot(db, week_start, day_index)
+            check_expected_version(week_start, day_index, current, expected_version)
+            self._upsert_slot(db, week_start, day_index, person_name, person_phone, person_email, version + 1)
+        return {'person_name': person_name, 'person_phone': person_phone, 'person_email': person_email,
+                'version': version + 1}
+
+    def fill_slots(self, assignments):
+        saved, taken = [], []
+        # One transaction for the whole batch
+        with self._lock, self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            for assignment in assignments:
+                current, version = self._current_slot(db, assignment['week_start'], assignment['day_index'])
+                if current is not None:
+                    taken.append(assignment)
+                    continue
+                self._upsert_slot(db, assignment['week_start'], assignment['day_index'], assignment['person_name'],
+                                  assignment['person_phone'], assignment['person_email'], version + 1)
+                saved.append(dict(assignment, version=version + 1))
+        return saved, taken
+
+    def iter_schedule(self):
+        with self._connect() as db:
+            cursor = db.execute(
+                "SELECT week_start, day_index, person_name, person_phone, person_email FROM schedule "
+                "WHERE person_name != '' ORDER BY week_start, day_index"
+            )
+            for week_start, day_index, name, phone, email in cursor:
+                yield {'week_start': week_start, 'day_index': day_index, 'person_name': name,
+                       'person_phone': phone, 'person_email': email}
+
+    def archive(self, before_week):
+        # Lookups go through the primary key, so history doesn't slow reads down and nothing needs
+        # moving; cleared slots keep their row, whose version stamp a later assignment must go past
+        return 0, 0
+
+    def clear_assignment(self, week_start, day_index, expected_version=None):
+        with self._lock, self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            current, _ = self._current_slot(db, week_start, day_index)
+            check_expected_version(week_start, day_index, current, expected_version)
+            # Keep the row with a bumped version, so a later assignment can't be mistaken for this one
+            db.execute(
+                "UPDATE schedule SET person_name = '', person_phone = '', person_email = '', version = version + 1 "
+                "WHERE week_start = ? AND day_index = ?", (week_start, int(day_index))
+            )
+        return current
@@ -1,314 +1,791 @@
 import streamlit as st
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, timedelta
 import json
+import logging
+import threading
 import urllib.parse
-import requests
+import uuid
+
+import csv_io
+from autoschedule import DAY_NAMES, History, plan_schedule, slot_date
+from cache import CacheBudget, ChangeDetector, TTLCache
+from calendar_feed import CalendarFeed, FeedServer
+from journal import APPLIED, PENDING, REJECTED, JournaledStorage, JournalSyncer, WriteJournal
+from metrics import CallRecorder
+from reminders import ReminderBook, ReminderScheduler, batch_payload, parse_send_time, reminders_csv, with_e164
+from request_scheduler import RequestScheduler
+from stats import StatsStore
+from storage import (SheetFormatError, SheetsConnection, SheetsStorage, SlotConflictError, SQLiteStorage,
+                     check_expected_version)
+from tenants import load_tenants
+
+logger = logging.getLogger(__name__)
 
 # ===========================
 # Configuration from Secrets
 # ===========================
-MAKE_WEBHOOK_URL = st.secrets.get("make_webhook_url", "")
-MAKE_WEBHOOK_URL_PERSON = st.secrets.get("make_webhook_url_person", "")
-APP_URL = st.secrets.get("app_url", "https://your-app.streamlit.app")
+
+# Schedules served by this deployment, picked with ?tenant=<id> (see tenants.py); each has its
+# own spreadsheet, webhooks, admin password and message texts
+TENANTS = load_tenants(st.secrets)
+DEFAULT_TENANT_ID = st.secrets.get("default_tenant", next(iter(TENANTS)))
+
+# How long People/Schedule reads are reused across sessions before re-reading the sheet
+CACHE_TTL_SECONDS = int(st.secrets.get("cache_ttl_seconds", 300))
+# Entries per tenant, and across all tenants together (the least recently used go first)
+CACHE_MAX_ENTRIES = int(st.secrets.get("cache_max_entries", 256))
+CACHE_MAX_ENTRIES_TOTAL = int(st.secrets.get("cache_max_entries_total", 2048))
+
+# Cached reads older than this are re-checked against the spreadsheet's Drive modifiedTime
+# (one tiny metadata request) and only re-read if someone edited it; 0 turns checking off
+CHANGE_CHECK_SECONDS = int(st.secrets.get("change_check_seconds", 10))
+
+# Weeks kept warm on either side of the week being viewed
+PREFETCH_WEEKS = int(st.secrets.get("prefetch_weeks", 2))
+
+# When a process serves its first page, connect to every tenant's sheet and load its people and
+# current weeks on a background thread, so the first visitor after a cold start doesn't wait for
+# imports, OAuth and opening the spreadsheet one after the other
+WARM_UP_ON_START = bool(st.secrets.get("warm_up_on_start", True))
+# How long a page that needs data the warm-up is still loading waits for it instead of reading it again
+WARM_UP_WAIT_SECONDS = float(st.secrets.get("warm_up_wait_seconds", 30))
+
+# Weeks older than this are moved out of the live Schedule tab by the archive job
+ARCHIVE_AFTER_WEEKS = int(st.secrets.get("archive_after_weeks", 26))
+
+# Where people and the schedule live: "sheets" (Google Sheets), "sqlite" or "memory" (offline fake);
+# each tenant gets its own sqlite_path
+STORAGE_BACKEND = st.secrets.get("storage_backend", "sheets")
+
+# Local write-ahead journal (write_journal_path, e.g. "journal.sqlite3", one file per tenant): schedule
+# writes are checked against the sheet, acknowledged once they are on disk there and replayed to the
+# sheet in the background; off ("") by default, which writes straight to the sheet
+# How long a write waits for that check before it is journaled unchecked (and checked on replay)
+JOURNAL_CHECK_SECONDS = float(st.secrets.get("journal_check_seconds", 2))
+# How often a session with writes still waiting in the journal checks whether they were turned down
+JOURNAL_NOTICE_SECONDS = float(st.secrets.get("journal_notice_seconds", 5))
+
+# Google's default Sheets quota is 60 reads and 60 writes per minute per user
+SHEETS_READS_PER_MINUTE = int(st.secrets.get("sheets_reads_per_minute", 60))
+SHEETS_WRITES_PER_MINUTE = int(st.secrets.get("sheets_writes_per_minute", 60))
+SHEETS_MAX_CONCURRENCY = int(st.secrets.get("sheets_max_concurrency", 4))
+SHEETS_MAX_RETRIES = int(st.secrets.get("sheets_max_retries", 5))
+
+# Log every external call as a JSON line (for shipping to a log collector)
+METRICS_LOG = bool(st.secrets.get("metrics_log", False))
+
+# Calendar (.ics) feeds of the schedule: weeks covered around the current one, and how often the
+# pre-rendered feeds are brought up to date (through the read cache, so never more often than it reads)
+CALENDAR_WEEKS_BACK = int(st.secrets.get("calendar_weeks_back", 4))
+CALENDAR_WEEKS_AHEAD = int(st.secrets.get("calendar_weeks_ahead", 12))
+CALENDAR_REFRESH_SECONDS = int(st.secrets.get("calendar_refresh_seconds", CACHE_TTL_SECONDS))
+# Port for calendar apps to subscribe to the feeds on (0 = off - Streamlit Community Cloud only exposes
+# the app's own port) and the public URL it is reached at, e.g. "https://pickup.example.com/calendar.ics"
+CALENDAR_HOST = st.secrets.get("calendar_host", "0.0.0.0")
+CALENDAR_PORT = int(st.secrets.get("calendar_port", 0))
+CALENDAR_URL = st.secrets.get("calendar_url", "")
+
+# Local journal of webhook notifications waiting to be delivered
+OUTBOX_PATH = st.secrets.get("outbox_path", "outbox.sqlite3")
+OUTBOX_MAX_WORKERS = int(st.secrets.get("outbox_max_workers", 4))
+OUTBOX_MAX_ATTEMPTS = int(st.secrets.get("outbox_max_attempts", 6))
+
+# ===========================
+# Tenants
+# ===========================
+
+# Set by manage.py, which runs outside a page and has no URL to read ?tenant= from
+_pinned_tenant = None
+
+def use_tenant(tenant_id):
+    """Pin the tenant for code running outside a page rerun"""
+    global _pinned_tenant
+    if tenant_id not in TENANTS:
+        raise KeyError(f"unknown tenant {tenant_id!r} (configured: {', '.join(TENANTS)})")
+    _pinned_tenant = tenant_id
+
+def current_tenant():
+    """The tenant this rerun is for - ?tenant=<id>, else the default one; None for an unknown id"""
+    if _pinned_tenant is not None:
+        return TENANTS[_pinned_tenant]
+    return TENANTS.get(st.query_params.get("tenant", DEFAULT_TENANT_ID))
+
+# ===========================
+# Instrumentation
+# ===========================
+
+@st.cache_resource(show_spinner=False)
+def metrics_recorder():
+    """Process-wide record of every Sheets and webhook call"""
+    return CallRecorder(log_calls=METRICS_LOG)
 
 # ===========================
 # Email Configuration
 # ===========================
 
-def send_email_notification(person_name, person_phone, day_name, day_date):
-    """Send email notification using Make.com webhook - TO ADMIN"""
-    if not MAKE_WEBHOOK_URL:
+@st.cache_resource(show_spinner=False)
+def notification_outbox():
+    """Process-wide webhook outbox with its delivery worker running"""
+    # Imported on first use: it pulls in requests, which the first page doesn't need
+    from outbox import Outbox
+    outbox = Outbox(OUTBOX_PATH, max_workers=OUTBOX_MAX_WORKERS, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                    recorder=metrics_recorder())
+    outbox.start()
+    return outbox
+
+def send_email_notification(person_name, person_phone, day_name, day_date, tenant=None):
+    """Queue an email notification to the Make.com webhook - TO ADMIN"""
+    tenant = tenant or current_tenant()
+    if not tenant.make_webhook_url:
         # If webhook not configured, skip silently
         return
     
     try:
-        # Send data to Make.com webhook
+        # Delivered (and retried) by the outbox worker in the background
         webhook_data = {
             "person_name": person_name,
             "day_name": day_name,
             "day_date": day_date,
             "person_phone": person_phone,
-            "app_url": APP_URL
+            "app_url": tenant.app_url
         }
-        
-        response = requests.post(
-            MAKE_WEBHOOK_URL,
-            json=webhook_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            st.success("📧 מייל נשלח בהצלחה!")
+        notification_outbox().enqueue(tenant.make_webhook_url, webhook_data)
         
     except Exception as e:
         # Fail silently - don't block the assignment
         pass
 
-def send_email_to_person(person_name, person_email, day_name, day_date):
-    """Send confirmation email to the assigned person"""
-    if not person_email or not MAKE_WEBHOOK_URL_PERSON:
+def send_email_to_person(person_name, person_email, day_name, day_date, tenant=None):
+    """Queue a confirmation email to the assigned person"""
+    tenant = tenant or current_tenant()
+    if not person_email or not tenant.make_webhook_url_person:
         return
     
     try:
-        # Send to Make.com webhook for person email
+        # Queue for the Make.com webhook for person email
         webhook_data = {
             "person_email": person_email,
             "person_name": person_name,
             "day_name": day_name,
             "day_date": day_date,
-            "app_url": APP_URL
+            "app_url": tenant.app_url
         }
-        
-        requests.post(
-            MAKE_WEBHOOK_URL_PERSON,
-            json=webhook_data,
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
+        notification_outbox().enqueue(tenant.make_webhook_url_person, webhook_data)
         
     except Exception as e:
         # Fail silently
         pass
 
-def get_whatsapp_link(phone, message):
-    """Generate WhatsApp link"""
-    # Remove any non-numeric characters from phone
-    clean_phone = ''.join(filter(str.isdigit, phone))
-    
-    # Add Israel country code if not present
-    if not clean_phone.startswith('972'):
-        if clean_phone.startswith('0'):
-            clean_phone = '972' + clean_phone[1:]
-        else:
-            clean_phone = '972' + clean_phone
+@st.cache_resource(show_spinner=False)
+def held_emails(tenant_id):
+    """Emails about journaled assignments, held until the sheet takes the write: {entry_id: send}"""
+    return {}
+
+def queue_assignment_emails(week_start, day_index, assignment, notify_admin=True):
+    """Queue the emails about a new assignment - for a journaled one, only once it has reached the sheet"""
+    tenant = current_tenant()
+    day_name = DAY_NAMES[int(day_index)]
+    day_date = datetime.strptime(slot_date(week_start, day_index), "%Y-%m-%d").strftime("%d/%m")
     
-    # URL encode the message
-    encoded_message = urllib.parse.quote(message)
+    def send():
+        if notify_admin:
+            send_email_notification(assignment['person_name'], assignment['person_phone'], day_name, day_date, tenant)
+        send_email_to_person(assignment['person_name'], assignment['person_email'], day_name, day_date, tenant)
     
-    return f"https://wa.me/{clean_phone}?text={encoded_message}"
+    version = assignment.get('version') or 0
+    if version >= 0:
+        send()
+        return
+    # A pending write's version is its journal entry's id, negated; the syncer sends (or drops) the emails
+    entry_id = -version
+    held = held_emails(tenant.id)
+    held[entry_id] = send
+    # It may have been replayed before it was held - whoever pops the emails first sends them
+    entry = write_journal().journal.entry(entry_id)
+    if entry is not None and entry['status'] != PENDING:
+        send = held.pop(entry_id, None)
+        if send and entry['status'] == APPLIED:
+            send()
 
 # ===========================
-# Google Sheets Configuration
+# Storage Configuration
 # ===========================
 
-def get_google_sheet():
-    """Connect to Google Sheets using service account credentials"""
-    try:
-        # Load credentials from Streamlit secrets
-        creds_dict = st.secrets["google_credentials"]
-        
-        # Set up the credentials
-        scope = ['https://spreadsheets.google.com/feeds',
-                 'https://www.googleapis.com/auth/drive']
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        client = gspread.authorize(creds)
-        
-        # Open the specific spreadsheet
-        sheet_id = st.secrets["sheet_id"]
-        spreadsheet = client.open_by_key(sheet_id)
-        
-        return spreadsheet
-    except Exception as e:
-        st.error(f"שגיאה בחיבור ל-Google Sheets: {str(e)}")
-        return None
+SHEETS_SCOPE = ['https://spreadsheets.google.com/feeds',
+                'https://www.googleapis.com/auth/drive']
+
+@st.cache_resource(show_spinner=False)
+def gspread_client():
+    """Service-account client shared by every tenant - one token and one pooled HTTP session"""
+    # gspread and oauth2client take most of a cold start to import, so they load with the first
+    # connection (on the warm-up thread) instead of before the first paint
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+    
+    # Load credentials from Streamlit secrets
+    creds_dict = st.secrets["google_credentials"]
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SHEETS_SCOPE)
+    return gspread.authorize(creds)
+
+def _connect_google_sheets(sheet_id):
+    """Open a tenant's spreadsheet with the shared client"""
+    client = gspread_client()
+    return client, client.open_by_key(sheet_id)
+
+def _drop_gspread_client(client):
+    """The service account's token was rejected - build the shared client again from the credentials"""
+    # Every tenant's connection sees the 401; only the first one drops the client
+    if client is None or client is gspread_client():
+        gspread_client.clear()
+
+@st.cache_resource(show_spinner=False)
+def sheets_scheduler():
+    """Process-wide rate limiter/retrier every Sheets request goes through - the quota is per service account,
+    so all tenants share it"""
+    return RequestScheduler(
+        reads_per_minute=SHEETS_READS_PER_MINUTE,
+        writes_per_minute=SHEETS_WRITES_PER_MINUTE,
+        max_concurrency=SHEETS_MAX_CONCURRENCY,
+        max_retries=SHEETS_MAX_RETRIES
+    )
+
+@st.cache_resource(show_spinner=False)
+def tenant_connection(tenant_id):
+    """One tenant's Sheets connection - shared by all of its sessions"""
+    if STORAGE_BACKEND == "memory":
+        def connect_fake():
+            import fake_sheets
+            return None, fake_sheets.shared_spreadsheet(tenant_id)
+        return SheetsConnection(connect_fake, sheets_scheduler(), metrics_recorder())
+    sheet_id = TENANTS[tenant_id].sheet_id
+    return SheetsConnection(lambda: _connect_google_sheets(sheet_id), sheets_scheduler(), metrics_recorder(),
+                            on_auth_error=_drop_gspread_client)
+
+@st.cache_resource(show_spinner=False)
+def tenant_journal(tenant_id):
+    """One tenant's journal of schedule writes, with its syncer replaying them to the sheet"""
+    journal = WriteJournal(TENANTS[tenant_id].write_journal_path)
+    # The syncer runs on its own thread, so it gets the cache and stats objects rather than looking them up
+    cache = tenant_cache(tenant_id)
+    stats = tenant_stats(tenant_id)
+    held = held_emails(tenant_id)
+
+    def applied(entry, result):
+        send = held.pop(entry['id'], None)
+        if send:
+            send()
+
+    def rejected(entry, current):
+        # Nobody hears about a day they didn't get; the session that made the write shows the rejection
+        held.pop(entry['id'], None)
+        # The cached day still shows the write that didn't happen
+        week_start, day_index = entry['week_start'], entry['day_index']
+        cache.invalidate_where(lambda key: key in (('schedule', week_start), ('slot', week_start, day_index)))
+        _record_stats(stats, week_start, day_index, current)
+
+    syncer = JournalSyncer(journal, SheetsStorage(tenant_connection(tenant_id), cache),
+                           on_applied=applied, on_rejected=rejected)
+    syncer.start()
+    return syncer
+
+def write_journal():
+    """The current tenant's journal syncer"""
+    return tenant_journal(current_tenant().id)
+
+@st.cache_resource(show_spinner=False)
+def tenant_storage(tenant_id):
+    """One tenant's storage backend (storage_backend secret: sheets / sqlite / memory)"""
+    tenant = TENANTS[tenant_id]
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteStorage(tenant.sqlite_path)
+    if tenant.write_journal_path:
+        syncer = tenant_journal(tenant_id)
+        return JournaledStorage(syncer.backend, syncer.journal, check_timeout=JOURNAL_CHECK_SECONDS)
+    return SheetsStorage(tenant_connection(tenant_id), tenant_cache(tenant_id))
+
+def get_storage():
+    """The current tenant's storage backend"""
+    return tenant_storage(current_tenant().id)
 
 # ===========================
 # Data Management Functions
 # ===========================
 
+# Sentinel for "not in the cache" (an empty week is a legitimately cached {})
+_NOT_CACHED = object()
+
+@st.cache_resource(show_spinner=False)
+def cache_budget():
+    """Entry limit shared by every tenant's cache, so memory doesn't grow with the number of tenants"""
+    return CacheBudget(CACHE_MAX_ENTRIES_TOTAL)
+
+@st.cache_resource(show_spinner=False)
+def tenant_cache(tenant_id):
+    """Cache of one tenant's People/Schedule reads, shared by all of its sessions"""
+    detector = None
+    if STORAGE_BACKEND != "sqlite" and CHANGE_CHECK_SECONDS > 0:
+        detector = ChangeDetector(tenant_connection(tenant_id).modified_time, interval=CHANGE_CHECK_SECONDS)
+    return TTLCache(ttl=CACHE_TTL_SECONDS, maxsize=CACHE_MAX_ENTRIES, detector=detector, budget=cache_budget())
+
+def data_cache():
+    """The current tenant's read cache"""
+    return tenant_cache(current_tenant().id)
+
+def _people_loader(tenant, storage):
+    """Loader for the cached People list - phones are normalized once here instead of on every draw"""
+    return lambda: with_e164(storage.load_people(), tenant.phone_country_code)
+
 def load_people():
-    """Load people from Google Sheets"""
+    """Load people, served from the shared cache while it is fresh"""
     try:
-        spreadsheet = get_google_sheet()
-        if not spreadsheet:
-            return []
-        
-        worksheet = spreadsheet.worksheet("People")
-        
-        # Get all values as a list of lists
-        all_values = worksheet.get_all_values()
-        
-        if not all_values or len(all_values) < 1:
-            return []
-        
-        # First row is headers
-        headers = all_values[0]
-        
-        # Find column indices
-        try:
-            name_idx = headers.index('name')
-            phone_idx = headers.index('phone')
-            # Email column is optional - might not exist yet
-            email_idx = headers.index('email') if 'email' in headers else None
-        except ValueError as e:
-            st.error(f"חסרות כותרות בטאב People: {str(e)}")
-            return []
-        
-        # Build people list
-        people = []
-        for row in all_values[1:]:  # Skip header row
-            if len(row) > name_idx and row[name_idx]:
-                person = {
-                    'name': row[name_idx],
-                    'phone': row[phone_idx] if len(row) > phone_idx else ''
-                }
-                # Add email if column exists
-                if email_idx is not None and len(row) > email_idx:
-                    person['email'] = row[email_idx]
-                else:
-                    person['email'] = ''
-                people.append(person)
-        
-        return people
+        _wait_for_warm_up()
+        return data_cache().get_or_load('people', _people_loader(current_tenant(), get_storage()))
+    except SheetFormatError as e:
+        st.error(str(e))
+        return []
     except Exception as e:
         st.error(f"שגיאה בטעינת רשימת אנשים: {str(e)}")
         return []
 
 def save_person(name, phone, email=''):
-    """Save a new person to Google Sheets"""
+    """Save a new person"""
     try:
-        spreadsheet = get_google_sheet()
-        if not spreadsheet:
-            return False
-        
-        worksheet = spreadsheet.worksheet("People")
-        worksheet.append_row([name, phone, email])
+        get_storage().save_person(name, phone, email)
+        data_cache().invalidate('people')
         return True
     except Exception as e:
         st.error(f"שגיאה בשמירת איש קשר: {str(e)}")
         return False
 
+def import_people(people):
+    """Add a batch of people with a single write; returns how many were added or None on failure"""
+    try:
+        get_storage().save_people(people)
+        data_cache().invalidate('people')
+        return len(people)
+    except Exception as e:
+        st.error(f"שגיאה בייבוא אנשי קשר: {str(e)}")
+        return None
+
 def delete_person(name):
-    """Delete a person from Google Sheets"""
+    """Delete a person"""
     try:
-        spreadsheet = get_google_sheet()
-        if not spreadsheet:
-            return False
-        
-        worksheet = spreadsheet.worksheet("People")
-        records = worksheet.get_all_records()
-        
-        # Find the row to delete (row numbers start at 2 because row 1 is header)
-        for idx, record in enumerate(records, start=2):
-            if record['name'] == name:
-                worksheet.delete_rows(idx)
-                return True
-        
-        return False
+        deleted = get_storage().delete_person(name)
+        data_cache().invalidate('people')
+        return deleted
     except Exception as e:
         st.error(f"שגיאה במחיקת איש קשר: {str(e)}")
         return False
 
+def _load_weeks(storage, cache, week_starts):
+    """Make sure the given weeks are cached, fetching all missing ones with a single storage read"""
+    def fetch(keys):
+        weeks = storage.load_schedule_weeks([key[1] for key in keys])
+        return {('schedule', week_start): schedule for week_start, schedule in weeks.items()}
+    
+    cached = cache.get_or_load_many([('schedule', week_start) for week_start in week_starts], fetch)
+    return {key[1]: schedule for key, schedule in cached.items()}
+
+@st.cache_resource(show_spinner=False)
+def _prefetch_state(tenant_id):
+    """Weeks of a tenant currently being prefetched, so sessions don't start duplicate loads"""
+    return {'lock': threading.Lock(), 'weeks': set()}
+
+def prefetch_weeks(storage, cache, week_starts):
+    """Load weeks into the shared cache on a background thread"""
+    state = _prefetch_state(current_tenant().id)
+    with state['lock']:
+        week_starts = [week_start for week_start in week_starts if week_start not in state['weeks']]
+        state['weeks'].update(week_starts)
+    if not week_starts:
+        return
+    
+    def run():
+        try:
+            _load_weeks(storage, cache, week_starts)
+        except Exception:
+            # Prefetching is best effort - the week just loads normally when opened
+            pass
+        finally:
+            with state['lock']:
+                state['weeks'].difference_update(week_starts)
+    
+    threading.Thread(target=run, name="schedule-prefetch", daemon=True).start()
+
+@st.cache_resource(show_spinner=False)
+def _warm_up_events():
+    """{tenant_id: Event set once the warm-up has loaded that tenant} - empty until main() starts it"""
+    return {}
+
+@st.cache_resource(show_spinner=False)
+def warm_up():
+    """Once per process: load every tenant's people and current weeks on a background thread, default tenant first"""
+    if not WARM_UP_ON_START:
+        return
+    tenant_ids = [DEFAULT_TENANT_ID] + [tenant_id for tenant_id in TENANTS if tenant_id != DEFAULT_TENANT_ID]
+    # Resources are looked up here, on the script thread; the thread only does the slow part
+    jobs = [(TENANTS[tenant_id], tenant_storage(tenant_id), tenant_cache(tenant_id), threading.Event())
+            for tenant_id in tenant_ids]
+    this_week = get_week_start(datetime.now())
+    window = [shift_week(this_week, offset) for offset in range(-PREFETCH_WEEKS, PREFETCH_WEEKS + 1)]
+    
+    def run():
+        for tenant, storage, cache, warm in jobs:
+            try:
+                cache.get_or_load('people', _people_loader(tenant, storage))
+                _load_weeks(storage, cache, window)
+            except Exception:
+                # Best effort, like prefetching - the page reads whatever is missing itself
+                pass
+            finally:
+                warm.set()
+    
+    _warm_up_events().update({tenant_id: warm for tenant_id, (_, _, _, warm) in zip(tenant_ids, jobs)})
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+def _wait_for_warm_up():
+    """A page drawn while the warm-up is still loading its tenant waits for it rather than reading twice"""
+    warm = _warm_up_events().get(current_tenant().id)
+    if warm is not None:
+        warm.wait(WARM_UP_WAIT_SECONDS)
+
 def load_schedule(week_start):
-    """Load schedule for a specific week from Google Sheets"""
+    """Load schedule for a specific week from the shared cache, keeping the neighbouring weeks warm
+    
+    On a miss the whole window (PREFETCH_WEEKS either side) is read in one round trip;
+    on a hit any window weeks that aren't cached yet are prefetched in the background,
+    so flipping between weeks is served from memory.
+    """
     try:
-        spreadsheet = get_google_sheet()
-        if not spreadsheet:
-            return {}
-        
-        worksheet = spreadsheet.worksheet("Schedule")
-        
-        # Get all values as a list of lists
-        all_values = worksheet.get_all_values()
-        
-        if not all_values or len(all_values) < 1:
-            return {}
-        
-        # First row is headers
-        headers = all_values[0]
+        storage, cache = get_storage(), data_cache()
+        window = [shift_week(week_start, offset) for offset in range(-PREFETCH_WEEKS, PREFETCH_WEEKS + 1)]
+        missing = [key[1] for key in cache.missing([('schedule', week) for week in window])]
         
-        # Find column indices
-        try:
-            week_start_idx = headers.index('week_start')
-            day_index_idx = headers.index('day_index')
-            person_name_idx = headers.index('person_name')
-            person_phone_idx = headers.index('person_phone')
-            # Email column is optional
-            person_email_idx = headers.index('person_email') if 'person_email' in headers else None
-        except ValueError as e:
-            st.error(f"חסרות כותרות בטאב Schedule: {str(e)}")
-            return {}
-        
-        # Build schedule dictionary
-        schedule = {}
-        for row in all_values[1:]:  # Skip header row
-            if len(row) > max(week_start_idx, day_index_idx, person_name_idx, person_phone_idx):
-                if row[week_start_idx] == week_start and row[day_index_idx]:
-                    try:
-                        day_idx = int(row[day_index_idx])
-                        assignment = {
-                            'person_name': row[person_name_idx] if len(row) > person_name_idx else '',
-                            'person_phone': row[person_phone_idx] if len(row) > person_phone_idx else ''
-                        }
-                        # Add email if column exists
-                        if person_email_idx is not None and len(row) > person_email_idx:
-                            assignment['person_email'] = row[person_email_idx]
-                        else:
-                            assignment['person_email'] = ''
-                        schedule[day_idx] = assignment
-                    except (ValueError, IndexError):
-                        continue
+        if week_start not in missing:
+            schedule = cache.get(('schedule', week_start), _NOT_CACHED)
+            if schedule is not _NOT_CACHED:
+                if missing:
+                    prefetch_weeks(storage, cache, missing)
+                return schedule
         
-        return schedule
+        _wait_for_warm_up()
+        return _load_weeks(storage, cache, window)[week_start]
+    except SheetFormatError as e:
+        st.error(str(e))
+        return {}
     except Exception as e:
         st.error(f"שגיאה בטעינת לוח שבועי: {str(e)}")
         return {}
 
-def save_assignment(week_start, day_index, person_name, person_phone, person_email=''):
-    """Save an assignment to Google Sheets"""
+def load_slot(week_start, day_index):
+    """Load one day's assignment - from the cached week if there is one, otherwise a single-row read"""
     try:
-        spreadsheet = get_google_sheet()
-        if not spreadsheet:
-            return False
-        
-        worksheet = spreadsheet.worksheet("Schedule")
-        
-        # First, try to find and delete existing assignment for this week and day
-        all_values = worksheet.get_all_values()
-        if len(all_values) > 1:
-            headers = all_values[0]
-            try:
-                week_start_idx = headers.index('week_start')
-                day_index_idx = headers.index('day_index')
-            except ValueError:
-                pass
-            else:
-                for idx, row in enumerate(all_values[1:], start=2):
-                    if len(row) > max(week_start_idx, day_index_idx):
-                        if row[week_start_idx] == week_start and str(row[day_index_idx]) == str(day_index):
-                            worksheet.delete_rows(idx)
-                            break
-        
-        # Add new assignment
-        worksheet.append_row([week_start, day_index, person_name, person_phone, person_email])
+        cache = data_cache()
+        schedule = cache.get(('schedule', week_start), _NOT_CACHED)
+        if schedule is not _NOT_CACHED:
+            return schedule.get(day_index)
+        return cache.get_or_load(('slot', week_start, day_index),
+                                 lambda: get_storage().load_slot(week_start, day_index))
+    except SheetFormatError as e:
+        st.error(str(e))
+        return None
+    except Exception as e:
+        st.error(f"שגיאה בטעינת לוח שבועי: {str(e)}")
+        return None
+
+def load_history():
+    """Per-person pickup counts and last dates for the auto-scheduler, from the persistent statistics
+    (kept current by every write), so planning doesn't rescan the Schedule and archive tabs"""
+    stats = load_stats()
+    if stats is None:
+        return History.from_assignments(get_storage().iter_assignments())
+    return History.from_summary(stats.people())
+
+@st.cache_resource(show_spinner=False)
+def tenant_stats(tenant_id):
+    """One tenant's per-person statistics, kept current by every schedule write"""
+    return StatsStore(TENANTS[tenant_id].stats_path)
+
+def pickup_stats():
+    """The current tenant's statistics"""
+    return tenant_stats(current_tenant().id)
+
+def _record_stats(stats, week_start, day_index, assignment):
+    """Apply a write to the statistics"""
+    try:
+        stats.record(week_start, day_index, assignment['person_name'] if assignment else None)
+    except Exception:
+        # The write itself succeeded, so it isn't failed over this - but the counts are now off, so say so
+        # and have the dashboard recount from the schedule on its next load
+        logger.exception("Statistics update failed for %s/%s", week_start, day_index)
+        try:
+            stats.mark_stale()
+        except Exception:
+            logger.exception("Couldn't mark the statistics for a rebuild")
+
+def load_stats():
+    """Per-person statistics - built from the whole schedule the first time, read from the summary after"""
+    try:
+        stats = pickup_stats()
+        if stats.built_at() is None:
+            stats.rebuild(get_storage().iter_schedule())
+        return stats
+    except Exception as e:
+        st.error(f"שגיאה בטעינת סטטיסטיקה: {str(e)}")
+        return None
+
+def rebuild_stats():
+    """Recount the statistics from the whole schedule (after the sheet was edited by hand); returns the slot count"""
+    try:
+        return pickup_stats().rebuild(get_storage().iter_schedule())
+    except Exception as e:
+        st.error(f"שגיאה בבניית הסטטיסטיקה: {str(e)}")
+        return None
+
+def _write_through(week_start, day_index, assignment):
+    """Put a write we just made into the cache, so redrawing the day doesn't read it back"""
+    cache = data_cache()
+    schedule = cache.get(('schedule', week_start), _NOT_CACHED)
+    # Invalidating first stops loads that started before the write from caching the old value
+    cache.invalidate_where(lambda key: key == ('schedule', week_start) or key == ('slot', week_start, day_index))
+    if schedule is not _NOT_CACHED:
+        schedule = dict(schedule)
+        if assignment:
+            schedule[day_index] = assignment
+        else:
+            schedule.pop(day_index, None)
+        cache.set(('schedule', week_start), schedule)
+    cache.set(('slot', week_start, day_index), assignment)
+    tenant_feed(current_tenant().id).changed()
+
+def _slot_taken(error):
+    """Show who got to the slot first and cache what it holds now, so the redraw is current"""
+    _write_through(error.week_start, error.day_index, error.current)
+    if error.current:
+        st.warning(f"⚠️ היום הזה נתפס הרגע על ידי {error.current['person_name']}. בחר יום אחר.")
+    else:
+        st.warning("⚠️ השיבוץ הזה השתנה הרגע על ידי מישהו אחר. רענן ונסה שוב.")
+
+def _check_cached_slot_free(week_start, day_index):
+    """Journaled writes are only checked against the sheet when replayed - catch a day another session
+    just took from the shared cache, so the user hears about it now rather than never"""
+    cache = data_cache()
+    schedule = cache.get(('schedule', week_start), _NOT_CACHED)
+    current = (schedule.get(day_index) if schedule is not _NOT_CACHED
+               else cache.get(('slot', week_start, day_index), _NOT_CACHED))
+    if current is not _NOT_CACHED:
+        check_expected_version(week_start, day_index, current, 0)
+
+def _track_journaled(week_start, day_index, assignment):
+    """Remember this session's writes still waiting in the journal, so a rejection is shown to it"""
+    if (assignment or {}).get('version', 0) < 0:
+        label = f"{assignment['person_name']} - {DAY_NAMES[int(day_index)]} {slot_date(week_start, day_index)}"
+        st.session_state.setdefault('pending_writes', {})[-assignment['version']] = label
+
+def save_assignment(week_start, day_index, person_name, person_phone, person_email='', expected_version=0,
+                    notify=False):
+    """Save an assignment - by default only if the day is still free; `notify` queues the emails about it"""
+    try:
+        if expected_version == 0 and isinstance(get_storage(), JournaledStorage):
+            _check_cached_slot_free(week_start, day_index)
+        assignment = get_storage().save_assignment(week_start, day_index, person_name, person_phone,
+                                                   person_email, expected_version=expected_version)
+        _write_through(week_start, day_index, assignment)
+        _record_stats(pickup_stats(), week_start, day_index, assignment)
+        _track_journaled(week_start, day_index, assignment)
+        if notify:
+            queue_assignment_emails(week_start, day_index, assignment)
         return True
+    except SlotConflictError as e:
+        _slot_taken(e)
+        return False
     except Exception as e:
         st.error(f"שגיאה בשמירת שיבוץ: {str(e)}")
         return False
 
-def clear_assignment(week_start, day_index):
-    """Clear an assignment from Google Sheets"""
+def clear_assignment(week_start, day_index, expected_version=None):
+    """Clear an assignment - only the one the admin saw, when `expected_version` is given"""
     try:
-        spreadsheet = get_google_sheet()
-        if not spreadsheet:
-            return False
-        
-        worksheet = spreadsheet.worksheet("Schedule")
-        records = worksheet.get_all_records()
-        
-        for idx, record in enumerate(records, start=2):
-            if record.get('week_start') == week_start and record.get('day_index') == day_index:
-                worksheet.delete_rows(idx)
-                return True
-        
-        return True  # Return True even if not found (it's already cleared)
+        get_storage().clear_assignment(week_start, day_index, expected_version=expected_version)
+        _write_through(week_start, day_index, None)
+        _record_stats(pickup_stats(), week_start, day_index, None)
+        return True
+    except SlotConflictError as e:
+        _slot_taken(e)
+        return False
     except Exception as e:
         st.error(f"שגיאה במחיקת שיבוץ: {str(e)}")
         return False
 
+def fill_slots(assignments):
+    """Write a batch of assignments into empty days; returns (saved, taken) or None on failure"""
+    try:
+        saved, taken = get_storage().fill_slots(assignments)
+        for assignment in saved:
+            stored = {key: assignment[key] for key in ('person_name', 'person_phone', 'person_email', 'version')}
+            _write_through(assignment['week_start'], assignment['day_index'], stored)
+            _record_stats(pickup_stats(), assignment['week_start'], assignment['day_index'], stored)
+            _track_journaled(assignment['week_start'], assignment['day_index'], stored)
+        return saved, taken
+    except Exception as e:
+        st.error(f"שגיאה בשמירת שיבוץ: {str(e)}")
+        return None
+
+def export_schedule(storage=None):
+    """Every assignment, archived weeks included, as CSV lines - read lazily when the export is started"""
+    return csv_io.schedule_csv((storage or get_storage()).iter_schedule())
+
+def archive_schedule(weeks=ARCHIVE_AFTER_WEEKS):
+    """Archive weeks more than `weeks` weeks old; returns (archived, dropped) row counts or None on failure"""
+    try:
+        horizon = shift_week(get_week_start(datetime.now()), -weeks)
+        result = get_storage().archive(horizon)
+        # Row numbers changed, so cached slots and weeks may point at the wrong rows
+        data_cache().invalidate_where(lambda key: isinstance(key, tuple) and key[0] in ('schedule', 'slot'))
+        return result
+    except Exception as e:
+        st.error(f"שגיאה בארכוב: {str(e)}")
+        return None
+
+# ===========================
+# Reminders
+# ===========================
+
+@st.cache_resource(show_spinner=False)
+def tenant_reminders(tenant_id):
+    """One tenant's rendered reminder texts and links, shared by all of its sessions"""
+    tenant = TENANTS[tenant_id]
+    return ReminderBook(tenant.reminder, tenant.phone_country_code)
+
+def reminder_book():
+    """The current tenant's reminder book"""
+    return tenant_reminders(current_tenant().id)
+
+def _phones(people):
+    """{name: E.164 phone} from the loaded People list"""
+    return {person['name']: person['phone_e164'] for person in people if person.get('phone_e164')}
+
+def reminder_for(week_start, day_index, assignment):
+    """The reminder for one assigned day, or None without a phone"""
+    book = reminder_book()
+    return book.reminder(week_start, day_index, assignment['person_name'],
+                         book.phone_of(assignment, _phones(load_people())))
+
+def _period_reminders(tenant_id, first, last):
+    """A tenant's reminders from `first` to `last` (YYYY-MM-DD), with all of their weeks read in one go
+    
+    Takes the tenant explicitly, so the scheduler thread can use it too.
+    """
+    storage, cache = tenant_storage(tenant_id), tenant_cache(tenant_id)
+    week_starts = []
+    week_start = get_week_start(datetime.strptime(first, "%Y-%m-%d"))
+    while week_start <= last:
+        week_starts.append(week_start)
+        week_start = shift_week(week_start, 1)
+    weeks = _load_weeks(storage, cache, week_starts)
+    people = cache.get_or_load('people', _people_loader(TENANTS[tenant_id], storage))
+    return tenant_reminders(tenant_id).collect(weeks, _phones(people), first, last)
+
+def _queue_reminders(tenant_id, reminders, first, last, dedupe_key=None):
+    """Queue one webhook call carrying every reminder of the period; None if `dedupe_key` was already queued"""
+    tenant = TENANTS[tenant_id]
+    return notification_outbox().enqueue(tenant.make_webhook_url_reminders,
+                                         batch_payload(reminders, first, last, tenant.app_url), dedupe_key=dedupe_key)
+
+def collect_reminders(first, last):
+    """The current tenant's reminders from `first` to `last`, or None on failure"""
+    try:
+        return _period_reminders(current_tenant().id, first, last)
+    except Exception as e:
+        st.error(f"שגיאה בהכנת תזכורות: {str(e)}")
+        return None
+
+def send_reminders(reminders, first, last):
+    """Send a period's reminders as one webhook call (through the outbox)"""
+    try:
+        _queue_reminders(current_tenant().id, reminders, first, last)
+        return True
+    except Exception as e:
+        st.error(f"שגיאה בשליחת תזכורות: {str(e)}")
+        return False
+
+@st.cache_resource(show_spinner=False)
+def reminder_schedulers():
+    """Once per process: for each tenant with reminders_send_at, a thread sending the next day's reminders daily"""
+    schedulers = {}
+    for tenant in TENANTS.values():
+        try:
+            send_at = parse_send_time(tenant.reminders_send_at)
+        except ValueError as e:
+            # One tenant's typo shouldn't take the app down; reminders_panel shows it to the admin
+            logger.error("Tenant %s: scheduled reminders off: %s", tenant.id, e)
+            continue
+        if send_at is None or not tenant.make_webhook_url_reminders:
+            continue
+        
+        def send(date, tenant_id=tenant.id):
+            reminders = _period_reminders(tenant_id, date, date)
+            if reminders:
+                # Every process runs a scheduler; the key makes sure the day goes out once
+                _queue_reminders(tenant_id, reminders, date, date, dedupe_key=f"reminders:{tenant_id}:{date}")
+        
+        schedulers[tenant.id] = ReminderScheduler(send_at, send, days_ahead=tenant.reminders_days_ahead)
+        schedulers[tenant.id].start()
+    return schedulers
+
+# ===========================
+# Calendar feeds
+# ===========================
+
+def _feed_weeks(tenant_id):
+    """Loader for a tenant's feed - the weeks around the current one, read through the shared cache"""
+    storage, cache = tenant_storage(tenant_id), tenant_cache(tenant_id)
+    
+    def load():
+        this_week = get_week_start(datetime.now())
+        return _load_weeks(storage, cache, [shift_week(this_week, offset)
+                                            for offset in range(-CALENDAR_WEEKS_BACK, CALENDAR_WEEKS_AHEAD + 1)])
+    return load
+
+@st.cache_resource(show_spinner=False)
+def tenant_feed(tenant_id):
+    """One tenant's pre-rendered calendar feeds, shared by all of its sessions and the feed server"""
+    return CalendarFeed(_feed_weeks(tenant_id), TENANTS[tenant_id].child_name, tenant_id,
+                        interval=CALENDAR_REFRESH_SECONDS)
+
+def calendar_document(person=None):
+    """The current tenant's .ics for `person` (None = everyone) from the pre-rendered feed, or None on failure"""
+    try:
+        return tenant_feed(current_tenant().id).document(person).body
+    except Exception as e:
+        st.error(f"שגיאה בהכנת קובץ היומן: {str(e)}")
+        return None
+
+def calendar_url(person=None):
+    """The subscription URL of the current tenant's feed, or '' when no public feed URL is configured"""
+    if not CALENDAR_URL:
+        return ''
+    params = {'tenant': current_tenant().id}
+    if person:
+        params['person'] = person
+    return f"{CALENDAR_URL}?{urllib.parse.urlencode(params)}"
+
+@st.cache_resource(show_spinner=False)
+def calendar_server():
+    """Once per process, with calendar_port set: keep every tenant's feeds current and serve them over HTTP"""
+    if not CALENDAR_PORT:
+        return None
+    feeds = {tenant_id: tenant_feed(tenant_id) for tenant_id in TENANTS}
+    try:
+        server = FeedServer(feeds, CALENDAR_HOST, CALENDAR_PORT, default_tenant=DEFAULT_TENANT_ID)
+        server.start()
+    except OSError as e:
+        st.error(f"שגיאה בהפעלת שרת היומן: {str(e)}")
+        return None
+    for feed in feeds.values():
+        feed.start()
+    return server
+
 # ===========================
 # Helper Functions
 # ===========================
@@ -320,6 +797,11 @@ def get_week_start(date):
     sunday = date - timedelta(days=days_since_sunday)
     return sunday.strftime("%Y-%m-%d")
 
+def shift_week(week_start_str, weeks):
+    """Move a week_start string forward (or back, for negative values) by whole weeks"""
+    week_start = datetime.strptime(week_start_str, "%Y-%m-%d")
+    return (week_start + timedelta(weeks=weeks)).strftime("%Y-%m-%d")
+
 def get_week_dates(week_start_str):
     """Get all dates for the week starting from week_start"""
     week_start = datetime.strptime(week_start_str, "%Y-%m-%d")
@@ -349,7 +831,7 @@ def admin_settings():
     if not st.session_state.admin_authenticated:
         password = st.text_input("סיסמת מנהל:", type="password")
         if st.button("כניסה"):
-            if password == st.secrets.get("admin_password", "1234"):
+            if password == current_tenant().admin_password:
                 st.session_state.admin_authenticated = True
                 st.rerun()
             else:
@@ -358,9 +840,6 @@ def admin_settings():
     
     st.success("התחברת כמנהל")
     
-    # Load existing people
-    people = load_people()
-    
     st.subheader("➕ הוסף איש קשר חדש")
     with st.form("add_person_form"):
         new_name = st.text_input("שם:")
@@ -373,31 +852,407 @@ def admin_settings():
                 st.success(f"✅ {new_name} נוסף בהצלחה!")
                 st.rerun()
     
-    st.subheader("👥 רשימת אנשי קשר")
-    if people:
-        for person in people:
-            col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
-            with col1:
-                st.write(f"**{person['name']}**")
-            with col2:
-                st.write(person.get('phone', ''))
-            with col3:
-                st.write(person.get('email', ''))
-            with col4:
-                if st.button("🗑️", key=f"delete_{person['name']}"):
-                    if delete_person(person['name']):
-                        st.success(f"✅ {person['name']} נמחק!")
-                        st.rerun()
-    else:
-        st.info("אין אנשי קשר. הוסף את הראשון!")
+    people_list()
+    
+    stats_panel()
+    auto_schedule_panel()
+    import_export_panel()
+    archive_panel()
+    reminders_panel()
+    notifications_panel()
+    journal_panel()
+    instrumentation_panel()
     
     if st.button("🚪 התנתק"):
         st.session_state.admin_authenticated = False
         st.rerun()
 
+def rerun_fragment():
+    """Redraw only the fragment we're in; falls back to a full rerun when it was drawn by one"""
+    try:
+        st.rerun(scope="fragment")
+    except st.errors.StreamlitAPIException:
+        st.rerun()
+
+@st.fragment
+def people_list():
+    """Contacts with delete buttons - deleting redraws only this list"""
+    with metrics_recorder().rerun(st.session_state.metrics_session):
+        people = load_people()
+        
+        st.subheader("👥 רשימת אנשי קשר")
+        if people:
+            for person in people:
+                col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
+                with col1:
+                    st.write(f"**{person['name']}**")
+                with col2:
+                    st.write(person.get('phone', ''))
+                with col3:
+                    st.write(person.get('email', ''))
+                with col4:
+                    if st.button("🗑️", key=f"delete_{person['name']}"):
+                        if delete_person(person['name']):
+                            st.success(f"✅ {person['name']} נמחק!")
+                            rerun_fragment()
+        else:
+            st.info("אין אנשי קשר. הוסף את הראשון!")
+
+def stats_panel():
+    """How often each person has helped, by weekday and by month"""
+    st.subheader("📈 סטטיסטיקה")
+    stats = load_stats()
+    if stats is None:
+        return
+    
+    # The app books Sunday-Friday, but Saturday rows added in the sheet are counted too
+    day_names = DAY_NAMES + ["שבת"]
+    rows = {person['person_name']: person for person in stats.people()}
+    # People who haven't helped yet still get a row
+    for person in load_people():
+        rows.setdefault(person['name'], {'person_name': person['name'], 'total': 0, 'days': [0] * len(day_names),
+                                         'last_date': '', 'streak': 0, 'streak_end': '', 'longest_streak': 0})
+    if not rows:
+        st.info("אין עדיין שיבוצים.")
+        return
+    
+    # A streak is still running if it reaches last week
+    running_since = shift_week(get_week_start(datetime.now()), -1)
+    table = []
+    for person in rows.values():
+        row = {"שם": person['person_name'], "סה\"כ": person['total']}
+        row.update(zip(day_names, person['days']))
+        row["שיבוץ אחרון"] = person['last_date']
+        row["רצף נוכחי (שבועות)"] = person['streak'] if person['streak_end'] >= running_since else 0
+        row["רצף שיא (שבועות)"] = person['longest_streak']
+        table.append(row)
+    st.dataframe(table, hide_index=True)
+    
+    st.caption("שיבוצים לפי יום בשבוע")
+    for column, day, day_name in zip(st.columns(len(day_names)), range(len(day_names)), day_names):
+        column.metric(day_name, sum(person['days'][day] for person in rows.values()))
+    
+    st.caption("שיבוצים לפי חודש (12 החודשים האחרונים)")
+    today = datetime.now()
+    year, month = (today.year, 1) if today.month == 12 else (today.year - 1, today.month + 1)
+    months = stats.months(f"{year}-{month:02d}")
+    if months:
+        st.bar_chart({"חודש": [row[0] for row in months], "שם": [row[1] for row in months],
+                      "שיבוצים": [row[2] for row in months]},
+                     x="חודש", y="שיבוצים", color="שם")
+    
+    built_at = stats.built_at()
+    if built_at:
+        st.caption(f"נספר מחדש מכל הלוח: {datetime.fromtimestamp(built_at).strftime('%d/%m/%Y %H:%M')}")
+    if st.button("🔁 ספור מחדש מהגיליון"):
+        slots = rebuild_stats()
+        if slots is not None:
+            st.success(f"✅ נספרו {slots} שיבוצים")
+            st.rerun()
+
+def instrumentation_panel():
+    """Live timings of external calls, cache efficiency and quota headroom"""
+    st.subheader("📊 ביצועים ומכסות")
+    recorder = metrics_recorder()
+    cache = data_cache()
+    
+    # The last entry is the rerun drawing this page, which is still in progress
+    reruns = recorder.session_reruns(st.session_state.metrics_session)
+    previous = reruns[-2] if len(reruns) > 1 else None
+    lookups = cache.hits + cache.misses
+    reads_left = max(0, SHEETS_READS_PER_MINUTE - recorder.calls_last_minute("sheets.read"))
+    writes_left = max(0, SHEETS_WRITES_PER_MINUTE - recorder.calls_last_minute("sheets.write"))
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("פניות בריצה הקודמת", previous['calls'] if previous else 0)
+    col2.metric("ממוצע פניות לריצה", f"{recorder.calls_per_rerun():.1f}")
+    col3.metric("פגיעה במטמון", f"{100 * cache.hits / lookups:.0f}%" if lookups else "-")
+    col4.metric("מכסת קריאה לדקה", reads_left)
+    col5.metric("מכסת כתיבה לדקה", writes_left)
+    
+    operations = recorder.operations()
+    if operations:
+        st.dataframe(operations, hide_index=True)
+    else:
+        st.caption("עוד לא בוצעו פניות חיצוניות.")
+    
+    scheduler_stats = sheets_scheduler().stats
+    st.caption(f"שגיאות מכסה (429): {scheduler_stats['quota_errors']} · ניסיונות חוזרים: "
+               f"{scheduler_stats['retries']} · בקשות שהמתינו למכסה: {scheduler_stats['throttled']} · "
+               f"קריאות שאוחדו: {scheduler_stats['coalesced']}")
+    if cache.detector is not None:
+        st.caption(f"בדיקות שינוי בגיליון: {cache.detector.checks} · שינויים שזוהו: {cache.detector.changes} · "
+                   f"רשומות שאומתו בלי קריאה מחדש: {cache.revalidations}")
+    
+    feed = tenant_feed(current_tenant().id)
+    st.caption(f"יומן: הורדות מלאות {feed.served} · ענו 304 (לא השתנה) {feed.not_modified} · "
+               f"רענונים {feed.refreshes} · רינדורים {feed.renders}")
+    
+    errors = recorder.recent_errors()
+    if errors:
+        with st.expander(f"שגיאות אחרונות ({len(errors)})"):
+            for error in reversed(errors):
+                st.write(f"{datetime.fromtimestamp(error['time']).strftime('%H:%M:%S')} "
+                         f"`{error['op']}` - {error['outcome']}")
+    
+    gauges = {
+        'pickup_cache_hits_total': cache.hits,
+        'pickup_cache_misses_total': cache.misses,
+        'pickup_cache_revalidations_total': cache.revalidations,
+        'pickup_sheets_reads_left_per_minute': reads_left,
+        'pickup_sheets_writes_left_per_minute': writes_left,
+        'pickup_sheets_quota_errors_total': scheduler_stats['quota_errors'],
+    }
+    if isinstance(get_storage(), JournaledStorage):
+        journal_stats = get_storage().journal.stats()
+        gauges['pickup_journal_pending'] = journal_stats['pending']
+        gauges['pickup_journal_oldest_pending_seconds'] = round(journal_stats['oldest_pending_seconds'], 1)
+    st.download_button("⬇️ ייצוא Prometheus", recorder.prometheus_text(extra=gauges),
+                       file_name="metrics.prom", mime="text/plain")
+
+def auto_schedule_panel():
+    """Fill a range of weeks automatically, with a preview to approve before anything is written"""
+    st.subheader("🤖 שיבוץ אוטומטי")
+    st.caption("ממלא את הימים הפנויים לפי תור הוגן. אילוצים נלקחים מהעמודות "
+               "available_days, blackout_dates ו-max_per_week בטאב People.")
+    
+    today = datetime.now()
+    col1, col2 = st.columns(2)
+    with col1:
+        start = st.date_input("מתאריך:", today, key="autoschedule_start")
+    with col2:
+        end = st.date_input("עד תאריך:", today + timedelta(weeks=4), key="autoschedule_end")
+    
+    if st.button("👀 תצוגה מקדימה"):
+        week_starts = []
+        week = get_week_start(datetime.combine(start, datetime.min.time()))
+        while week <= end.strftime("%Y-%m-%d"):
+            week_starts.append(week)
+            week = shift_week(week, 1)
+        try:
+            schedule = _load_weeks(get_storage(), data_cache(), week_starts)
+            plan = plan_schedule(load_people(), schedule, load_history(), week_starts,
+                                 today=max(start, today.date()).strftime("%Y-%m-%d"))
+            # Days after the end date in the last week stay empty
+            plan.proposals = [p for p in plan.proposals if p['date'] <= end.strftime("%Y-%m-%d")]
+            plan.unfilled = [u for u in plan.unfilled if u['date'] <= end.strftime("%Y-%m-%d")]
+            st.session_state.autoschedule_plan = plan
+        except Exception as e:
+            st.error(f"שגיאה בתכנון השיבוץ: {str(e)}")
+    
+    plan = st.session_state.get('autoschedule_plan')
+    if plan is None:
+        return
+    
+    for name, error in plan.invalid.items():
+        st.warning(f"⚠️ {name} לא נכלל - אילוצים לא תקינים: {error}")
+    if plan.unfilled:
+        st.warning("⚠️ אין אף אחד פנוי ל: " + ", ".join(
+            f"{DAY_NAMES[u['day_index']]} {datetime.strptime(u['date'], '%Y-%m-%d').strftime('%d/%m')}"
+            for u in plan.unfilled))
+    if not plan.proposals:
+        st.info("אין ימים פנויים לשבץ בטווח הזה.")
+        return
+    
+    st.dataframe([{
+        'תאריך': datetime.strptime(p['date'], "%Y-%m-%d").strftime("%d/%m/%Y"),
+        'יום': DAY_NAMES[p['day_index']],
+        'ישובץ': p['person']['name'],
+    } for p in plan.proposals], hide_index=True)
+    st.caption(" · ".join(f"{name}: {count}" for name, count in plan.load().most_common()))
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        approve = st.button(f"✅ אשר ושמור {len(plan.proposals)} שיבוצים")
+    with col2:
+        if st.button("ביטול", key="autoschedule_cancel"):
+            del st.session_state.autoschedule_plan
+            st.rerun()
+    
+    if approve:
+        result = fill_slots([{
+            'week_start': p['week_start'], 'day_index': p['day_index'], 'person_name': p['person']['name'],
+            'person_phone': p['person'].get('phone', ''), 'person_email': p['person'].get('email', ''),
+        } for p in plan.proposals])
+        if result is None:
+            return
+        saved, taken = result
+        for assignment in saved:
+            queue_assignment_emails(assignment['week_start'], assignment['day_index'], assignment,
+                                    notify_admin=False)
+        del st.session_state.autoschedule_plan
+        st.success(f"✅ נשמרו {len(saved)} שיבוצים")
+        if taken:
+            st.warning(f"⚠️ {len(taken)} ימים נתפסו בינתיים על ידי אחרים ולא שובצו")
+
+def import_export_panel():
+    """Bulk import of people or schedule rows from CSV, and a CSV export of the whole schedule"""
+    st.subheader("📥 ייבוא וייצוא CSV")
+    st.caption("אנשי קשר: עמודות name, phone ואופציונלית email ועמודות האילוצים. "
+               "שיבוצים: week_start, day_index, person_name ואופציונלית person_phone, person_email.")
+    
+    kind = st.radio("סוג קובץ:", ["אנשי קשר", "שיבוצים"], horizontal=True, key="import_kind")
+    upload = st.file_uploader("קובץ CSV:", type="csv", key="import_file")
+    if upload is not None:
+        try:
+            if kind == "אנשי קשר":
+                result = csv_io.read_people(upload.getvalue(), load_people())
+            else:
+                result = csv_io.read_schedule(upload.getvalue(), load_people())
+        except (ValueError, UnicodeDecodeError) as e:
+            st.error(f"קובץ לא תקין: {str(e)}")
+            result = None
+        
+        if result is not None:
+            for line, message in result.errors:
+                st.warning(f"⚠️ שורה {line}: {message}")
+            if result.duplicates:
+                with st.expander(f"{len(result.duplicates)} שורות כפולות ידולגו"):
+                    for line, label, reason in result.duplicates:
+                        st.write(f"שורה {line}: {label} - {reason}")
+            if not result.rows:
+                st.info("אין שורות חדשות לייבוא.")
+            else:
+                st.dataframe(result.rows, hide_index=True)
+                if st.button(f"📥 ייבא {len(result.rows)} שורות"):
+                    if kind == "אנשי קשר":
+                        added = import_people(result.rows)
+                        if added is not None:
+                            st.success(f"✅ נוספו {added} אנשי קשר")
+                            st.rerun()
+                    else:
+                        filled = fill_slots(result.rows)
+                        if filled is not None:
+                            saved, taken = filled
+                            st.success(f"✅ נשמרו {len(saved)} שיבוצים")
+                            if taken:
+                                st.warning(f"⚠️ {len(taken)} ימים כבר תפוסים ולא יובאו")
+    
+    # Reading every assignment is a full read of the Schedule and archive tabs, so it only happens
+    # when asked for - not on every draw of the page
+    if st.button("📤 הכן ייצוא של כל השיבוצים"):
+        try:
+            # BOM so Excel reads the Hebrew
+            st.session_state.schedule_export = "\ufeff" + "".join(export_schedule())
+        except Exception as e:
+            st.error(f"שגיאה בייצוא: {str(e)}")
+    if 'schedule_export' in st.session_state:
+        st.download_button("⬇️ ייצוא כל השיבוצים (CSV)", st.session_state.schedule_export,
+                           file_name="schedule.csv", mime="text/csv")
+
+def archive_panel():
+    """Move old weeks out of the live Schedule tab"""
+    st.subheader("📦 ארכיון")
+    weeks = st.number_input("העבר לארכיון שבועות ישנים מ- (שבועות):", min_value=1,
+                            value=ARCHIVE_AFTER_WEEKS, step=1)
+    if st.button("📦 העבר לארכיון"):
+        result = archive_schedule(int(weeks))
+        if result is not None:
+            archived, dropped = result
+            st.success(f"✅ {archived} שיבוצים הועברו לארכיון, {dropped} שורות ריקות נמחקו")
+
+def reminders_panel():
+    """A week's or month's reminders at once - as one webhook call or a CSV list"""
+    st.subheader("💬 תזכורות לתקופה")
+    tenant = current_tenant()
+    
+    today = datetime.now()
+    period = st.radio("תקופה:", ["השבוע", "שבוע הבא", "החודש"], horizontal=True, key="reminders_period")
+    if period == "החודש":
+        first = today.replace(day=1)
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    else:
+        first = datetime.strptime(shift_week(get_week_start(today), 0 if period == "השבוע" else 1), "%Y-%m-%d")
+        last = first + timedelta(days=6)
+    first, last = first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+    
+    reminders = collect_reminders(first, last)
+    if reminders is None:
+        return
+    if not reminders:
+        st.info("אין שיבוצים עם מספרי טלפון בתקופה הזו.")
+        return
+    st.caption(f"{len(reminders)} תזכורות, {first} עד {last}")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if tenant.make_webhook_url_reminders:
+            if st.button(f"📤 שלח {len(reminders)} תזכורות בבת אחת"):
+                if send_reminders(reminders, first, last):
+                    st.success("✅ התזכורות נשלחו לתור ההתראות")
+        else:
+            st.caption("לשליחה בבת אחת הגדר make_webhook_url_reminders")
+    with col2:
+        st.download_button("⬇️ הורד רשימה (CSV)",
+                           "\ufeff" + reminders_csv(reminders),  # BOM so Excel reads the Hebrew
+                           file_name=f"reminders-{first}-{last}.csv", mime="text/csv")
+    if tenant.make_webhook_url_reminders and tenant.reminders_send_at:
+        try:
+            parse_send_time(tenant.reminders_send_at)
+        except ValueError:
+            st.warning(f"⚠️ reminders_send_at לא תקין ({tenant.reminders_send_at}) - צריך להיות HH:MM, "
+                       "השליחה האוטומטית כבויה")
+            return
+        st.caption(f"⏰ התזכורות נשלחות אוטומטית כל יום ב-{tenant.reminders_send_at}, "
+                   f"{tenant.reminders_days_ahead} ימים מראש")
+
+def notifications_panel():
+    """Show the webhook outbox status and let the admin retry failed notifications"""
+    st.subheader("📧 תור התראות")
+    outbox = notification_outbox()
+    counts = outbox.stats()
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("ממתינות", counts['pending'] + counts['sending'])
+    col2.metric("נשלחו", counts['sent'])
+    col3.metric("נכשלו", counts['dead'])
+    
+    if counts['dead']:
+        with st.expander("התראות שנכשלו"):
+            for letter in outbox.dead_letters():
+                payload = letter['payload']
+                if payload.get('type') == 'reminders':
+                    what = f"**{payload['count']} תזכורות** - {payload['from']} עד {payload['to']}"
+                else:
+                    what = (f"**{payload.get('person_name', '')}** - {payload.get('day_name', '')} "
+                            f"{payload.get('day_date', '')}")
+                st.write(f"{what} ({letter['attempts']} ניסיונות: {letter['last_error']})")
+        if st.button("🔁 שלח שוב התראות שנכשלו"):
+            st.success(f"{outbox.retry_dead()} התראות הוחזרו לתור")
+
+def journal_panel():
+    """Schedule writes still waiting to reach the sheet, and the ones it turned down"""
+    storage = get_storage()
+    if not isinstance(storage, JournaledStorage):
+        return
+    st.subheader("🔄 סנכרון לגיליון")
+    journal = storage.journal
+    counts = journal.stats()
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("ממתינים לסנכרון", counts['pending'])
+    col2.metric("הממתין הוותיק (שניות)", f"{counts['oldest_pending_seconds']:.0f}")
+    col3.metric("נדחו", counts['rejected'])
+    
+    waiting = journal.pending(limit=1)
+    if waiting and waiting[0]['last_error']:
+        st.warning(f"⚠️ הגיליון לא זמין ({waiting[0]['attempts']} ניסיונות): {waiting[0]['last_error']}. "
+                   "השיבוצים שמורים מקומית וישלחו כשהוא יחזור.")
+    
+    if counts['rejected']:
+        with st.expander("שיבוצים שנדחו כי היום השתנה בגיליון"):
+            for entry in journal.rejected():
+                current = entry['current']['person_name'] if entry['current'] else "ריק"
+                action = entry['person_name'] if entry['op'] == 'save' else "ביטול שיבוץ"
+                st.write(f"**{slot_date(entry['week_start'], entry['day_index'])}** - {action} "
+                         f"(בגיליון עכשיו: {current})")
+        if st.button("✔️ סמן כטופל"):
+            st.success(f"{journal.dismiss_rejected()} שיבוצים סומנו כטופלו")
+
 def schedule_view():
     """Main schedule view"""
-    st.header("📅 לוח שבועי - מי מבלה עם זוהר?")
+    tenant = current_tenant()
+    st.header(f"📅 לוח שבועי - מי מבלה עם {tenant.child_name}?")
     
     # Week navigation
     if 'current_week_offset' not in st.session_state:
@@ -437,69 +1292,77 @@ def schedule_view():
     st.markdown("---")
     st.subheader("📲 שליחת תזכורות WhatsApp")
     
-    # Collect all assignments for this week
-    assignments = []
-    for day_idx in range(6):  # Only weekdays
-        assigned = schedule.get(day_idx)
-        if assigned and assigned.get('person_phone'):
-            date_str = week_dates[day_idx]
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            formatted_date = date_obj.strftime("%d/%m")
-            day_name = days[day_idx]
-            
-            assignments.append({
-                'name': assigned['person_name'],
-                'phone': assigned['person_phone'],
-                'day_name': day_name,
-                'date': formatted_date
-            })
-    
-    if assignments:
-        st.info(f"📋 {len(assignments)} שיבוצים השבוע")
+    # Rendered once per person and week by the shared reminder book, not on every draw
+    week_reminders = reminder_book().collect({week_start_str: schedule}, _phones(people))
+    
+    if week_reminders:
+        st.info(f"📋 {len(week_reminders)} שיבוצים השבוע")
         
         # Show individual WhatsApp buttons
-        for assignment in assignments:
-            whatsapp_message = f"היי {assignment['name']}!\nרק תזכורת קטנה לפני הבילוי עם זוהר ביום {assignment['day_name']}, {assignment['date']}.\nזוהר כבר מתרגש!\nתודה רבה!"
-            whatsapp_link = get_whatsapp_link(assignment['phone'], whatsapp_message)
-            
+        for reminder in week_reminders:
+            formatted_date = datetime.strptime(reminder['date'], "%Y-%m-%d").strftime("%d/%m")
             col1, col2 = st.columns([3, 1])
             with col1:
-                st.write(f"**{assignment['name']}** - {assignment['day_name']} ({assignment['date']})")
+                st.write(f"**{reminder['person_name']}** - {reminder['day_name']} ({formatted_date})")
             with col2:
-                st.markdown(f"[💬 WhatsApp]({whatsapp_link})")
+                st.markdown(f"[💬 WhatsApp]({reminder['link']})")
         
-        # Option to send to all
+        # The whole week as one list (texts and links) to send from anywhere
         st.markdown("---")
-        if st.button("📱 פתח את כל התזכורות ב-WhatsApp"):
-            st.markdown("### לחץ על הקישורים למעלה ↑")
+        st.download_button("⬇️ הורד את כל התזכורות של השבוע",
+                           "\ufeff" + reminders_csv(week_reminders),  # BOM so Excel reads the Hebrew
+                           file_name=f"reminders-{week_start_str}.csv", mime="text/csv")
     else:
         st.info("אין שיבוצים עם מספרי טלפון השבוע.")
     
+    # The whole schedule or one person's days in a phone calendar, from the pre-rendered feed
+    with st.expander("📆 הוספה ליומן"):
+        everyone = "כל הלוח"
+        choice = st.selectbox("של מי?", [everyone] + [person['name'] for person in people], key="calendar_person")
+        person = None if choice == everyone else choice
+        calendar = calendar_document(person)
+        if calendar is not None:
+            st.download_button("⬇️ הורד קובץ יומן (ics)", calendar,
+                               file_name=f"pickup-{tenant.id}.ics" if person is None else "pickup.ics",
+                               mime="text/calendar")
+        url = calendar_url(person)
+        if url:
+            st.caption("או הירשמו ליומן כדי שיתעדכן לבד (ביומן: הוספת יומן מכתובת URL):")
+            st.code(url, language=None)
+    
     # Display schedule
     st.markdown("---")
     
     for day_idx, (day_name, date_str) in enumerate(zip(days, week_dates[:6])):  # Only first 6 days
+        day_slot(week_start_str, day_idx, day_name, date_str)
+
+@st.fragment
+def day_slot(week_start_str, day_idx, day_name, date_str):
+    """One day row - reruns on its own, so assigning a day only redraws and re-reads that day"""
+    with metrics_recorder().rerun(st.session_state.metrics_session):
         date_obj = datetime.strptime(date_str, "%Y-%m-%d")
         formatted_date = date_obj.strftime("%d/%m")
         
         st.markdown(f"### {day_name} - {formatted_date}")
         
         # Check if already assigned
-        assigned = schedule.get(day_idx)
+        assigned = load_slot(week_start_str, day_idx)
         
         col1, col2 = st.columns([3, 1])
         
         with col1:
             if assigned:
-                st.success(f"✅ **{assigned['person_name']}** מבלה עם זוהר")
+                st.success(f"✅ **{assigned['person_name']}** מבלה עם {current_tenant().child_name}")
                 if assigned.get('person_phone'):
                     st.caption(f"📞 {assigned['person_phone']}")
                     
                     # WhatsApp reminder button
-                    whatsapp_message = f"היי {assigned['person_name']}!\nרק תזכורת קטנה לפני הבילוי עם זוהר ביום {day_name}, {formatted_date}.\nזוהר כבר מתרגש!\nתודה רבה!"
-                    whatsapp_link = get_whatsapp_link(assigned['person_phone'], whatsapp_message)
-                    st.markdown(f"[💬 שלח תזכורת בWhatsApp]({whatsapp_link})", unsafe_allow_html=True)
+                    reminder = reminder_for(week_start_str, day_idx, assigned)
+                    if reminder:
+                        st.markdown(f"[💬 שלח תזכורת בWhatsApp]({reminder['link']})", unsafe_allow_html=True)
             else:
+                people = load_people()
+                
                 # Selection
                 selected_person = st.selectbox(
                     "בחר מי אוסף:",
@@ -510,67 +1373,95 @@ def schedule_view():
                 if selected_person and st.button("שבץ", key=f"assign_{day_idx}_{week_start_str}"):
                     person = next((p for p in people if p['name'] == selected_person), None)
                     if person:
-                        if save_assignment(week_start_str, day_idx, person['name'], person.get('phone', ''), person.get('email', '')):
+                        # Emails to the admin and the assigned person are queued with the save
+                        if save_assignment(week_start_str, day_idx, person['name'], person.get('phone', ''),
+                                           person.get('email', ''), notify=True):
                             st.success(f"✅ {person['name']} שובץ ליום {day_name}!")
-                            
-                            # Send email notification to admin
-                            try:
-                                send_email_notification(
-                                    person['name'],
-                                    person.get('phone', ''),
-                                    day_name,
-                                    formatted_date
-                                )
-                            except Exception as e:
-                                pass
-                            
-                            # Send email to assigned person
-                            if person.get('email'):
-                                try:
-                                    send_email_to_person(
-                                        person['name'],
-                                        person['email'],
-                                        day_name,
-                                        formatted_date
-                                    )
-                                except Exception as e:
-                                    pass
-                            
-                            st.rerun()
+                            rerun_fragment()
         
         with col2:
             if assigned:
                 # Only show delete button if user is admin
                 if st.session_state.get('admin_authenticated', False):
                     if st.button("❌ בטל", key=f"clear_{day_idx}_{week_start_str}"):
-                        if clear_assignment(week_start_str, day_idx):
+                        if clear_assignment(week_start_str, day_idx, assigned.get('version')):
                             st.success("השיבוץ בוטל!")
-                            st.rerun()
+                            rerun_fragment()
                 else:
                     st.caption("🔒 רק מנהל יכול לבטל")
         
         st.markdown("---")
 
+def journal_notices():
+    """Warn this session about its journaled writes the sheet turned down (the day had changed there)"""
+    pending = st.session_state.get('pending_writes')
+    if pending:
+        try:
+            entries = write_journal().journal.entries(pending)
+        except Exception:
+            # Checked again on the next run
+            entries = {}
+        for entry_id, entry in entries.items():
+            if entry['status'] == PENDING:
+                continue
+            label = pending.pop(entry_id)
+            if entry['status'] == REJECTED:
+                holder = entry['current']['person_name'] if entry['current'] else "ריק"
+                st.session_state.setdefault('rejected_writes', []).append(f"{label} (בגיליון עכשיו: {holder})")
+    
+    rejected = st.session_state.get('rejected_writes')
+    if rejected:
+        for notice in rejected:
+            st.warning(f"⚠️ השיבוץ לא נשמר - היום השתנה בגיליון בינתיים: {notice}")
+        if st.button("✔️ הבנתי", key="dismiss_rejected_writes"):
+            del st.session_state.rejected_writes
+            rerun_fragment()
+
 # ===========================
 # Main App
 # ===========================
 
 def main():
+    tenant = current_tenant()
     st.set_page_config(
-        page_title="מי מבלה עם זוהר היום?",
+        page_title=tenant.title if tenant else "לוח שיבוצים",
         page_icon="👶",
         layout="wide"
     )
     
-    st.title("👶 מי מבלה עם זוהר היום?")
+    if tenant is None:
+        st.error(f"⚠️ לוח לא נמצא: {st.query_params.get('tenant')}")
+        return
+    
+    st.title(f"👶 {tenant.title}")
+    # Started after the title, so the first paint doesn't wait for it
+    warm_up()
+    reminder_schedulers()
+    calendar_server()
     
-    # Sidebar navigation
-    page = st.sidebar.radio("ניווט:", ["📅 לוח שבועי", "⚙️ הגדרות מנהל"])
+    # Admin login and the week being viewed belong to one tenant
+    if st.session_state.get('tenant', tenant.id) != tenant.id:
+        for key in ('admin_authenticated', 'current_week_offset', 'autoschedule_plan', 'schedule_export',
+                    'pending_writes', 'rejected_writes'):
+            st.session_state.pop(key, None)
+    st.session_state.tenant = tenant.id
     
-    if page == "📅 לוח שבועי":
-        schedule_view()
-    else:
-        admin_settings()
+    # Attribute external calls made during this rerun to this session
+    if 'metrics_session' not in st.session_state:
+        st.session_state.metrics_session = uuid.uuid4().hex
+    
+    with metrics_recorder().rerun(st.session_state.metrics_session):
+        if isinstance(get_storage(), JournaledStorage):
+            # Polls while this session has writes waiting in the journal
+            st.fragment(journal_notices, run_every=JOURNAL_NOTICE_SECONDS)()
+        
+        # Sidebar navigation
+        page = st.sidebar.radio("ניווט:", ["📅 לוח שבועי", "⚙️ הגדרות מנהל"])
+        
+        if page == "📅 לוח שבועי":
+            schedule_view()
+        else:
+            admin_settings()
 
 if __name__ == "__main__":
     main()
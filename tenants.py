@@ -0,0 +1,83 @@
+"""Schedules hosted by one deployment - one per child or family
+
+Each tenant has its own spreadsheet, webhooks, admin password and message
+texts, configured as a table under `[tenants]` in secrets.toml and picked
+with `?tenant=<id>` in the URL:
+
+    [tenants.zohar]
+    child_name = "זוהר"
+    sheet_id = "..."
+    make_webhook_url = "..."
+    admin_password = "..."
+
+Keys a tenant doesn't set fall back to the top-level ones, so shared
+settings (the service account, a common webhook) are written once. A
+deployment without `[tenants]` is a single tenant, "default", configured by
+the top-level keys exactly as before.
+"""
+import os
+
+DEFAULT_TENANT = "default"
+
+DEFAULT_CHILD_NAME = "זוהר"
+DEFAULT_REMINDER_TEMPLATE = ("היי {name}!\nרק תזכורת קטנה לפני הבילוי עם {child} ביום {day_name}, {date}.\n"
+                             "{child} כבר מתרגש!\nתודה רבה!")
+
+
+def _tenant_path(path, tenant_id):
+    """journal.sqlite3 -> journal-<tenant>.sqlite3, so tenants don't share local files"""
+    if not path or tenant_id == DEFAULT_TENANT:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{tenant_id}{ext}"
+
+
+class Tenant:
+    """One schedule's settings"""
+
+    def __init__(self, tenant_id, settings, fallback=None, multi=False):
+        fallback = fallback or {}
+
+        def get(key, default=''):
+            return settings.get(key, fallback.get(key, default))
+
+        self.id = tenant_id
+        self.child_name = get("child_name", DEFAULT_CHILD_NAME)
+        self.sheet_id = get("sheet_id", None)
+        self.make_webhook_url = get("make_webhook_url")
+        self.make_webhook_url_person = get("make_webhook_url_person")
+        app_url = fallback.get("app_url", "https://your-app.streamlit.app")
+        self.app_url = settings.get("app_url", f"{app_url}?tenant={tenant_id}" if multi else app_url)
+        self.admin_password = get("admin_password", "1234")
+        self.reminder_template = get("reminder_template", DEFAULT_REMINDER_TEMPLATE)
+        self.phone_country_code = str(get("phone_country_code", "972"))
+        # Batched reminders: one webhook call per period, optionally every day at reminders_send_at
+        # ("HH:MM", empty = off) for the day reminders_days_ahead days later
+        self.make_webhook_url_reminders = get("make_webhook_url_reminders")
+        self.reminders_send_at = get("reminders_send_at")
+        self.reminders_days_ahead = int(get("reminders_days_ahead", 1))
+        # Local files default to one per tenant; the write journal is off unless write_journal_path is set
+        self.sqlite_path = settings.get("sqlite_path", _tenant_path(fallback.get("sqlite_path", "scheduler.sqlite3"),
+                                                                    tenant_id))
+        self.write_journal_path = settings.get("write_journal_path",
+                                               _tenant_path(fallback.get("write_journal_path", ""),
+                                                            tenant_id))
+        self.stats_path = settings.get("stats_path", _tenant_path(fallback.get("stats_path", "stats.sqlite3"),
+                                                                  tenant_id))
+
+    @property
+    def title(self):
+        return f"מי מבלה עם {self.child_name} היום?"
+
+    def reminder(self, name, day_name, date):
+        """The WhatsApp reminder text for one assignment"""
+        return self.reminder_template.format(name=name, child=self.child_name, day_name=day_name, date=date)
+
+
+def load_tenants(secrets):
+    """{tenant_id: Tenant} from the app's secrets, in the order they are configured"""
+    tables = secrets.get("tenants")
+    if not tables:
+        return {DEFAULT_TENANT: Tenant(DEFAULT_TENANT, secrets)}
+    return {str(tenant_id): Tenant(str(tenant_id), settings, fallback=secrets, multi=True)
+            for tenant_id, settings in tables.items()}
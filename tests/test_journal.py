@@ -0,0 +1,87 @@
+"""Journaled writes are checked against the sheet before they are acknowledged"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+import fake_sheets  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from journal import APPLIED, JournaledStorage, JournalSyncer, WriteJournal  # noqa: E402
+from storage import SheetsConnection, SheetsStorage, SlotConflictError  # noqa: E402
+
+WEEK = "2026-10-11"
+
+
+def _storage(spreadsheet):
+    return SheetsStorage(SheetsConnection(lambda: (None, spreadsheet)), TTLCache())
+
+
+def test_day_taken_behind_a_stale_cache_is_refused_at_once(tmp_path):
+    spreadsheet = fake_sheets.empty_spreadsheet()
+    backend = _storage(spreadsheet)
+    storage = JournaledStorage(backend, WriteJournal(str(tmp_path / "journal.sqlite3")))
+    # Cached while the day was still free
+    assert storage.load_schedule(WEEK) == {}
+
+    # Another process books it straight in the sheet
+    _storage(spreadsheet).save_assignment(WEEK, 0, "Dana", "050-1234567", expected_version=0)
+
+    with pytest.raises(SlotConflictError) as raised:
+        storage.save_assignment(WEEK, 0, "Eli", "050-7654321", expected_version=0)
+    assert raised.value.current['person_name'] == "Dana"
+    assert storage.journal.pending() == []
+
+
+def test_acknowledged_write_is_applied_and_reported(tmp_path):
+    spreadsheet = fake_sheets.empty_spreadsheet()
+    backend = _storage(spreadsheet)
+    journal = WriteJournal(str(tmp_path / "journal.sqlite3"))
+    storage = JournaledStorage(backend, journal)
+    applied = []
+    syncer = JournalSyncer(journal, backend, on_applied=lambda entry, result: applied.append(entry['id']))
+
+    assignment = storage.save_assignment(WEEK, 1, "Eli", "050-7654321", expected_version=0)
+    syncer.drain_once()
+
+    assert applied == [-assignment['version']]
+    assert journal.entries(applied)[applied[0]]['status'] == APPLIED
+    assert _storage(spreadsheet).load_slot(WEEK, 1)['person_name'] == "Eli"
+    # A clear aimed at the version the user saw while it was pending still matches after the replay
+    storage.clear_assignment(WEEK, 1, expected_version=assignment['version'])
+    syncer.drain_once()
+    assert _storage(spreadsheet).load_slot(WEEK, 1) is None
+
+
+class _Unreachable:
+    """A backend whose every call fails, like Sheets during an outage"""
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            raise ConnectionError("sheet unreachable")
+        return call
+
+
+def test_writes_are_journaled_when_the_backend_check_fails(tmp_path):
+    storage = JournaledStorage(_Unreachable(), WriteJournal(str(tmp_path / "journal.sqlite3")))
+
+    assignment = storage.save_assignment(WEEK, 0, "Dana", "050-1234567", expected_version=0)
+    saved, taken = storage.fill_slots([{'week_start': WEEK, 'day_index': 1, 'person_name': "Eli",
+                                        'person_phone': "050-7654321", 'person_email': ''}])
+
+    assert assignment['version'] < 0
+    assert [entry['day_index'] for entry in saved] == [1] and taken == []
+    assert [(entry['day_index'], entry['person_name']) for entry in storage.journal.pending()] == [
+        (0, "Dana"), (1, "Eli")]
+
+
+def test_a_slow_backend_check_does_not_hold_the_write_up(tmp_path):
+    spreadsheet = fake_sheets.empty_spreadsheet(latency=1.0)
+    storage = JournaledStorage(_storage(spreadsheet), WriteJournal(str(tmp_path / "journal.sqlite3")),
+                               check_timeout=0.1)
+    started = time.monotonic()
+    storage.save_assignment(WEEK, 0, "Dana", "050-1234567", expected_version=0)
+    assert time.monotonic() - started < 0.5
+    assert len(storage.journal.pending()) == 1
@@ -0,0 +1,29 @@
+"""A bad reminders_send_at turns scheduled reminders off for that tenant instead of failing the app"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from reminders import parse_send_time  # noqa: E402
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+
+def test_send_time_must_be_hh_mm():
+    assert parse_send_time("18:30") == (18, 30)
+    assert parse_send_time("") is None
+    with pytest.raises(ValueError, match="reminders_send_at"):
+        parse_send_time("8pm")
+
+
+def test_app_runs_with_a_bad_send_time(tmp_path):
+    at = AppTest.from_file(APP, default_timeout=30)
+    at.secrets['storage_backend'] = 'memory'
+    at.secrets['outbox_path'] = str(tmp_path / "outbox.sqlite3")
+    at.secrets['make_webhook_url_reminders'] = 'http://127.0.0.1:9/hook'
+    at.secrets['reminders_send_at'] = '8pm'
+    at.run()
+    assert not at.exception
@@ -0,0 +1,171 @@
+"""Concurrent first bookings of one week must leave a single, complete ScheduleIndex row"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_sheets  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from storage import SheetsConnection, SheetsStorage, SlotConflictError  # noqa: E402
+
+WEEK = "2026-10-11"
+
+
+def _storage(spreadsheet):
+    return SheetsStorage(SheetsConnection(lambda: (None, spreadsheet)), TTLCache())
+
+
+def _book_concurrently(storage, days):
+    """Book every day at once from its own thread; returns the errors raised"""
+    barrier = threading.Barrier(len(days))
+    errors = []
+
+    def book(day_index):
+        barrier.wait()
+        try:
+            storage.save_assignment(WEEK, day_index, f"Person {day_index}", "050-0000000", expected_version=0)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=book, args=(day_index,)) for day_index in days]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_concurrent_first_bookings_share_one_index_row():
+    # Latency widens the read-modify-write window the way real Sheets round trips do
+    spreadsheet = fake_sheets.empty_spreadsheet(latency=0.01)
+    storage = _storage(spreadsheet)
+    storage.load_week_index()
+
+    assert _book_concurrently(storage, range(6)) == []
+
+    index_rows = [row for row in spreadsheet.worksheet("ScheduleIndex").get_all_values()[1:] if row[0] == WEEK]
+    assert len(index_rows) == 1
+    assert sorted(int(slot.split(':')[0]) for slot in index_rows[0][1].split(',')) == list(range(6))
+
+    # A process starting now sees every booked day, so none of them can be booked again
+    fresh = _storage(spreadsheet)
+    assert sorted(fresh.load_schedule(WEEK)) == list(range(6))
+    for day_index in range(6):
+        try:
+            fresh.save_assignment(WEEK, day_index, "Late", "050-1111111", expected_version=0)
+        except SlotConflictError:
+            continue
+        raise AssertionError(f"day {day_index} was booked twice")
+
+
+def test_index_rows_left_duplicated_are_merged_on_read():
+    spreadsheet = fake_sheets.empty_spreadsheet()
+    storage = _storage(spreadsheet)
+    storage.save_assignment(WEEK, 0, "Dana", "050-1234567", expected_version=0)
+    storage.save_assignment(WEEK, 1, "Eli", "050-7654321", expected_version=0)
+    # What concurrent writers used to leave behind: one row per day
+    spreadsheet.worksheet("ScheduleIndex").update(range_name="A2", values=[[WEEK, "0:2"], [WEEK, "1:3"]])
+
+    assert sorted(_storage(spreadsheet).load_schedule(WEEK)) == [0, 1]
+
+
+def test_first_bookings_from_separate_processes_share_one_index_row():
+    spreadsheet = fake_sheets.empty_spreadsheet()
+    # Two processes, each with its own cache, both holding the index from before the week was booked
+    first, second = _storage(spreadsheet), _storage(spreadsheet)
+    first.save_assignment("2026-10-25", 0, "Later week", "050-2222222", expected_version=0)
+    first.load_week_index(), second.load_week_index()
+
+    first.save_assignment(WEEK, 0, "Dana", "050-1234567", expected_version=0)
+    second.save_assignment(WEEK, 1, "Eli", "050-7654321", expected_version=0)
+    try:
+        second.save_assignment(WEEK, 0, "Late", "050-1111111", expected_version=0)
+        raise AssertionError("day 0 was booked twice")
+    except SlotConflictError:
+        pass
+
+    index_rows = [row for row in spreadsheet.worksheet("ScheduleIndex").get_all_values()[1:] if row[0] == WEEK]
+    assert len(index_rows) == 1
+    assert sorted(_storage(spreadsheet).load_schedule(WEEK)) == [0, 1]
+
+    # After the tab is rewritten (rows reordered) the next booking still finds the week's row
+    first.rebuild_week_index()
+    second.save_assignment(WEEK, 2, "Gil", "050-3333333", expected_version=0)
+    assert sorted(_storage(spreadsheet).load_schedule(WEEK)) == [0, 1, 2]
+    assert len([row for row in spreadsheet.worksheet("ScheduleIndex").get_all_values()[1:] if row[0] == WEEK]) == 1
+
+
+def _unversioned_spreadsheet():
+    """A sheet from before version stamps: no "version" header in F1"""
+    spreadsheet = fake_sheets.empty_spreadsheet()
+    schedule = spreadsheet.worksheet("Schedule")
+    schedule._rows = [['week_start', 'day_index', 'person_name', 'person_phone', 'person_email'],
+                      [WEEK, '0', 'Dana', '050-1234567', '']]
+    spreadsheet.worksheet("ScheduleIndex")._rows.append([WEEK, '0:2'])
+    return spreadsheet
+
+
+def test_build_index_adds_the_version_column():
+    spreadsheet = _unversioned_spreadsheet()
+    _storage(spreadsheet).create_week_index()
+
+    assert spreadsheet.worksheet("Schedule").row_values(1)[5] == 'version'
+    # Rows written before the column existed count as version 1
+    assert _storage(spreadsheet).load_slot(WEEK, 0)['version'] == 1
+
+
+def test_first_write_adds_the_version_column_and_clears_check_it():
+    spreadsheet = _unversioned_spreadsheet()
+    storage = _storage(spreadsheet)
+    seen = storage.save_assignment(WEEK, 1, "Eli", "050-7654321", expected_version=0)
+    assert spreadsheet.worksheet("Schedule").row_values(1)[5] == 'version'
+    assert seen['version'] == 1
+
+    # Cleared and booked again by someone else after we read it: our clear must not go through
+    other = _storage(spreadsheet)
+    other.clear_assignment(WEEK, 1, expected_version=1)
+    other.save_assignment(WEEK, 1, "Gil", "050-3333333", expected_version=0)
+    try:
+        storage.clear_assignment(WEEK, 1, expected_version=seen['version'])
+        raise AssertionError("a stale clear went through")
+    except SlotConflictError:
+        pass
+    assert _storage(spreadsheet).load_slot(WEEK, 1)['person_name'] == "Gil"
+
+
+def test_archive_retried_after_a_failed_rewrite_copies_each_slot_once():
+    spreadsheet = fake_sheets.empty_spreadsheet()
+    storage = _storage(spreadsheet)
+    old_week = "2025-12-28"
+    storage.save_assignment(old_week, 0, "Dana", "050-1234567", expected_version=0)
+    storage.save_assignment(old_week, 1, "Eli", "050-7654321", expected_version=0)
+    storage.save_assignment(WEEK, 0, "Gil", "050-3333333", expected_version=0)
+
+    # The live tab rewrite fails once, after the old week was copied to its archive tab
+    schedule = spreadsheet.worksheet("Schedule")
+    update = schedule.update
+    failures = []
+
+    def failing_update(values=None, range_name=None, **kwargs):
+        if range_name == "A1" and not failures:
+            failures.append(range_name)
+            raise RuntimeError("rewrite failed")
+        return update(values=values, range_name=range_name, **kwargs)
+    schedule.update = failing_update
+
+    try:
+        storage.archive(WEEK)
+        raise AssertionError("the failed rewrite wasn't reported")
+    except RuntimeError:
+        pass
+    # Meanwhile the old week changed in the live tab, which is still where it's read from
+    storage.save_assignment(old_week, 1, "Noa", "050-5555555", expected_version=1)
+    assert storage.archive(WEEK) == (2, 0)
+
+    archived = spreadsheet.worksheet("Schedule_2025").get_all_values()[1:]
+    assert sorted((row[1], row[2]) for row in archived) == [('0', "Dana"), ('1', "Noa")]
+    assert [row[0] for row in schedule.get_all_values()[1:] if row[0]] == [WEEK]
+    fresh = _storage(spreadsheet)
+    assert {day: slot['person_name'] for day, slot in fresh.load_schedule(old_week).items()} == {0: "Dana", 1: "Noa"}
+    assert fresh.load_schedule(WEEK)[0]['person_name'] == "Gil"
@@ -0,0 +1,49 @@
+"""Pickup statistics count every day of the week and refuse days outside it"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from stats import StatsStore  # noqa: E402
+
+WEEK = "2026-10-11"
+
+
+def test_saturday_is_counted(tmp_path):
+    stats = StatsStore(str(tmp_path / "stats.sqlite3"))
+    stats.record(WEEK, 6, "Dana")
+    stats.record(WEEK, 0, "Dana")
+
+    dana, = stats.people()
+    assert dana['total'] == 2
+    assert dana['days'] == [1, 0, 0, 0, 0, 0, 1]
+
+    stats.rebuild([{'week_start': WEEK, 'day_index': 6, 'person_name': "Dana"}])
+    assert stats.people()[0]['days'] == [0, 0, 0, 0, 0, 0, 1]
+
+
+def test_day_outside_the_week_is_refused(tmp_path):
+    stats = StatsStore(str(tmp_path / "stats.sqlite3"))
+    with pytest.raises(ValueError, match="outside the week"):
+        stats.record(WEEK, 7, "Dana")
+    with pytest.raises(ValueError, match="outside the week"):
+        stats.rebuild([{'week_start': WEEK, 'day_index': -1, 'person_name': "Dana"}])
+    assert stats.people() == []
+
+
+def test_store_without_a_saturday_column_is_upgraded_and_rebuilt(tmp_path):
+    path = str(tmp_path / "stats.sqlite3")
+    StatsStore(path).rebuild([{'week_start': WEEK, 'day_index': 0, 'person_name': "Dana"}])
+    # As created before Saturday had a column
+    db = sqlite3.connect(path)
+    with db:
+        db.execute("ALTER TABLE people DROP COLUMN day_6")
+    db.close()
+
+    stats = StatsStore(path)
+    assert stats.built_at() is None
+    stats.record(WEEK, 6, "Dana")
+    assert stats.people()[0]['days'] == [1, 0, 0, 0, 0, 0, 1]